@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Alert State
+Deduplicates health alerts with a state machine per plant and alert type
+(and metric, for issues that name one, like SENSOR_FAULT), so a plant that
+stays dry raises one WATER_NEEDED alert instead of one per reading.
+
+  clear --issue--> pending --raise_after readings--> active --clear_after readings without--> clear
+
+An alert is emitted when it becomes active (state 'raised'), every
+reminder interval while it stays active ('reminder') and when it clears
+('resolved', only if its raise was emitted). Two raise or reminder alerts
+of a plant and type are at least the cooldown apart: one that falls
+inside it is held back and emitted by the first reading after the
+cooldown if the alert is still active, so a flapping sensor cannot
+re-raise on every flap. Everything else is suppressed and counted.
+Emitted alerts carry 'state' and, when raised or reminded, 'occurrences':
+the readings with the issue since the previous emission or clear.
+
+update() counts an alert as emitted as soon as it returns it, so that
+later readings of the plant are decided against it. A caller that then
+fails to store or publish the alert (a failed write, a rejected or
+dead-lettered reading) hands it to rollback(), which undoes the emission:
+the next reading emits it again.
+
+  ALERT_DEDUP_ENABLED       true (default) | false - an alert per issue per reading
+  ALERT_RAISE_AFTER         readings with the issue before raising (default 1)
+  ALERT_CLEAR_AFTER         readings without it before clearing (default 3)
+  ALERT_COOLDOWN_SECONDS    minimum time between raise/reminder alerts (default 300)
+  ALERT_REMINDER_SECONDS    reminder interval while active (default 3600, 0 disables)
+  ALERT_EMIT_RESOLVED       emit 'resolved' alerts (default true)
+  ALERT_STATE_MAX_PLANTS    plants tracked, least recently seen evicted (default 10000)
+
+State is in memory: a restart, or an evicted plant, raises its active
+alerts again.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RAISED = 'raised'
+REMINDER = 'reminder'
+RESOLVED = 'resolved'
+
+_CLEAR = 0
+_PENDING = 1
+_ACTIVE = 2
+
+
+class _AlertState:
+    """One alert type of one plant"""
+
+    __slots__ = ('status', 'seen', 'absent', 'occurrences', 'last_emitted', 'announced', 'issue', 'undo')
+
+    def __init__(self):
+        self.status = _CLEAR
+        # Consecutive readings with (seen) and without (absent) the issue
+        self.seen = 0
+        self.absent = 0
+        # Readings with the issue since the last emission
+        self.occurrences = 0
+        self.last_emitted = None
+        # Whether this activation's raise has been emitted
+        self.announced = False
+        self.issue = None
+        # (announced, last_emitted) before the latest raise/reminder, for rollback()
+        self.undo = None
+
+
+class AlertTracker:
+    """Alert state per plant and alert type; update() returns the alerts to emit"""
+
+    def __init__(self, raise_after=1, clear_after=3, cooldown=300, reminder_interval=3600,
+                 emit_resolved=True, max_plants=10000, metrics=None, clock=time.monotonic):
+        if raise_after < 1 or clear_after < 1:
+            raise ValueError(f"ALERT_RAISE_AFTER and ALERT_CLEAR_AFTER must be at least 1, "
+                             f"got {raise_after} and {clear_after}")
+        if max_plants < 1:
+            raise ValueError(f"ALERT_STATE_MAX_PLANTS must be positive, got {max_plants}")
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.cooldown = cooldown
+        self.reminder_interval = reminder_interval
+        self.emit_resolved = emit_resolved
+        self.max_plants = max_plants
+        self.metrics = metrics
+        self.clock = clock
+        self._lock = threading.Lock()
+        # plant ID -> {(alert type, metric): _AlertState}, least recently seen first
+        self._plants = OrderedDict()
+        self._active = 0
+
+    @classmethod
+    def from_env(cls, metrics=None):
+        """None when ALERT_DEDUP_ENABLED=false"""
+        if os.getenv('ALERT_DEDUP_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            raise_after=int(os.getenv('ALERT_RAISE_AFTER', '1')),
+            clear_after=int(os.getenv('ALERT_CLEAR_AFTER', '3')),
+            cooldown=float(os.getenv('ALERT_COOLDOWN_SECONDS', '300')),
+            reminder_interval=float(os.getenv('ALERT_REMINDER_SECONDS', '3600')),
+            emit_resolved=os.getenv('ALERT_EMIT_RESOLVED', 'true').lower() == 'true',
+            max_plants=int(os.getenv('ALERT_STATE_MAX_PLANTS', '10000')),
+            metrics=metrics
+        )
+
+    def update(self, plant_id, issues):
+        """
+        Advance a plant's alert states by one reading's issues ({'type',
+        'severity', 'message'} dicts); returns the alerts to emit, as issue
+        dicts with 'state' (and 'occurrences') added.
+        """
+        now = self.clock()
+        emitted = []
+        suppressed = []
+        with self._lock:
+            states = self._plants.get(plant_id)
+            if states is None:
+                states = self._plants[plant_id] = {}
+                if len(self._plants) > self.max_plants:
+                    _, evicted = self._plants.popitem(last=False)
+                    self._active -= sum(state.status == _ACTIVE for state in evicted.values())
+                    if self.metrics:
+                        self.metrics.inc('alert_state_evictions_total')
+            else:
+                self._plants.move_to_end(plant_id)
+            active = self._active
+
+            present = set()
+            for issue in issues:
+                key = (issue.get('type'), issue.get('metric'))
+                if key in present:
+                    continue
+                present.add(key)
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = _AlertState()
+                state.issue = issue
+                state.absent = 0
+                if state.status != _ACTIVE:
+                    state.seen += 1
+                    if state.seen < self.raise_after:
+                        state.status = _PENDING
+                        suppressed.append(key[0])
+                        continue
+                    state.status = _ACTIVE
+                    state.announced = False
+                    self._active += 1
+                state.occurrences += 1
+                if not state.announced:
+                    kind = RAISED if self._cooled_down(state, now) else None
+                elif self.reminder_interval > 0 and now - state.last_emitted >= self.reminder_interval:
+                    kind = REMINDER if self._cooled_down(state, now) else None
+                else:
+                    kind = None
+                if kind is None:
+                    suppressed.append(key[0])
+                    continue
+                emitted.append({**issue, 'state': kind, 'occurrences': state.occurrences})
+                state.undo = (state.announced, state.last_emitted)
+                state.announced = True
+                state.last_emitted = now
+                state.occurrences = 0
+
+            for key in [key for key in states if key not in present]:
+                state = states[key]
+                state.seen = 0
+                if state.status == _ACTIVE:
+                    state.absent += 1
+                    if state.absent < self.clear_after:
+                        continue
+                    self._active -= 1
+                    if state.announced and self.emit_resolved:
+                        resolved = {
+                            'type': key[0],
+                            'severity': state.issue.get('severity'),
+                            'message': f"Resolved: {state.issue.get('message')}",
+                            'state': RESOLVED
+                        }
+                        if key[1] is not None:
+                            resolved['metric'] = key[1]
+                        emitted.append(resolved)
+                state.status = _CLEAR
+                state.occurrences = 0
+                state.announced = False
+                state.undo = None
+                # A cleared state is kept only while it still holds a cooldown
+                if state.last_emitted is None or self._cooled_down(state, now):
+                    del states[key]
+            changed = self._active != active
+            active = self._active
+
+        if self.metrics:
+            for alert in emitted:
+                self.metrics.inc('alerts_emitted_total', state=alert['state'])
+            for alert_type in suppressed:
+                self.metrics.inc('alerts_suppressed_total', type=alert_type)
+            if changed:
+                self.metrics.set_gauge('alerts_active', active)
+        return emitted
+
+    def rollback(self, plant_id, alerts):
+        """
+        Undo the emission of alerts (from update()) that were not stored or
+        published, so the plant's next reading emits them again.
+        """
+        if not alerts:
+            return
+        now = self.clock()
+        with self._lock:
+            states = self._plants.get(plant_id)
+            if states is None:
+                # Evicted meanwhile - its active alerts are raised again anyway
+                return
+            active = self._active
+            for alert in alerts:
+                key = (alert.get('type'), alert.get('metric'))
+                state = states.get(key)
+                if alert.get('state') != RESOLVED:
+                    if state is None or state.undo is None:
+                        continue
+                    state.announced, state.last_emitted = state.undo
+                    state.undo = None
+                    state.occurrences += alert.get('occurrences') or 0
+                    continue
+                if state is not None and state.status != _CLEAR:
+                    # The issue is back - there is nothing left to resolve
+                    continue
+                # Active again, one reading short of clearing, so the next reading without it resolves it
+                if state is None:
+                    state = states[key] = _AlertState()
+                    state.last_emitted = now
+                state.status = _ACTIVE
+                state.announced = True
+                state.absent = self.clear_after - 1
+                state.issue = {
+                    'type': key[0],
+                    'severity': alert.get('severity'),
+                    'message': alert.get('message', '').replace('Resolved: ', '', 1)
+                }
+                self._active += 1
+            changed = self._active != active
+            active = self._active
+
+        if self.metrics:
+            for alert in alerts:
+                self.metrics.inc('alerts_rolled_back_total', state=alert.get('state'))
+            if changed:
+                self.metrics.set_gauge('alerts_active', active)
+
+    def _cooled_down(self, state, now):
+        return state.last_emitted is None or now - state.last_emitted >= self.cooldown
+
+    def active(self, plant_id=None):
+        """{plant ID: [active (alert type, metric)]}, of one plant or all"""
+        with self._lock:
+            plants = [plant_id] if plant_id is not None else list(self._plants)
+            return {
+                plant: [key for key, state in self._plants.get(plant, {}).items() if state.status == _ACTIVE]
+                for plant in plants
+            }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Sensor Anomaly Detection
+Flags faulty sensors per plant and metric from the stream of readings, as
+SENSOR_FAULT issues that go out through the normal alert path (and its
+deduplication - one alert per plant, metric and fault episode).
+
+  range     value outside what the sensor can physically report
+  spike     jump from the previous reading larger than ANOMALY_SPIKE_THRESHOLD
+            times the typical reading-to-reading change
+  zscore    value more than ANOMALY_Z_THRESHOLD standard deviations from the
+            recent mean
+  flatline  the exact same value for ANOMALY_FLATLINE_READINGS readings in a row
+            (a stuck sensor - real sensors are noisy)
+
+The recent mean, variance and typical change are exponentially weighted
+(ANOMALY_ALPHA, about 2/alpha readings of memory), so each reading costs a
+handful of float operations per metric and no history is kept: about
+200 bytes per plant and metric. Spike and z-score checks start after
+ANOMALY_WARMUP_READINGS readings, and the standard deviations have a
+per-metric floor so a very steady sensor does not flag ordinary noise.
+A reading outside the range is not folded into the statistics.
+
+Light is not checked by default: it swings by design (day/night, lamps).
+
+  ANOMALY_DETECTION_ENABLED    true (default) | false
+  ANOMALY_METRICS              default moisture,temperature,humidity
+  ANOMALY_ALPHA                default 0.05
+  ANOMALY_WARMUP_READINGS      default 20
+  ANOMALY_Z_THRESHOLD          default 4
+  ANOMALY_SPIKE_THRESHOLD      default 6
+  ANOMALY_FLATLINE_READINGS    default 120 (an hour at the sensors' 30 s interval)
+  ANOMALY_MAX_PLANTS           default 10000, least recently seen evicted
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+
+FAULT_TYPE = 'SENSOR_FAULT'
+
+# metric -> (sensors field, label, plausible low, high, standard deviation floor)
+SENSOR_SPECS = {
+    'moisture': ('soilMoisture', 'Soil moisture', 0, 100, 1.0),
+    'light': ('lightLevel', 'Light level', 0, 200000, 50.0),
+    'temperature': ('temperature', 'Temperature', -40, 85, 0.5),
+    'humidity': ('humidity', 'Humidity', 0, 100, 2.0)
+}
+DEFAULT_METRICS = ('moisture', 'temperature', 'humidity')
+
+
+class _SensorState:
+    """Exponentially weighted statistics of one metric of one plant"""
+
+    __slots__ = ('count', 'mean', 'var', 'delta_var', 'last', 'flat')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        # Mean square of the reading-to-reading change
+        self.delta_var = 0.0
+        self.last = None
+        # Consecutive readings equal to the previous one
+        self.flat = 0
+
+
+class SensorAnomalyDetector:
+    """Per-plant, per-metric sensor fault detection; check() returns SENSOR_FAULT issues"""
+
+    def __init__(self, tracked=DEFAULT_METRICS, alpha=0.05, warmup=20, z_threshold=4.0, spike_threshold=6.0,
+                 flatline_readings=120, max_plants=10000, metrics=None):
+        unknown = [name for name in tracked if name not in SENSOR_SPECS]
+        if unknown:
+            raise ValueError(f"Unknown anomaly detection metrics {unknown}; expected {sorted(SENSOR_SPECS)}")
+        if not 0 < alpha <= 1:
+            raise ValueError(f"ANOMALY_ALPHA must be in (0, 1], got {alpha}")
+        if max_plants < 1:
+            raise ValueError(f"ANOMALY_MAX_PLANTS must be positive, got {max_plants}")
+        self.tracked = tuple(tracked)
+        self.alpha = alpha
+        self.warmup = warmup
+        self.z_threshold = z_threshold
+        self.spike_threshold = spike_threshold
+        # 0 disables flat-line detection
+        self.flatline_readings = flatline_readings
+        self.max_plants = max_plants
+        self.metrics = metrics
+        # (name, field, label, low, high, variance floor) - deviations are compared squared, against variances
+        self._specs = []
+        for name in self.tracked:
+            field, label, low, high, floor = SENSOR_SPECS[name]
+            self._specs.append((name, field, label, low, high, floor * floor))
+        self._lock = threading.Lock()
+        # plant ID -> [_SensorState per tracked metric], least recently seen first
+        self._plants = OrderedDict()
+
+    @classmethod
+    def from_env(cls, metrics=None):
+        """None when ANOMALY_DETECTION_ENABLED=false"""
+        if os.getenv('ANOMALY_DETECTION_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            tracked=[name.strip() for name in
+                     os.getenv('ANOMALY_METRICS', ','.join(DEFAULT_METRICS)).split(',') if name.strip()],
+            alpha=float(os.getenv('ANOMALY_ALPHA', '0.05')),
+            warmup=int(os.getenv('ANOMALY_WARMUP_READINGS', '20')),
+            z_threshold=float(os.getenv('ANOMALY_Z_THRESHOLD', '4')),
+            spike_threshold=float(os.getenv('ANOMALY_SPIKE_THRESHOLD', '6')),
+            flatline_readings=int(os.getenv('ANOMALY_FLATLINE_READINGS', '120')),
+            max_plants=int(os.getenv('ANOMALY_MAX_PLANTS', '10000')),
+            metrics=metrics
+        )
+
+    def check(self, plant_id, reading):
+        """Fold a reading into its plant's statistics; returns its SENSOR_FAULT issues (usually none)"""
+        sensors = reading.get('sensors')
+        if not isinstance(plant_id, str) or not isinstance(sensors, dict):
+            return []
+        faults = []
+        alpha = self.alpha
+        spike_limit = self.spike_threshold * self.spike_threshold
+        z_limit = self.z_threshold * self.z_threshold
+        with self._lock:
+            states = self._plants.get(plant_id)
+            if states is None:
+                states = self._plants[plant_id] = [_SensorState() for _ in self._specs]
+                if len(self._plants) > self.max_plants:
+                    self._plants.popitem(last=False)
+            else:
+                self._plants.move_to_end(plant_id)
+
+            for state, (name, field, label, low, high, min_var) in zip(states, self._specs):
+                value = sensors.get(field)
+                if value.__class__ is not float and (value.__class__ is not int):
+                    continue
+                # Also catches NaN
+                if not low <= value <= high:
+                    faults.append(self._fault(name, 'range',
+                                              f'{label} sensor reported {value}, outside {low}-{high}'))
+                    continue
+                last = state.last
+                state.last = value
+                state.count += 1
+                if last is None:
+                    state.mean = value
+                    continue
+
+                delta = value - last
+                if state.count > self.warmup:
+                    if delta * delta > spike_limit * (state.delta_var if state.delta_var > min_var else min_var):
+                        faults.append(self._fault(name, 'spike', f'{label} jumped from {last} to {value}'))
+                    else:
+                        deviation = value - state.mean
+                        spread = state.var if state.var > min_var else min_var
+                        if deviation * deviation > z_limit * spread:
+                            faults.append(self._fault(
+                                name, 'zscore',
+                                f'{label} reading {value} is {abs(deviation) / math.sqrt(spread):.1f} standard '
+                                f'deviations from its recent mean {state.mean:.1f}'
+                            ))
+                if delta == 0:
+                    state.flat += 1
+                    if self.flatline_readings and state.flat + 1 >= self.flatline_readings:
+                        faults.append(self._fault(name, 'flatline',
+                                                  f'{label} sensor stuck at {value} for {state.flat + 1} readings'))
+                else:
+                    state.flat = 0
+
+                # Exponentially weighted mean and variance, and mean square change
+                difference = value - state.mean
+                increment = alpha * difference
+                state.mean += increment
+                state.var = (1 - alpha) * (state.var + difference * increment)
+                state.delta_var += alpha * (delta * delta - state.delta_var)
+
+        if faults and self.metrics:
+            for fault in faults:
+                self.metrics.inc('sensor_faults_total', metric=fault['metric'], fault=fault['fault'])
+        return faults
+
+    @staticmethod
+    def _fault(metric, kind, message):
+        return {'type': FAULT_TYPE, 'severity': 'MEDIUM', 'message': message, 'metric': metric, 'fault': kind}
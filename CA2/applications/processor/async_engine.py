@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Asyncio Processing Engine
+Runs the consume → analyze → store → publish stages concurrently on one
+event loop. kafka-python, pymongo and paho are blocking libraries, so their
+calls go through executors: a single thread owns the (non thread-safe)
+Kafka consumer, and an I/O pool runs MongoDB and MQTT calls.
+
+Readings of the same plant are chained so they are handled in order, while
+different plants proceed concurrently up to a bound on in-flight messages.
+At the bound the busy partitions are paused rather than the poll loop
+blocking, so the consumer keeps its group membership while the sinks catch up.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from kafka.structs import OffsetAndMetadata, TopicPartition
+from pymongo.errors import PyMongoError
+
+from backpressure import PartitionBackpressure
+from dead_letter import STAGE_PROCESS, STAGE_STORE
+from offsets import COMMIT_MODE_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class _PartitionProgress:
+    """Dispatched offsets of one partition, in order, and which of them are finished"""
+
+    def __init__(self):
+        self.dispatched = deque()
+        self.done = set()
+        self.failed_at = None
+        # (offset, callback) pairs waiting for their offset to be committed
+        self.deferred = []
+
+    def committable(self):
+        """Pop finished offsets from the head; returns the next offset to commit or None"""
+        advanced = None
+        while self.dispatched and self.dispatched[0] in self.done:
+            offset = self.dispatched.popleft()
+            self.done.discard(offset)
+            advanced = offset + 1
+        return advanced
+
+    def run_committed(self, committed):
+        """Run the callbacks of offsets below the committed one"""
+        ready = [fn for offset, fn in self.deferred if offset < committed]
+        self.deferred = [(offset, fn) for offset, fn in self.deferred if offset >= committed]
+        for fn in ready:
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Post-commit callback failed: {e}")
+
+    def discard_from(self, offset):
+        """Drop the callbacks of offsets that are about to be replayed"""
+        self.deferred = [(o, fn) for o, fn in self.deferred if o < offset]
+
+
+class AsyncProcessingEngine:
+    """Drive an async handler over a Kafka consumer with bounded concurrency"""
+
+    def __init__(self, consumer, handler, key_fn, max_in_flight=200, io_workers=16,
+                 commit_mode='auto', metrics=None, poll_timeout_ms=500, decoder=None,
+                 resume_ratio=0.5, lag_monitor=None, dead_letter=None):
+        self.consumer = consumer
+        self.handler = handler
+        self.key_fn = key_fn
+        self.decoder = decoder
+        self.lag_monitor = lag_monitor
+        self.dead_letter = dead_letter
+        self.max_in_flight = max_in_flight
+        self.commit_mode = commit_mode
+        self.metrics = metrics
+        self.poll_timeout_ms = poll_timeout_ms
+        self.consumer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kafka-consumer')
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='async-io')
+        self.backpressure = PartitionBackpressure(
+            consumer, max_in_flight, resume_ratio=resume_ratio, metrics=metrics, name='async'
+        )
+        self._loop = None
+        self._tails = {}
+        # Offset bookkeeping is only needed to commit by hand
+        self._progress = {} if commit_mode == COMMIT_MODE_BATCH else None
+        self._stopping = False
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run a blocking MongoDB/MQTT/Kafka-producer call on the I/O pool"""
+        return await self._loop.run_in_executor(self.io_executor, partial(fn, *args, **kwargs))
+
+    async def _consumer_call(self, fn, *args, **kwargs):
+        return await self._loop.run_in_executor(self.consumer_executor, partial(fn, *args, **kwargs))
+
+    def after_commit(self, message, fn):
+        """
+        Run fn once the message can no longer be replayed: after its offset is
+        committed with batch commits, right away otherwise. For side effects
+        that must not be repeated, like incrementing rollups.
+        """
+        if self._progress is None:
+            fn()
+            return
+        progress = self._progress[TopicPartition(message.topic, message.partition)]
+        progress.deferred.append((message.offset, fn))
+
+    def stop(self):
+        self._stopping = True
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        logger.info(f"Async engine started (max {self.max_in_flight} in flight, {self.commit_mode} commits)")
+        try:
+            while not self._stopping:
+                records = await self._consumer_call(
+                    self.consumer.poll, timeout_ms=self.backpressure.poll_timeout_ms(self.poll_timeout_ms)
+                )
+                if self.lag_monitor:
+                    await self._consumer_call(self.lag_monitor.maybe_update)
+                for messages in records.values():
+                    for message in messages:
+                        self._dispatch(message)
+                await self._checkpoint()
+                # Pausing busy partitions is what bounds memory and in-flight work
+                await self._consumer_call(self.backpressure.update)
+        finally:
+            await self._drain()
+            self.consumer_executor.shutdown(wait=True)
+            self.io_executor.shutdown(wait=True)
+
+    def _dispatch(self, raw_message):
+        tp = TopicPartition(raw_message.topic, raw_message.partition)
+        progress = None
+        if self._progress is not None:
+            progress = self._progress.setdefault(tp, _PartitionProgress())
+            progress.dispatched.append(raw_message.offset)
+
+        message = self.decoder(raw_message) if self.decoder else raw_message
+        if message is None:
+            # Undecodable - nothing to process, but its offset may be committed
+            if progress is not None:
+                progress.done.add(raw_message.offset)
+            return
+
+        key = self.key_fn(message)
+        previous = self._tails.get(key)
+        task = self._loop.create_task(self._process(message, tp, progress, previous))
+        self._tails[key] = task
+        self.backpressure.acquire(message)
+        task.add_done_callback(partial(self._finished, key, message))
+
+    async def _process(self, message, tp, progress, previous):
+        if previous is not None and not previous.done():
+            # Keep per-plant ordering: wait for this plant's previous reading
+            await asyncio.wait([previous])
+        started = time.monotonic()
+        try:
+            await self.handler(message, self)
+            status = 'success'
+        except PyMongoError as e:
+            status = 'store_failed'
+            logger.error(f"MongoDB write failed at {tp.topic}[{tp.partition}]@{message.offset}: {e}")
+            if self.commit_mode != COMMIT_MODE_BATCH:
+                # Without batch commits the record would be lost - keep it for a re-drive
+                if self.dead_letter:
+                    self.dead_letter.publish(message, e, STAGE_STORE)
+            elif progress.failed_at is None or message.offset < progress.failed_at:
+                progress.failed_at = message.offset
+        except Exception as e:
+            status = 'error'
+            logger.error(f"Error processing message: {e}")
+            if self.dead_letter:
+                self.dead_letter.publish(message, e, STAGE_PROCESS)
+        if progress is not None:
+            progress.done.add(message.offset)
+        if self.metrics:
+            self.metrics.inc('messages_processed_total', status=status)
+            self.metrics.observe('message_processing_seconds', time.monotonic() - started)
+
+    def _finished(self, key, message, task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        self.backpressure.release(message)
+
+    async def _checkpoint(self):
+        """Commit finished offsets and replay partitions whose MongoDB write failed"""
+        if self.commit_mode != COMMIT_MODE_BATCH:
+            return
+        offsets = {}
+        for tp, progress in self._progress.items():
+            if progress.failed_at is not None:
+                # Stop at the failure; once its in-flight records finish, seek back to it
+                if all(offset in progress.done for offset in progress.dispatched):
+                    failed_at = progress.failed_at
+                    progress.dispatched.clear()
+                    progress.done.clear()
+                    progress.failed_at = None
+                    progress.discard_from(failed_at)
+                    offsets[tp] = failed_at
+                    try:
+                        await self._consumer_call(self.consumer.seek, tp, failed_at)
+                        logger.warning(f"Replaying {tp.topic}[{tp.partition}] from offset {failed_at}")
+                    except AssertionError:
+                        # Revoked meanwhile - the new owner resumes from the committed offset
+                        offsets.pop(tp)
+                    await self._consumer_call(self.backpressure.unhold, tp)
+                else:
+                    await self._consumer_call(self.backpressure.hold, tp)
+                    while progress.dispatched and progress.dispatched[0] < progress.failed_at \
+                            and progress.dispatched[0] in progress.done:
+                        offset = progress.dispatched.popleft()
+                        progress.done.discard(offset)
+                        offsets[tp] = offset + 1
+                continue
+            committable = progress.committable()
+            if committable is not None:
+                offsets[tp] = committable
+        if offsets:
+            try:
+                if self.dead_letter:
+                    # Dead-lettered records must be durable before their offsets are committed
+                    await self.run_blocking(self.dead_letter.flush)
+                await self._consumer_call(
+                    self.consumer.commit,
+                    offsets={tp: OffsetAndMetadata(offset, None) for tp, offset in offsets.items()}
+                )
+                if self.metrics:
+                    self.metrics.inc('offset_commits_total', status='success')
+            except Exception as e:
+                if self.metrics:
+                    self.metrics.inc('offset_commits_total', status='failed')
+                logger.error(f"Offset commit failed: {e}")
+            else:
+                for tp, offset in offsets.items():
+                    self._progress[tp].run_committed(offset)
+
+    async def _drain(self, timeout=30):
+        """Let in-flight messages finish and commit what they covered"""
+        pending = [task for task in self._tails.values() if not task.done()]
+        if pending:
+            logger.info(f"Waiting for {self.backpressure.in_flight()} in-flight messages...")
+            await asyncio.wait(pending, timeout=timeout)
+        await self._checkpoint()
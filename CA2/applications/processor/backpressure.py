@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Partition Backpressure
+Bounds the number of records handed to the MongoDB/MQTT sinks but not yet
+finished. When the bound is reached the partitions that have records in
+flight are paused, so poll() keeps the consumer in its group without
+fetching more; they are resumed once the sinks drain below a low watermark.
+
+acquire()/release() may be called from any thread. update(), hold(),
+unhold() and drain() call pause()/resume() and must run on the thread that
+owns the (non thread-safe) Kafka consumer.
+"""
+
+import logging
+import threading
+
+from kafka.structs import TopicPartition
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionBackpressure:
+    """Pause partitions while too many of their records are in flight"""
+
+    def __init__(self, consumer, max_in_flight, resume_ratio=0.5, metrics=None, name='sink'):
+        self.consumer = consumer
+        self.max_in_flight = max(1, max_in_flight)
+        self.resume_at = int(self.max_in_flight * resume_ratio)
+        self.metrics = metrics
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._total = 0
+        # Paused because the sinks are saturated / held paused by the caller (e.g. for a replay)
+        self.paused = set()
+        self.held = set()
+        self._report(0)
+
+    def acquire(self, message):
+        """A record was handed to the sinks"""
+        tp = TopicPartition(message.topic, message.partition)
+        with self._lock:
+            self._in_flight[tp] = self._in_flight.get(tp, 0) + 1
+            self._total += 1
+
+    def release(self, message):
+        """The sinks finished with a record (successfully or not)"""
+        tp = TopicPartition(message.topic, message.partition)
+        with self._lock:
+            remaining = self._in_flight.get(tp, 0) - 1
+            if remaining > 0:
+                self._in_flight[tp] = remaining
+            else:
+                self._in_flight.pop(tp, None)
+            self._total -= 1
+
+    def in_flight(self):
+        return self._total
+
+    def saturated(self):
+        return self._total >= self.max_in_flight
+
+    def poll_timeout_ms(self, default_ms):
+        """Poll briefly while paused so a drained queue is noticed quickly"""
+        return min(default_ms, 100) if self.paused else default_ms
+
+    def update(self):
+        """Pause busy partitions when saturated, resume them once drained"""
+        with self._lock:
+            total = self._total
+            busy = [tp for tp, count in self._in_flight.items() if count]
+        if total >= self.max_in_flight:
+            # Re-pausing is harmless and covers partitions reassigned by a rebalance
+            newly_paused = self._pause(busy)
+            if newly_paused:
+                self.paused.update(newly_paused)
+                logger.warning(f"Sinks saturated ({total} records in flight) - "
+                               f"paused {len(newly_paused)} partition(s)")
+                self._count('partition_pauses_total', len(newly_paused))
+        elif total <= self.resume_at and self.paused:
+            resumed = self.paused - self.held
+            self._resume(resumed)
+            self.paused.clear()
+            logger.info(f"Sinks drained ({total} records in flight) - resumed {len(resumed)} partition(s)")
+            self._count('partition_resumes_total', len(resumed))
+        self._report(total)
+
+    def hold(self, tp):
+        """Keep a partition paused until unhold(), regardless of saturation"""
+        self.held.add(tp)
+        self._pause([tp])
+
+    def unhold(self, tp):
+        self.held.discard(tp)
+        if tp not in self.paused:
+            self._resume([tp])
+
+    def drain(self, on_records=None, poll_timeout_ms=100):
+        """
+        Wait until nothing is in flight while still calling poll(), so group
+        membership survives a slow sink. Every assigned partition is paused
+        meanwhile; records that still arrive (from partitions assigned by a
+        rebalance during the wait) are passed to on_records.
+        """
+        waiting = set(self.consumer.assignment()) - self.paused - self.held
+        self._pause(waiting)
+        try:
+            while self._total > 0:
+                records = self.consumer.poll(timeout_ms=poll_timeout_ms)
+                if records and on_records:
+                    on_records(records)
+                fresh = set(self.consumer.assignment()) - waiting - self.paused - self.held
+                if fresh:
+                    self._pause(fresh)
+                    waiting |= fresh
+                self._report(self._total)
+        finally:
+            self._resume(waiting)
+        self.update()
+
+    def _pause(self, partitions):
+        paused = []
+        for tp in partitions:
+            try:
+                self.consumer.pause(tp)
+                paused.append(tp)
+            except KeyError:
+                # No longer assigned to this consumer
+                pass
+        return [tp for tp in paused if tp not in self.paused]
+
+    def _resume(self, partitions):
+        for tp in partitions:
+            try:
+                self.consumer.resume(tp)
+            except KeyError:
+                pass
+
+    def _count(self, name, value):
+        if self.metrics:
+            self.metrics.inc(name, value, stage=self.name)
+
+    def _report(self, total):
+        if self.metrics:
+            self.metrics.set_gauge(f'{self.name}_in_flight', total)
+            self.metrics.set_gauge(f'{self.name}_saturation', round(total / self.max_in_flight, 3))
+            self.metrics.set_gauge('paused_partitions', len(self.paused | self.held), stage=self.name)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Codec Benchmark
+Compares the original json.loads/json.dumps lambdas with the codec.py
+backends on payloads shaped like sensor.js readings and processor alerts.
+
+Usage: python benchmarks/bench_codec.py [--messages 20000]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import codec  # noqa: E402
+
+PLANTS = [
+    ('plant-001', 'monstera', 'Living Room', 50, 600, 22, 50),
+    ('plant-002', 'sansevieria', 'Bedroom', 30, 300, 20, 40),
+    ('plant-003', 'pothos', 'Kitchen', 45, 500, 21, 55),
+    ('plant-004', 'fern', 'Bathroom', 60, 250, 20, 70),
+    ('plant-005', 'succulent', 'Office', 20, 700, 24, 30)
+]
+
+
+def sensor_payloads(count, seed=5287):
+    """Readings generated the same way sensor.js does (daily cycle plus noise)"""
+    rng = random.Random(seed)
+    start = datetime(2025, 10, 1)
+    payloads = []
+    for i in range(count):
+        plant_id, plant_type, location, moisture, light, temp, humidity = PLANTS[i % len(PLANTS)]
+        now = start + timedelta(seconds=i)
+        hour = now.hour
+        reading = {
+            'timestamp': now.isoformat(timespec='milliseconds') + 'Z',
+            'plantId': plant_id,
+            'location': location,
+            'plantType': plant_type,
+            'sensors': {
+                'soilMoisture': max(0, min(100, moisture + math.sin(hour / 24 * 2 * math.pi) * 5 + (rng.random() - 0.5) * 10)),
+                'lightLevel': max(0, math.sin((hour - 6) / 12 * math.pi) * light) + rng.random() * 100,
+                'temperature': temp + math.sin((hour - 6) / 12 * math.pi) * 3 + (rng.random() - 0.5) * 2,
+                'humidity': max(0, min(100, humidity + (rng.random() - 0.5) * 10))
+            }
+        }
+        if i % 3 == 0:
+            reading['metadata'] = {'batteryLevel': rng.randint(5, 100)}
+        payloads.append(json.dumps(reading).encode('utf-8'))
+    return payloads
+
+
+def alert_payloads(count):
+    now = datetime.utcnow()
+    return [{
+        'plant_id': PLANTS[i % len(PLANTS)][0],
+        'timestamp': now,
+        'type': 'WATER_NEEDED',
+        'severity': 'HIGH',
+        'message': f'Soil moisture too low: {20 + i % 10}% (needs 40%+)'
+    } for i in range(count)]
+
+
+def timed(label, fn, items):
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<38} {elapsed / len(items) * 1e6:8.2f} µs/msg  {len(items) / elapsed:12,.0f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = sensor_payloads(args.messages)
+    alerts = alert_payloads(args.messages)
+    avg_bytes = sum(len(p) for p in payloads) / len(payloads)
+    print(f"{args.messages} sensor.js payloads, {avg_bytes:.0f} bytes average\n")
+
+    print("Decode")
+    timed('baseline lambda json.loads', lambda m: json.loads(m.decode('utf-8')), payloads)
+    for name in ('json', 'orjson', 'msgspec'):
+        backend = codec.get_codec(name)
+        if backend.name != name:
+            print(f"  {name:<38} not installed")
+            continue
+        timed(f'{name}.decode (dict)', backend.decode, payloads)
+        timed(f'{name}.decode_reading (SensorReading)', backend.decode_reading, payloads)
+
+    print("\nEncode (alert with datetime)")
+    timed('baseline isoformat + json.dumps',
+          lambda a: json.dumps({**a, 'timestamp': a['timestamp'].isoformat()}).encode('utf-8'), alerts)
+    for name in ('json', 'orjson', 'msgspec'):
+        backend = codec.get_codec(name)
+        if backend.name == name:
+            timed(f'{name}.encode', backend.encode, alerts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Health Analysis Benchmark
+Per-reading cost of the rule engine's per-reading analyze() loop against
+the vectorized analyze_batch() at several batch sizes, on sensor.js shaped
+readings, with the plant-monitor rules plus the shipped plant-rules.json
+types. Before timing, every batch result is checked against the per-reading
+one (scores, statuses and issues) for both processors' rules, including
+malformed readings.
+
+Usage: python benchmarks/bench_health_analysis.py [--sizes 1,100,10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_codec import PLANTS, sensor_payloads  # noqa: E402
+from plant_registry import default_care_instructions  # noqa: E402
+from rule_engine import (  # noqa: E402
+    CARE_METRICS, DEFAULT_RULES_FILE, MONITOR_METRICS, PLANT_CARE_RULES, PLANT_MONITOR_RULES,
+    RuleEngine, care_result, monitor_result
+)
+
+MONITOR_CARE = {}
+CARE_CARE = {}
+for _, plant_type, *_ in PLANTS:
+    defaults = default_care_instructions(plant_type)
+    CARE_CARE[plant_type] = defaults
+    MONITOR_CARE[plant_type] = {
+        'moisture_min': defaults['moistureMin'],
+        'moisture_max': defaults['moistureMax'],
+        'light_min': defaults['lightMin'],
+        'temp_min': defaults['temperatureMin'],
+        'temp_max': defaults['temperatureMax']
+    }
+
+# Readings the columns cannot hold, which must fall back to (and behave like) the scalar path
+MALFORMED = [
+    {'plantId': 'plant-001', 'plantType': 'monstera'},
+    {'plantId': 'plant-001', 'plantType': 'monstera', 'sensors': {'soilMoisture': None}},
+    {'plantId': 'plant-001', 'plantType': 'monstera', 'sensors': {'soilMoisture': '35', 'lightLevel': 900}},
+    {'plantId': 'plant-001', 'plantType': 'monstera', 'sensors': {'soilMoisture': float('nan'), 'lightLevel': 10}},
+    {'plantId': 'plant-001', 'plantType': 'monstera', 'sensors': {'soilMoisture': 2 ** 60, 'lightLevel': 10}},
+    {'plantId': 'plant-001', 'plantType': 'monstera', 'sensors': {'soilMoisture': True, 'lightLevel': 10},
+     'metadata': {'batteryLevel': 19}},
+    {'plantId': 'plant-001', 'plantType': 'monstera', 'metadata': None},
+]
+
+
+def readings(count):
+    return [json.loads(payload) for payload in sensor_payloads(count)]
+
+
+def outcome(fn, *args):
+    try:
+        result = dict(fn(*args))
+    except Exception as e:
+        return ('raised', type(e))
+    result.pop('analyzed_at', None)
+    return result
+
+
+def engine(processor, rules, metric_exprs, result):
+    rule_engine = RuleEngine(processor, rules, metric_exprs, result, rules_file=DEFAULT_RULES_FILE)
+    rule_engine.reload(force=True)
+    return rule_engine
+
+
+def verify(batch, rule_engine, profiles):
+    cares = [profiles[data.get('plantType')] for data in batch]
+    health = rule_engine.analyze_batch(batch, cares)
+    for i, data in enumerate(batch):
+        expected = outcome(rule_engine.analyze, data, cares[i])
+        actual = outcome(health.analysis, i)
+        if expected != actual:
+            raise AssertionError(f"reading {i} {data}: batch {actual} != scalar {expected}")
+    return sum(not vectorized for vectorized in health.vectorized)
+
+
+def per_reading(fn, batch, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(batch) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1,100,10000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    monitor = engine('plant-monitor', PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result)
+    care = engine('plant-care', PLANT_CARE_RULES, CARE_METRICS, care_result)
+    sample = readings(2000) + [dict(reading) for reading in MALFORMED]
+    # Whole (vectorized; small chunks are evaluated per reading throughout)
+    fallbacks = verify(sample, monitor, MONITOR_CARE)
+    verify(sample, care, CARE_CARE)
+    for i in range(0, len(sample), 10):
+        verify(sample[i:i + 10], monitor, MONITOR_CARE)
+    print(f"Batch results match the per-reading path on {len(sample)} readings ({fallbacks} fell back)\n")
+
+    print(f"{'batch':>7}  {'scalar':>10}  {'batch scores':>13}  {'batch + dicts':>14}   (µs/reading, best of {args.repeat})")
+    for size in sizes:
+        batch = readings(size)
+        cares = [MONITOR_CARE[data['plantType']] for data in batch]
+
+        def scalar():
+            for data, care_instructions in zip(batch, cares):
+                monitor.analyze(data, care_instructions)
+
+        def scores():
+            monitor.analyze_batch(batch, cares)
+
+        def full():
+            health = monitor.analyze_batch(batch, cares)
+            for i in range(len(batch)):
+                health.analysis(i)
+
+        print(f"{size:>7}  {per_reading(scalar, batch, args.repeat):>10.2f}  "
+              f"{per_reading(scores, batch, args.repeat):>13.2f}  {per_reading(full, batch, args.repeat):>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
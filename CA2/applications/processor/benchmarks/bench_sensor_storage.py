@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Sensor Storage Benchmark
+Insert throughput, storage size and per-plant range-query latency of
+sensor_readings as a plain collection (with the processors' (plantId,
+timestamp) index) versus a time-series collection. Needs a MongoDB 5.0+
+server; everything is written to a scratch database that is dropped
+afterwards.
+
+Usage: python benchmarks/bench_sensor_storage.py [--mongodb-uri mongodb://localhost:27017] [--readings 200000]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_codec import PLANTS, sensor_payloads  # noqa: E402
+from sensor_storage import STORAGE_STANDARD, STORAGE_TIMESERIES, SensorStorage, parse_timestamp  # noqa: E402
+
+LAYOUTS = [STORAGE_STANDARD, STORAGE_TIMESERIES]
+
+
+def load(collection, storage, payloads, batch_size):
+    """Insert the readings the way the processors do; returns readings/second"""
+    started = time.perf_counter()
+    for start in range(0, len(payloads), batch_size):
+        collection.insert_many(
+            [storage.document(json.loads(p)) for p in payloads[start:start + batch_size]],
+            ordered=False
+        )
+    return len(payloads) / (time.perf_counter() - started)
+
+
+def storage_size(db, name):
+    """(data + index bytes on disk, index bytes)"""
+    stats = db.command('collStats', name)
+    return stats.get('storageSize', 0) + stats.get('totalIndexSize', 0), stats.get('totalIndexSize', 0)
+
+
+def range_queries(collection, storage, first, last, window, queries, rng):
+    """Median and p95 milliseconds for one plant's readings over a random window"""
+    span = (last - first).total_seconds() - window.total_seconds()
+    timings = []
+    for _ in range(queries):
+        start = first + timedelta(seconds=rng.uniform(0, max(span, 0)))
+        end = start + window
+        if not storage.timeseries:
+            # Plain collections keep the ISO strings, which sort in time order
+            start, end = start.isoformat(timespec='milliseconds') + 'Z', end.isoformat(timespec='milliseconds') + 'Z'
+        query = {'plantId': rng.choice(PLANTS)[0], 'timestamp': {'$gte': start, '$lt': end}}
+        began = time.perf_counter()
+        list(collection.find(query, {'_id': 0}).sort('timestamp', 1))
+        timings.append((time.perf_counter() - began) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongodb-uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='plant_storage_bench')
+    parser.add_argument('--readings', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--window-minutes', type=int, default=60, help='range query window')
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongodb_uri)
+    db = client[args.database]
+    client.drop_database(args.database)
+    payloads = sensor_payloads(args.readings)
+    first = json.loads(payloads[0])['timestamp']
+    last = json.loads(payloads[-1])['timestamp']
+    print(f"{args.readings} readings ({first} - {last}), server {client.server_info()['version']}\n")
+    print(f"  {'layout':<12} {'inserts/s':>10} {'on disk':>10} {'indexes':>10} {'query p50':>10} {'query p95':>10}")
+
+    try:
+        for layout in LAYOUTS:
+            storage = SensorStorage(layout, meta_field='plantId')
+            collection = storage.ensure_collection(db, f'sensor_readings_{layout}')
+            # The same secondary index the processors create
+            collection.create_index([('plantId', 1), ('timestamp', -1)])
+
+            rate = load(collection, storage, payloads, args.batch_size)
+            size, index_size = storage_size(db, collection.name)
+            p50, p95 = range_queries(
+                collection, storage, parse_timestamp(first), parse_timestamp(last),
+                timedelta(minutes=args.window_minutes), args.queries, random.Random(7)
+            )
+            print(f"  {layout:<12} {rate:>10,.0f} {size / 1e6:>8.1f}MB {index_size / 1e6:>8.1f}MB "
+                  f"{p50:>7.2f} ms {p95:>7.2f} ms")
+    finally:
+        client.drop_database(args.database)
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Wire Format Benchmark
+Bytes per reading and parse time for the JSON, MessagePack and struct
+encodings of sensor.js readings.
+
+Usage: python benchmarks/bench_wire_format.py [--messages 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import codec  # noqa: E402
+import wire_format  # noqa: E402
+from bench_codec import sensor_payloads  # noqa: E402
+
+FORMATS = [
+    ('json', wire_format.CONTENT_TYPE_JSON),
+    ('msgpack', wire_format.CONTENT_TYPE_MSGPACK),
+    ('struct', wire_format.CONTENT_TYPE_STRUCT)
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    documents = [json.loads(p) for p in sensor_payloads(args.messages)]
+    decoder = wire_format.WireDecoder(codec.get_codec('auto'))
+    print(f"{args.messages} readings, JSON codec backend: {decoder.codec.name}\n")
+    print(f"  {'format':<10} {'bytes/reading':>14} {'decode dict':>14} {'decode record':>14}")
+
+    for name, content_type in FORMATS:
+        if content_type == wire_format.CONTENT_TYPE_MSGPACK and wire_format.msgpack is None:
+            print(f"  {name:<10} msgpack not installed")
+            continue
+        encoded = [wire_format.encode_reading(doc, content_type) for doc in documents]
+        size = sum(len(value) for value, _ in encoded) / len(encoded)
+
+        started = time.perf_counter()
+        for value, headers in encoded:
+            decoder.decode(value, headers)
+        as_dict = (time.perf_counter() - started) / len(encoded) * 1e6
+
+        started = time.perf_counter()
+        for value, headers in encoded:
+            decoder.decode_reading(value, headers)
+        as_record = (time.perf_counter() - started) / len(encoded) * 1e6
+
+        print(f"  {name:<10} {size:>14.1f} {as_dict:>11.2f} µs {as_record:>11.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Payload Codecs
+Pluggable JSON backends for the Kafka and MQTT payloads, replacing the
+json.loads/json.dumps lambdas. The fastest installed backend is used:
+msgspec, then orjson, then the standard library.
+
+decode() returns the plain dict the processors store in MongoDB.
+decode_reading() decodes a sensor.js payload straight into a slotted
+SensorReading without building a dict first (msgspec backend), for
+consumers that only read the sensor values. The processors stay on
+decode(): they keep the reading as a document - stored as-is, spread
+into alerts and Home Assistant payloads, and the rule engine and window
+statistics read it - and they keep fields sensor.js adds that a
+SensorReading would drop, so decoding to a SensorReading would only add
+a to_document() per reading.
+encode() serialises datetimes natively, so callers can pass datetime
+objects instead of formatting them with isoformat().
+"""
+
+import json
+import logging
+import threading
+from datetime import date, datetime
+from typing import Optional
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+logger = logging.getLogger(__name__)
+
+
+class SensorReading:
+    """Flat, typed view of one sensor.js reading"""
+
+    __slots__ = (
+        'plant_id', 'timestamp', 'plant_type', 'location',
+        'soil_moisture', 'light_level', 'temperature', 'humidity', 'battery_level'
+    )
+
+    def __init__(self, plant_id, timestamp=None, plant_type=None, location=None,
+                 soil_moisture=None, light_level=None, temperature=None,
+                 humidity=None, battery_level=None):
+        self.plant_id = plant_id
+        self.timestamp = timestamp
+        self.plant_type = plant_type
+        self.location = location
+        self.soil_moisture = soil_moisture
+        self.light_level = light_level
+        self.temperature = temperature
+        self.humidity = humidity
+        self.battery_level = battery_level
+
+    @classmethod
+    def from_document(cls, doc):
+        sensors = doc.get('sensors') or {}
+        metadata = doc.get('metadata') or {}
+        return cls(
+            doc.get('plantId'),
+            doc.get('timestamp'),
+            doc.get('plantType'),
+            doc.get('location'),
+            sensors.get('soilMoisture'),
+            sensors.get('lightLevel'),
+            sensors.get('temperature'),
+            sensors.get('humidity'),
+            metadata.get('batteryLevel')
+        )
+
+    def to_document(self):
+        """The nested sensor.js shape stored in sensor_readings"""
+        doc = {
+            'timestamp': self.timestamp,
+            'plantId': self.plant_id,
+            'location': self.location,
+            'plantType': self.plant_type,
+            'sensors': {
+                'soilMoisture': self.soil_moisture,
+                'lightLevel': self.light_level,
+                'temperature': self.temperature,
+                'humidity': self.humidity
+            }
+        }
+        if self.battery_level is not None:
+            doc['metadata'] = {'batteryLevel': self.battery_level}
+        return doc
+
+    def __eq__(self, other):
+        if not isinstance(other, SensorReading):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f'{f}={getattr(self, f)!r}' for f in self.__slots__)
+        return f'SensorReading({fields})'
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if ObjectId is not None and isinstance(value, ObjectId):
+        # insert_one() adds _id to the dict it was given
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class JsonCodec:
+    """Standard library backend"""
+
+    name = 'json'
+
+    def decode(self, raw):
+        # Decoding first skips json's encoding detection on bytes input
+        return json.loads(raw.decode('utf-8') if isinstance(raw, bytes) else raw)
+
+    def decode_reading(self, raw):
+        return SensorReading.from_document(self.decode(raw))
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson backend - C parser, native datetime serialisation"""
+
+    name = 'orjson'
+
+    def decode(self, raw):
+        return orjson.loads(raw)
+
+    def decode_reading(self, raw):
+        return SensorReading.from_document(orjson.loads(raw))
+
+    def encode(self, obj):
+        return orjson.dumps(obj, default=_json_default)
+
+
+if msgspec is not None:
+    class _WireSensors(msgspec.Struct, rename='camel'):
+        soil_moisture: Optional[float] = None
+        light_level: Optional[float] = None
+        temperature: Optional[float] = None
+        humidity: Optional[float] = None
+
+    class _WireMetadata(msgspec.Struct, rename='camel'):
+        battery_level: Optional[float] = None
+
+    class _WireReading(msgspec.Struct, rename='camel'):
+        plant_id: Optional[str] = None
+        timestamp: Optional[str] = None
+        plant_type: Optional[str] = None
+        location: Optional[str] = None
+        sensors: Optional[_WireSensors] = None
+        metadata: Optional[_WireMetadata] = None
+
+
+class MsgspecCodec(JsonCodec):
+    """msgspec backend - typed decoding and encoding into a reused buffer"""
+
+    name = 'msgspec'
+
+    def __init__(self):
+        self._decoder = msgspec.json.Decoder()
+        self._reading_decoder = msgspec.json.Decoder(_WireReading)
+        self._encoder = msgspec.json.Encoder(enc_hook=_json_default)
+        self._buffers = threading.local()
+
+    def decode(self, raw):
+        return self._decoder.decode(raw)
+
+    def decode_reading(self, raw):
+        wire = self._reading_decoder.decode(raw)
+        sensors = wire.sensors
+        reading = SensorReading(wire.plant_id, wire.timestamp, wire.plant_type, wire.location)
+        if sensors is not None:
+            reading.soil_moisture = sensors.soil_moisture
+            reading.light_level = sensors.light_level
+            reading.temperature = sensors.temperature
+            reading.humidity = sensors.humidity
+        if wire.metadata is not None:
+            reading.battery_level = wire.metadata.battery_level
+        return reading
+
+    def encode(self, obj):
+        # Each thread reuses one growable buffer instead of allocating per message
+        buffer = getattr(self._buffers, 'buffer', None)
+        if buffer is None:
+            buffer = self._buffers.buffer = bytearray(1024)
+        self._encoder.encode_into(obj, buffer)
+        return bytes(buffer)
+
+
+_BACKENDS = {
+    'json': JsonCodec,
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec
+}
+
+
+def get_codec(name='auto'):
+    """Codec by name; 'auto' picks the fastest installed backend"""
+    name = (name or 'auto').lower()
+    if name == 'auto':
+        name = 'msgspec' if msgspec is not None else 'orjson' if orjson is not None else 'json'
+    if name == 'msgspec' and msgspec is None or name == 'orjson' and orjson is None:
+        logger.warning(f"Codec backend '{name}' is not installed, using json")
+        name = 'json'
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown codec backend '{name}' (expected one of: auto, {', '.join(_BACKENDS)})")
+    return _BACKENDS[name]()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Dead-Letter Topic
+Records that cannot be decoded or processed are produced to a dead-letter
+topic instead of being logged and dropped. The original key, value and
+headers are kept, and headers describe the failure:
+
+  dlq-error-class       exception class name (e.g. KeyError)
+  dlq-error-message     exception text, truncated
+  dlq-stage             decode, process or store
+  dlq-original-topic    where the record was consumed from
+  dlq-original-partition
+  dlq-original-offset
+  dlq-original-timestamp
+  dlq-processor         processor instance that gave up on it
+
+The producer batches and compresses, so a burst of poison messages costs a
+few requests rather than one per record. dlq-redrive.py replays them.
+"""
+
+import logging
+import os
+
+from kafka import KafkaProducer
+
+from wire_format import CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON
+
+logger = logging.getLogger(__name__)
+
+HEADER_PREFIX = 'dlq-'
+STAGE_DECODE = 'decode'
+STAGE_PROCESS = 'process'
+STAGE_STORE = 'store'
+
+_MAX_ERROR_MESSAGE = 512
+
+
+def dead_letter_topic_from_env(default='plant-sensors-dlq'):
+    """DLQ_TOPIC, or None when set to an empty string (dead-lettering disabled)"""
+    topic = os.getenv('DLQ_TOPIC', default).strip()
+    return topic or None
+
+
+def failure_headers(record, error, stage, processor_id=None):
+    """Headers describing why a record was dead-lettered"""
+    headers = {
+        'dlq-error-class': type(error).__name__,
+        'dlq-error-message': str(error)[:_MAX_ERROR_MESSAGE],
+        'dlq-stage': stage,
+        'dlq-original-topic': record.topic,
+        'dlq-original-partition': str(record.partition),
+        'dlq-original-offset': str(record.offset),
+        'dlq-original-timestamp': str(record.timestamp)
+    }
+    if processor_id:
+        headers['dlq-processor'] = processor_id
+    return [(key, value.encode('utf-8')) for key, value in headers.items()]
+
+
+class DeadLetterPublisher:
+    """Batched, compressed producer for failed records"""
+
+    def __init__(self, brokers, topic, codec=None, metrics=None, processor_id=None,
+                 compression='gzip', linger_ms=200, batch_size=256 * 1024):
+        self.topic = topic
+        self.codec = codec
+        self.metrics = metrics
+        self.processor_id = processor_id
+        self.producer = KafkaProducer(
+            bootstrap_servers=brokers,
+            compression_type=compression or None,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+            acks='all',
+            retries=5
+        )
+        logger.info(f"Dead-letter topic: {topic} ({compression or 'no'} compression, {linger_ms}ms linger)")
+
+    @classmethod
+    def from_env(cls, brokers, codec=None, metrics=None, processor_id=None, default_topic='plant-sensors-dlq'):
+        """Publisher configured from DLQ_* variables, or None when DLQ_TOPIC is empty"""
+        topic = dead_letter_topic_from_env(default_topic)
+        if not topic:
+            return None
+        return cls(
+            brokers, topic, codec=codec, metrics=metrics, processor_id=processor_id,
+            compression=os.getenv('DLQ_COMPRESSION', 'gzip'),
+            linger_ms=int(os.getenv('DLQ_LINGER_MS', '200')),
+            batch_size=int(os.getenv('DLQ_BATCH_SIZE', str(256 * 1024)))
+        )
+
+    def publish(self, record, error, stage):
+        """
+        Dead-letter a consumer record. The value may still be the raw bytes or,
+        after decoding, the document - which is then re-encoded as JSON.
+        """
+        value = record.value
+        headers = [(k, v) for k, v in (record.headers or ()) if not k.startswith(HEADER_PREFIX)]
+        if not isinstance(value, (bytes, bytearray)):
+            value = self.codec.encode(value)
+            headers = [(k, v) for k, v in headers if k.lower() != CONTENT_TYPE_HEADER]
+            headers.append((CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON.encode('utf-8')))
+        headers.extend(failure_headers(record, error, stage, self.processor_id))
+
+        error_class = type(error).__name__
+        if self.metrics:
+            self.metrics.inc('dead_letter_records_total', stage=stage, error=error_class)
+        key = record.key.encode('utf-8') if isinstance(record.key, str) else record.key
+        try:
+            future = self.producer.send(self.topic, value=value, key=key, headers=headers)
+            future.add_errback(self._send_failed, record)
+        except Exception as e:
+            self._send_failed(e, record)
+        logger.warning(f"Dead-lettered {record.topic}[{record.partition}]@{record.offset} "
+                       f"({stage}: {error_class}: {error})")
+
+    def _send_failed(self, error, record):
+        if self.metrics:
+            self.metrics.inc('dead_letter_publish_failures_total')
+        logger.error(f"Could not dead-letter {record.topic}[{record.partition}]@{record.offset}: {error}")
+
+    def flush(self, timeout=None):
+        self.producer.flush(timeout)
+
+    def close(self, timeout=10):
+        self.producer.close(timeout)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Dead-Letter Re-drive
+Replays records from the dead-letter topic back to the topic they were
+consumed from (dlq-original-topic header), after the cause has been fixed.
+The dlq-* failure headers are dropped and a redrive-count header is kept,
+so a record that keeps failing stops being re-driven after --max-redrives.
+
+Reads and writes in large compressed batches and commits the dead-letter
+offsets only after the re-driven records are acknowledged.
+
+Usage:
+  python dlq-redrive.py --dlq-topic plant-sensors-dlq
+  python dlq-redrive.py --stage store --dry-run
+  python dlq-redrive.py --error-class KeyError --target plant-sensors --group dlq-redrive-keyerror
+
+Records skipped by --stage/--error-class filters are committed past for the
+consumer group, so use a separate --group for filtered runs.
+"""
+
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+
+from kafka import KafkaConsumer, KafkaProducer
+from kafka.structs import OffsetAndMetadata
+
+from dead_letter import HEADER_PREFIX
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REDRIVE_COUNT_HEADER = 'redrive-count'
+
+
+def header_value(headers, name):
+    for key, value in headers or ():
+        if key == name:
+            return value.decode('utf-8')
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-drive dead-lettered plant sensor records')
+    parser.add_argument('--brokers', default=os.getenv('KAFKA_BROKERS', 'kafka-service:9092'))
+    parser.add_argument('--dlq-topic', default=os.getenv('DLQ_TOPIC', 'plant-sensors-dlq'))
+    parser.add_argument('--group', default='plant-dlq-redrive', help='consumer group tracking re-drive progress')
+    parser.add_argument('--target', help='topic to re-drive into (default: dlq-original-topic header)')
+    parser.add_argument('--stage', action='append', help='only re-drive this failure stage (repeatable)')
+    parser.add_argument('--error-class', action='append', help='only re-drive this error class (repeatable)')
+    parser.add_argument('--max-redrives', type=int, default=3, help='skip records already re-driven this often')
+    parser.add_argument('--max-records', type=int, default=0, help='stop after this many records (0 = all)')
+    parser.add_argument('--idle-timeout', type=float, default=10, help='stop after this many seconds without records')
+    parser.add_argument('--compression', default='gzip')
+    parser.add_argument('--dry-run', action='store_true', help='count what would be re-driven without producing or committing')
+    args = parser.parse_args()
+
+    consumer = KafkaConsumer(
+        args.dlq_topic,
+        bootstrap_servers=args.brokers.split(','),
+        group_id=args.group,
+        auto_offset_reset='earliest',
+        enable_auto_commit=False,
+        max_poll_records=5000,
+        fetch_max_bytes=64 * 1024 * 1024,
+        max_partition_fetch_bytes=8 * 1024 * 1024
+    )
+    producer = None if args.dry_run else KafkaProducer(
+        bootstrap_servers=args.brokers.split(','),
+        compression_type=args.compression or None,
+        linger_ms=50,
+        batch_size=1024 * 1024,
+        buffer_memory=128 * 1024 * 1024,
+        acks='all'
+    )
+
+    outcome = Counter()
+    started = time.monotonic()
+    last_record = started
+    stop = False
+    try:
+        while not stop:
+            records = consumer.poll(timeout_ms=1000)
+            if not records:
+                if time.monotonic() - last_record >= args.idle_timeout:
+                    break
+                continue
+            last_record = time.monotonic()
+
+            handled = {}
+            for tp, messages in records.items():
+                for record in messages:
+                    handled[tp] = record.offset + 1
+                    stage = header_value(record.headers, 'dlq-stage')
+                    error_class = header_value(record.headers, 'dlq-error-class')
+                    redrives = int(header_value(record.headers, REDRIVE_COUNT_HEADER) or 0)
+                    if args.stage and stage not in args.stage or \
+                            args.error_class and error_class not in args.error_class:
+                        outcome['filtered'] += 1
+                        continue
+                    if redrives >= args.max_redrives:
+                        outcome['exhausted'] += 1
+                        continue
+                    target = args.target or header_value(record.headers, 'dlq-original-topic')
+                    if not target:
+                        outcome['no_target'] += 1
+                        continue
+
+                    headers = [(k, v) for k, v in record.headers
+                               if not k.startswith(HEADER_PREFIX) and k != REDRIVE_COUNT_HEADER]
+                    headers.append((REDRIVE_COUNT_HEADER, str(redrives + 1).encode('utf-8')))
+                    if producer:
+                        producer.send(target, value=record.value, key=record.key, headers=headers)
+                    outcome['redriven'] += 1
+                    outcome[f'{stage}/{error_class}'] += 1
+                    if args.max_records and outcome['redriven'] >= args.max_records:
+                        stop = True
+                        break
+                if stop:
+                    break
+
+            if producer:
+                # Acknowledge the re-driven records before moving the dead-letter offsets
+                producer.flush()
+                consumer.commit(offsets={tp: OffsetAndMetadata(offset, None) for tp, offset in handled.items()})
+            elapsed = time.monotonic() - started
+            logger.info(f"Re-driven {outcome['redriven']} records ({outcome['redriven'] / elapsed:,.0f}/s)")
+    except KeyboardInterrupt:
+        logger.info("Interrupted")
+    finally:
+        if producer:
+            producer.flush()
+            producer.close()
+        consumer.close()
+
+    elapsed = time.monotonic() - started
+    print(f"{'Would re-drive' if args.dry_run else 'Re-drove'} {outcome.pop('redriven', 0)} records "
+          f"in {elapsed:.1f}s; skipped: filtered={outcome.pop('filtered', 0)}, "
+          f"exhausted={outcome.pop('exhausted', 0)}, no target={outcome.pop('no_target', 0)}")
+    for failure, count in outcome.most_common():
+        print(f"  {failure:<40} {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Health Analysis
+Plant health scoring of whole batches, from the rule engine's rule sets.
+
+RuleEngine (rule_engine.py) compiles each plant type's merged rules twice:
+into the generated per-reading evaluate() function, and into a BatchRules,
+the same rules as NumPy column operations. RuleEngine.batch() returns a
+HealthBatch; add() puts each reading's metrics into a row of its type's
+value columns (moisture, light, ... as float64, None as NaN) and its care
+instructions into a table of the distinct thresholds, and analyze()
+compares whole columns per rule, producing health scores, status codes and
+issue bitmasks (bit j is rule j of the reading's rule set).
+
+Results match evaluate() exactly. Issue messages are formatted from the
+original values, not the float columns, and a reading the columns cannot
+represent exactly (missing sensors, non-numeric or huge values, missing
+care fields, ...) is evaluated per reading instead - including raising the
+same exception, from analysis(). Metrics are read in add(), so window
+statistics are those of the reading's own point in the stream.
+
+The processors deliberately keep scoring readings with RuleEngine.analyze().
+They store and alert on every reading's issue dicts, and formatting those
+costs more than the comparisons the columns save: with full results the
+batch is slower than the per-reading loop at every size (see
+benchmarks/bench_health_analysis.py). batch() pays off where scores,
+statuses or bitmasks are enough, e.g. re-scoring stored readings.
+"""
+
+import numpy as np
+
+STATUSES = ('healthy', 'needs_attention', 'critical')
+
+# Largest magnitude at which every integer is exactly a float64
+_EXACT_INT = 2 ** 53
+# Fewer readings than this do not pay for NumPy - they are evaluated per reading
+_SMALL_BATCH = 32
+# Issue bitmasks are uint64; larger rule sets are evaluated per reading
+_MAX_RULES = 64
+
+_COMPARE = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
+
+
+def health_status(health_score):
+    return 'healthy' if health_score > 80 else 'needs_attention' if health_score > 60 else 'critical'
+
+
+def _exact(value):
+    """True if value compares the same as a float64 as it does in Python"""
+    if value.__class__ is float:
+        return True
+    return isinstance(value, int) and -_EXACT_INT <= value <= _EXACT_INT
+
+
+class _Rule:
+    """One rule with its metric and threshold columns"""
+
+    def __init__(self, rule, metric, columns):
+        self.type = rule['type']
+        self.severity = str(rule.get('severity', 'MEDIUM'))
+        self.message = str(rule.get('message', rule['type']))
+        self.op = rule['op']
+        self.penalty = rule.get('penalty', 0)
+        self.group = rule.get('group')
+        self.metric = metric
+        self.columns = columns
+
+
+class BatchRules:
+    """One rule set (as validated by compile_rules) in column form; evaluate is its per-reading function"""
+
+    def __init__(self, rules, metric_exprs, care_defaults, evaluate, name='default'):
+        self.evaluate = evaluate
+        self.care_defaults = care_defaults or {}
+        metrics = []
+        for rule in rules:
+            if rule['metric'] not in metrics:
+                metrics.append(rule['metric'])
+        self.width = len(metrics)
+        self.values = self._compile_values(metrics, metric_exprs, name)
+
+        # Every threshold (a number or a care field) gets a column of the limits table
+        self.specs = []
+        self.rules = []
+        for rule in rules:
+            specs = list(rule['threshold']) if rule['op'] == 'outside' else [rule['threshold']]
+            columns = tuple(range(len(self.specs), len(self.specs) + len(specs)))
+            self.specs.extend(specs)
+            self.rules.append(_Rule(rule, metrics.index(rule['metric']), columns))
+        self.vectorized = len(self.rules) <= _MAX_RULES
+        self.int_penalties = all(rule.penalty.__class__ is int and abs(rule.penalty) <= 2 ** 31 for rule in self.rules)
+        self.bits = np.left_shift(np.uint64(1), np.arange(len(self.rules), dtype=np.uint64))
+
+    @staticmethod
+    def _compile_values(metrics, metric_exprs, name):
+        """values(reading, stats): the metrics as a tuple; raises if one cannot go into a float64 column"""
+        lines = ['def values(reading, stats):']
+        for i, metric in enumerate(metrics):
+            expression, optional = metric_exprs[metric]
+            lines.append(f'    v{i} = {expression}')
+            # Same test as _exact(), inline - this runs for every reading of a batch
+            check = f'v{i}.__class__ is not float and (v{i}.__class__ is not int or not -{_EXACT_INT} <= v{i} <= {_EXACT_INT})'
+            if optional:
+                check = f'v{i} is not None and {check}'
+            lines.append(f'    if {check}:')
+            lines.append(f'        raise TypeError(f"{{v{i}!r}} is not a column value")')
+        lines.append('    return (' + ''.join(f'v{i}, ' for i in range(len(metrics))) + ')')
+        namespace = {}
+        exec(compile('\n'.join(lines), f'<plant rules: {name} columns>', 'exec'), namespace)
+        return namespace['values']
+
+    def limits(self, care):
+        """The thresholds under these care instructions; raises if one is missing or inexact"""
+        limits = []
+        for spec in self.specs:
+            if isinstance(spec, str):
+                limit = care.get(spec, self.care_defaults[spec]) if spec in self.care_defaults else care[spec]
+            else:
+                limit = spec
+            if not _exact(limit):
+                raise TypeError(f'{limit!r} is not a column value')
+            limits.append(limit)
+        return limits
+
+    def hits(self, values, limits):
+        """(readings x rules) boolean matrix of the rules each row triggers"""
+        hits = np.zeros((len(values), len(self.rules)), dtype=bool)
+        taken = None
+        previous_group = None
+        for j, rule in enumerate(self.rules):
+            column = values[:, rule.metric]
+            if rule.op == 'outside':
+                hit = (column < limits[:, rule.columns[0]]) | (column > limits[:, rule.columns[1]])
+            else:
+                hit = _COMPARE[rule.op](column, limits[:, rule.columns[0]])
+            if rule.group is not None and rule.group == previous_group:
+                # elif: only rows no earlier rule of the group triggered
+                hit &= ~taken
+                taken |= hit
+            else:
+                taken = hit.copy()
+            previous_group = rule.group
+            hits[:, j] = hit
+        return hits
+
+    def scores(self, hits):
+        if self.int_penalties:
+            penalties = np.array([rule.penalty for rule in self.rules], dtype=np.int64)
+            return 100 - hits.astype(np.int64) @ penalties
+        # Same order of subtractions as evaluate(), so float penalties round the same way
+        scores = np.full(len(hits), 100.0)
+        for j, rule in enumerate(self.rules):
+            if rule.penalty:
+                scores = np.where(hits[:, j], scores - rule.penalty, scores)
+        return scores
+
+    def issues(self, mask, values, limits):
+        """(score, issues) of a row from its bitmask and original values, as evaluate() builds them"""
+        score = 100
+        issues = []
+        while mask:
+            # Lowest set bit first - rule order, as evaluate() appends them
+            bit = mask & -mask
+            mask ^= bit
+            rule = self.rules[bit.bit_length() - 1]
+            value = values[rule.metric]
+            if rule.op == 'outside':
+                low, high = limits[rule.columns[0]], limits[rule.columns[1]]
+                message = rule.message.format(value=value, threshold=(low, high), low=low, high=high)
+            else:
+                threshold = limits[rule.columns[0]]
+                message = rule.message.format(value=value, threshold=threshold, low=threshold, high=threshold)
+            issues.append({'type': rule.type, 'severity': rule.severity, 'message': message})
+            if rule.penalty:
+                score -= rule.penalty
+        return score, issues
+
+
+class _Group:
+    """Rows of one rule set waiting for analyze()"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.rows = []
+        self.values = []
+        # Distinct limits and each row's index into them
+        self.limit_rows = []
+        self.limit_index = []
+
+
+class HealthBatch:
+    """
+    Readings queued with add() and scored together by analyze(). scores,
+    statuses (codes into STATUSES) and masks are arrays over the rows in
+    add() order, filled where vectorized[i] is True (scores before the
+    processor's result formatting); analysis(i) gives any row's result as
+    RuleEngine.analyze() would.
+    """
+
+    def __init__(self, table, result, size=None):
+        self._by_type, self._default = table
+        self._result = result
+        self._small = size is not None and size < _SMALL_BATCH
+        self._rows = []
+        # Per-reading outcomes (score, issues) or exceptions, by row
+        self._evaluated = {}
+        self._groups = {}
+        # (rule set, care instructions) -> (care, limits, row of the group's limits table);
+        # the care dict is kept so its id is not reused during the batch
+        self._limits = {}
+        self._mask_list = None
+        self.scores = None
+        self.statuses = None
+        self.masks = None
+        self.vectorized = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, reading, care, stats=None):
+        """Queue a reading with its care instructions and window statistics; returns its row"""
+        row = len(self._rows)
+        try:
+            rules = self._by_type.get(reading.get('plantType'), self._default)
+        except Exception as e:
+            self._rows.append(None)
+            self._evaluated[row] = e
+            return row
+        if not self._small and rules.vectorized:
+            try:
+                values = rules.values(reading, stats)
+                group = self._groups.get(id(rules))
+                if group is None:
+                    group = self._groups[id(rules)] = _Group(rules)
+                key = (id(rules), id(care))
+                cached = self._limits.get(key)
+                if cached is None:
+                    cached = self._limits[key] = (care, rules.limits(care), len(group.limit_rows))
+                    group.limit_rows.append(cached[1])
+                _, limits, index = cached
+                self._rows.append((rules, values, limits))
+                group.rows.append(row)
+                group.values.append(values)
+                group.limit_index.append(index)
+                return row
+            except Exception:
+                # Not representable in the columns - evaluated per reading below
+                pass
+        self._rows.append(None)
+        try:
+            self._evaluated[row] = rules.evaluate(reading, care, stats)
+        except Exception as e:
+            self._evaluated[row] = e
+        return row
+
+    def analyze(self):
+        """Score the queued readings by column; returns the batch"""
+        count = len(self._rows)
+        self.scores = np.zeros(count, dtype=np.float64)
+        self.masks = np.zeros(count, dtype=np.uint64)
+        self.vectorized = np.zeros(count, dtype=bool)
+        for group in self._groups.values():
+            if not group.rows:
+                continue
+            rules = group.rules
+            rows = np.array(group.rows, dtype=np.intp)
+            table = np.array(group.limit_rows, dtype=np.float64).reshape(len(group.limit_rows), len(rules.specs))
+            limits = table[np.array(group.limit_index, dtype=np.intp)]
+            values = np.array(group.values, dtype=np.float64).reshape(len(rows), rules.width)
+            hits = rules.hits(values, limits)
+            self.scores[rows] = rules.scores(hits)
+            self.masks[rows] = (hits * rules.bits).sum(axis=1, dtype=np.uint64)
+            self.vectorized[rows] = True
+        self.statuses = np.where(self.scores > 80, 0, np.where(self.scores > 60, 1, 2)).astype(np.int8)
+        self._mask_list = self.masks.tolist()
+        return self
+
+    def analysis(self, i):
+        """The health analysis of row i; raises what the per-reading evaluation raised"""
+        entry = self._rows[i]
+        if entry is None:
+            outcome = self._evaluated[i]
+            if isinstance(outcome, Exception):
+                raise outcome
+            score, issues = outcome
+            return self._result(score, list(issues))
+        rules, values, limits = entry
+        score, issues = rules.issues(self._mask_list[i], values, limits)
+        return self._result(score, issues)
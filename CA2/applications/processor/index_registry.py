@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Index Registry
+Declares, per processor, every MongoDB query it issues and the indexes
+those queries need. At startup the processor creates the indexes (or
+leaves them alone if they already exist) and asks explain() how each
+declared query would run. A hot-path query planned as a COLLSCAN is
+logged, or stops the processor with INDEX_CHECK=fail.
+
+  INDEX_CHECK   warn (default) | fail | off
+
+Add a QuerySpec here whenever a processor starts issuing a new query.
+"""
+
+import logging
+import os
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+CHECK_WARN = 'warn'
+CHECK_FAIL = 'fail'
+CHECK_OFF = 'off'
+
+_SAMPLE_TIME = datetime(2025, 1, 1)
+
+
+class IndexSpec:
+    """An index a processor relies on"""
+
+    def __init__(self, collection, keys, unique=False):
+        self.collection = collection
+        self.keys = keys
+        self.unique = unique
+
+    def model(self):
+        return IndexModel(self.keys, unique=self.unique) if self.unique else IndexModel(self.keys)
+
+    def __repr__(self):
+        keys = ', '.join(f'{field} {direction}' for field, direction in self.keys)
+        return f"{self.collection}({keys}){' unique' if self.unique else ''}"
+
+
+class QuerySpec:
+    """A query a processor issues, with representative values for explain()"""
+
+    def __init__(self, name, collection, filter, sort=None, hot=True):
+        self.name = name
+        self.collection = collection
+        self.filter = filter
+        self.sort = sort
+        # Hot-path queries run per reading or per batch; the others only warn
+        self.hot = hot
+
+
+class IndexRegistry:
+    def __init__(self, indexes, queries):
+        self.indexes = indexes
+        self.queries = queries
+
+    def ensure_indexes(self, db):
+        """Create every declared index; an existing index with other options is reported, not replaced"""
+        for spec in self.indexes:
+            try:
+                db[spec.collection].create_indexes([spec.model()])
+            except OperationFailure as e:
+                logger.warning(f"Index {spec!r} conflicts with an existing index: {e}")
+
+    def check_queries(self, db, mode=CHECK_WARN, metrics=None):
+        """explain() every declared query; returns the names planned as collection scans"""
+        scans = []
+        for query in self.queries:
+            cursor = db[query.collection].find(query.filter).limit(1)
+            if query.sort:
+                cursor = cursor.sort(query.sort)
+            try:
+                plan = cursor.explain()
+            except PyMongoError as e:
+                logger.warning(f"Could not explain '{query.name}': {e}")
+                continue
+            stages = winning_stages(plan)
+            collscan = 'COLLSCAN' in stages
+            if metrics:
+                metrics.set_gauge('query_collscan', 1 if collscan else 0, query=query.name)
+            if not collscan:
+                logger.debug(f"Query '{query.name}' on {query.collection}: {' <- '.join(stages)}")
+                continue
+            scans.append(query.name)
+            message = (f"Query '{query.name}' on {query.collection} {query.filter} is planned as a COLLSCAN - "
+                       f"declare an index for it in index_registry.py")
+            if query.hot and mode == CHECK_FAIL:
+                raise RuntimeError(message)
+            logger.warning(message)
+        return scans
+
+    def apply(self, db, metrics=None, mode=None):
+        """Startup entry point: ensure indexes, then check the query plans (INDEX_CHECK)"""
+        mode = mode or os.getenv('INDEX_CHECK', CHECK_WARN).strip().lower()
+        self.ensure_indexes(db)
+        if mode != CHECK_OFF:
+            return self.check_queries(db, mode, metrics)
+        return []
+
+
+def winning_stages(explain):
+    """Stage names of every winning plan in an explain() result (time-series plans nest them)"""
+    stages = []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and 'stage' in node:
+                stages.append(node['stage'])
+            for key, value in node.items():
+                if key == 'rejectedPlans':
+                    continue
+                walk(value, in_plan or key in ('winningPlan', 'queryPlan'))
+        elif isinstance(node, list):
+            for value in node:
+                walk(value, in_plan)
+
+    walk(explain, False)
+    return stages
+
+
+# Re-read by the rule engine every PLANT_RULES_RELOAD_SECONDS
+_RULE_INDEXES = [IndexSpec('plant_rules', [('plantType', ASCENDING)])]
+
+
+def _rule_queries(processor):
+    return [
+        QuerySpec('plant rules', 'plant_rules',
+                  {'$or': [{'processor': {'$exists': False}}, {'processor': processor}]},
+                  sort=[('plantType', ASCENDING)], hot=False)
+    ]
+
+
+def _rollup_indexes(key_field):
+    return [
+        IndexSpec(f'sensor_rollups_{resolution}', [(key_field, ASCENDING), ('start', ASCENDING)], unique=True)
+        for resolution in ('minute', 'hour')
+    ]
+
+
+def _rollup_queries(key_field):
+    return [
+        QuerySpec('rollup upsert', 'sensor_rollups_minute', {key_field: 'plant-001', 'start': _SAMPLE_TIME}),
+        QuerySpec('rollup chart', 'sensor_rollups_hour', {key_field: 'plant-001', 'start': {'$gte': _SAMPLE_TIME}},
+                  sort=[('start', ASCENDING)], hot=False)
+    ]
+
+
+# plant-monitor-processor.py: plants keyed by plant_id, derived documents by plant_id,
+# raw readings keep the sensor's plantId
+PLANT_MONITOR = IndexRegistry(
+    indexes=[
+        IndexSpec('plants', [('plant_id', ASCENDING)], unique=True),
+        IndexSpec('sensor_readings', [('plantId', ASCENDING), ('timestamp', DESCENDING)]),
+        IndexSpec('health_analysis', [('plant_id', ASCENDING), ('timestamp', DESCENDING)]),
+        IndexSpec('alerts', [('plant_id', ASCENDING), ('timestamp', DESCENDING)]),
+    ] + _rollup_indexes('plant_id') + _RULE_INDEXES,
+    queries=[
+        QuerySpec('plant lookup', 'plants', {'plant_id': 'plant-001'}),
+        QuerySpec('plant batch lookup', 'plants', {'plant_id': {'$in': ['plant-001', 'plant-002']}}),
+        QuerySpec('plant readings', 'sensor_readings', {'plantId': 'plant-001'},
+                  sort=[('timestamp', DESCENDING)], hot=False),
+        QuerySpec('plant health history', 'health_analysis', {'plant_id': 'plant-001'},
+                  sort=[('timestamp', DESCENDING)], hot=False),
+        QuerySpec('plant alerts', 'alerts', {'plant_id': 'plant-001'},
+                  sort=[('timestamp', DESCENDING)], hot=False),
+    ] + _rollup_queries('plant_id') + _rule_queries('plant-monitor')
+)
+
+# plant-care-processor.py: the camelCase schema shared with the CA3 processor
+PLANT_CARE = IndexRegistry(
+    indexes=[
+        IndexSpec('plants', [('plantId', ASCENDING)], unique=True),
+        IndexSpec('sensor_readings', [('plantId', ASCENDING), ('timestamp', DESCENDING)]),
+        IndexSpec('alerts', [('plantId', ASCENDING), ('timestamp', DESCENDING)]),
+    ] + _rollup_indexes('plantId') + _RULE_INDEXES,
+    queries=[
+        QuerySpec('plant lookup', 'plants', {'plantId': 'plant-001'}),
+        QuerySpec('plant batch lookup', 'plants', {'plantId': {'$in': ['plant-001', 'plant-002']}}),
+        QuerySpec('plant readings', 'sensor_readings', {'plantId': 'plant-001'},
+                  sort=[('timestamp', DESCENDING)], hot=False),
+        QuerySpec('plant alerts', 'alerts', {'plantId': 'plant-001'},
+                  sort=[('timestamp', DESCENDING)], hot=False),
+    ] + _rollup_queries('plantId') + _rule_queries('plant-care')
+)
+
+
+def processor_registry(collection_name='sensor_readings'):
+    """processor.py only writes readings (MONGO_COLLECTION); the index serves per-plant history reads"""
+    return IndexRegistry(
+        indexes=[
+            IndexSpec(collection_name, [('plantId', ASCENDING), ('timestamp', DESCENDING)]),
+        ],
+        queries=[
+            QuerySpec('plant readings', collection_name, {'plantId': 'plant-001'},
+                      sort=[('timestamp', DESCENDING)], hot=False),
+        ]
+    )
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+MongoDB Client Factory
+Builds the processors' MongoClient with pool settings from the environment
+and pymongo event listeners that feed the metrics registry, so pool
+checkout waits can be told apart from server time:
+
+  mongo_pool_checkout_seconds{address}           wait for a pooled connection
+  mongo_pool_checkout_failures_total{address,reason}
+  mongo_pool_connections{address}                open connections
+  mongo_pool_in_use{address}                     checked out connections
+  mongo_pool_cleared_total{address}
+  mongo_command_seconds{command,collection}      server round trip
+  mongo_command_failures_total{command,collection}
+
+  MONGO_MAX_POOL_SIZE                  connections per server (pymongo default 100)
+  MONGO_MIN_POOL_SIZE                  connections kept open (default 0)
+  MONGO_MAX_IDLE_TIME_MS               close connections idle this long
+  MONGO_WAIT_QUEUE_TIMEOUT_MS          fail a checkout after waiting this long
+  MONGO_CONNECT_TIMEOUT_MS
+  MONGO_SOCKET_TIMEOUT_MS
+  MONGO_SERVER_SELECTION_TIMEOUT_MS
+  MONGO_COMPRESSORS                    e.g. zstd,snappy,zlib - the server picks the first it supports
+  MONGO_ZLIB_LEVEL                     -1..9
+
+Unset variables leave pymongo's default (or the URI's option) in place.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+logger = logging.getLogger(__name__)
+
+# environment variable -> (MongoClient option, type)
+CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGO_COMPRESSORS': ('compressors', str),
+    'MONGO_ZLIB_LEVEL': ('zlibCompressionLevel', int)
+}
+
+
+def client_options_from_env():
+    """MongoClient keyword arguments for the MONGO_* variables that are set"""
+    options = {}
+    for variable, (option, cast) in CLIENT_OPTIONS.items():
+        value = os.getenv(variable, '').strip()
+        if value:
+            options[option] = cast(value)
+    return options
+
+
+def _address(address):
+    return f'{address[0]}:{address[1]}' if address else 'unknown'
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Connection pool (CMAP) events as pool size, in-use and checkout wait metrics"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # address -> [open, in use]
+        self._pools = {}
+        # Checkouts run on the calling thread, so their start can be kept per thread
+        self._local = threading.local()
+
+    def _adjust(self, address, opened=0, in_use=0):
+        label = _address(address)
+        with self._lock:
+            pool = self._pools.setdefault(label, [0, 0])
+            pool[0] = max(0, pool[0] + opened)
+            pool[1] = max(0, pool[1] + in_use)
+            self.metrics.set_gauge('mongo_pool_connections', pool[0], address=label)
+            self.metrics.set_gauge('mongo_pool_in_use', pool[1], address=label)
+
+    def _waited(self, event):
+        started = getattr(self._local, 'checkouts', {}).pop(event.address, None)
+        return time.monotonic() - started if started is not None else None
+
+    def pool_created(self, event):
+        self._adjust(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.metrics.inc('mongo_pool_cleared_total', address=_address(event.address))
+
+    def pool_closed(self, event):
+        label = _address(event.address)
+        with self._lock:
+            self._pools.pop(label, None)
+        self.metrics.remove_gauge('mongo_pool_connections', address=label)
+        self.metrics.remove_gauge('mongo_pool_in_use', address=label)
+
+    def connection_created(self, event):
+        self._adjust(event.address, opened=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._adjust(event.address, opened=-1)
+
+    def connection_check_out_started(self, event):
+        if not hasattr(self._local, 'checkouts'):
+            self._local.checkouts = {}
+        self._local.checkouts[event.address] = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        self._waited(event)
+        self.metrics.inc('mongo_pool_checkout_failures_total', address=_address(event.address),
+                         reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        waited = self._waited(event)
+        if waited is not None:
+            self.metrics.observe('mongo_pool_checkout_seconds', waited, address=_address(event.address))
+        self._adjust(event.address, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._adjust(event.address, in_use=-1)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Command round trips by command and collection"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # (connection, request ID) -> collection name
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            target = event.command.get('collection')
+        collection = target if isinstance(target, str) else ''
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), '')
+
+    def succeeded(self, event):
+        self.metrics.observe('mongo_command_seconds', event.duration_micros / 1e6,
+                             command=event.command_name, collection=self._finish(event))
+
+    def failed(self, event):
+        collection = self._finish(event)
+        self.metrics.observe('mongo_command_seconds', event.duration_micros / 1e6,
+                             command=event.command_name, collection=collection)
+        self.metrics.inc('mongo_command_failures_total', command=event.command_name, collection=collection)
+
+
+def create_mongo_client(uri, metrics=None, **options):
+    """MongoClient with MONGO_* pool settings (overridden by options) and metrics listeners"""
+    settings = client_options_from_env()
+    settings.update(options)
+    if settings:
+        logger.info(f"MongoDB client options: {', '.join(f'{k}={v}' for k, v in sorted(settings.items()))}")
+    if metrics is not None:
+        settings['event_listeners'] = [PoolMetricsListener(metrics), CommandMetricsListener(metrics)]
+    return MongoClient(uri, **settings)
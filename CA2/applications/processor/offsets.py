@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Kafka Offset Tracking
+Commits consumed offsets only after the records they cover have been
+durably written, giving at-least-once delivery with one commit per batch.
+"""
+
+import logging
+from kafka.errors import CommitFailedError, IllegalStateError, KafkaError
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+COMMIT_MODE_AUTO = 'auto'
+COMMIT_MODE_BATCH = 'batch'
+
+
+def commit_mode_from_env(value):
+    """Normalise the KAFKA_COMMIT_MODE setting"""
+    mode = (value or COMMIT_MODE_AUTO).lower()
+    if mode not in (COMMIT_MODE_AUTO, COMMIT_MODE_BATCH):
+        logger.warning(f"Unknown commit mode '{value}', falling back to '{COMMIT_MODE_AUTO}'")
+        return COMMIT_MODE_AUTO
+    return mode
+
+
+class OffsetTracker:
+    """Remembers the first and last offset consumed per partition since the last commit"""
+
+    def __init__(self):
+        self._first = {}
+        self._last = {}
+
+    def track(self, message):
+        tp = TopicPartition(message.topic, message.partition)
+        self._first.setdefault(tp, message.offset)
+        self._last[tp] = message.offset
+
+    def __len__(self):
+        return len(self._last)
+
+    def pending(self):
+        """Offsets that would be committed, as {TopicPartition: next offset}"""
+        return {tp: offset + 1 for tp, offset in self._last.items()}
+
+    def clear(self):
+        self._first.clear()
+        self._last.clear()
+
+    def commit(self, consumer):
+        """Synchronously commit everything tracked so far; returns True on success"""
+        if not self._last:
+            return True
+        offsets = {tp: OffsetAndMetadata(offset, None) for tp, offset in self.pending().items()}
+        try:
+            consumer.commit(offsets=offsets)
+            return True
+        except CommitFailedError as e:
+            # Group rebalanced - the new owner will re-read from the last commit
+            logger.warning(f"Offset commit rejected after rebalance: {e}")
+            return False
+        except KafkaError as e:
+            logger.error(f"Offset commit failed: {e}")
+            return False
+        finally:
+            self.clear()
+
+    def rewind(self, consumer):
+        """Seek back to the first uncommitted offset so the records are redelivered"""
+        for tp, offset in self._first.items():
+            try:
+                consumer.seek(tp, offset)
+            except (IllegalStateError, AssertionError):
+                # Partition was revoked; its new owner resumes from the committed offset
+                pass
+        self.clear()
@@ -11,9 +11,6 @@ import time
 import logging
 from datetime import datetime
 from kafka import KafkaConsumer, KafkaProducer
-from kafka.errors import KafkaError
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import paho.mqtt.client as mqtt
 
 # Configure logging
@@ -60,18 +57,42 @@ class PlantCareProcessor:
         
         logger.info(f"Plant Care Processor {self.processor_id} initializing...")
 
-import json
 import time
 import logging
 from datetime import datetime
 from kafka import KafkaConsumer, KafkaProducer
-from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 import paho.mqtt.client as mqtt
 import os
 import threading
 from flask import Flask, jsonify
 import signal
 import sys
+import asyncio
+import queue
+from collections import deque
+from functools import partial
+from async_engine import AsyncProcessingEngine
+from codec import get_codec
+from wire_format import WireDecoder
+from processor_metrics import MetricsRegistry
+from offsets import COMMIT_MODE_BATCH, OffsetTracker, commit_mode_from_env
+from backpressure import PartitionBackpressure
+from consumer_lag import ConsumerLagMonitor
+from plant_cache import PlantProfileCache
+from plant_registry import PlantRegistrar, default_care_instructions, display_name
+from dead_letter import STAGE_PROCESS, STAGE_STORE, DeadLetterPublisher
+from worker_pool import KeyedWorkerPool
+from write_coalescer import WriteCoalescer
+from sensor_storage import SensorStorage
+from rollups import RollupWriter
+from retention import RetentionJob
+from index_registry import PLANT_MONITOR
+from rule_engine import MONITOR_METRICS, PLANT_MONITOR_RULES, RuleEngine, monitor_result
+from mongo_pool import create_mongo_client
+from window_stats import WindowStats
+from alert_state import AlertTracker
+from anomaly_detection import SensorAnomalyDetector
 
 # Configure logging
 logging.basicConfig(
@@ -83,6 +104,23 @@ logger = logging.getLogger(__name__)
 # Flask app for health checks
 app = Flask(__name__)
 
+# How long partitions stay paused after a failed batch is rewound for replay
+REPLAY_BACKOFF_SECONDS = 1.0
+
+class SinkBatch:
+    """Records handed to the sink thread together with the offsets they cover"""
+    
+    def __init__(self, generation, records, offsets):
+        self.generation = generation
+        self.records = records
+        self.offsets = offsets
+        self.stored = None
+
+# Pipeline metrics shared by the processor and the /metrics endpoint
+pipeline_metrics = MetricsRegistry()
+# The running processor, set in __main__ (the window statistics endpoint reads it)
+processor = None
+
 class PlantDataProcessor:
     def __init__(self):
         # Configuration from environment variables
@@ -93,6 +131,52 @@ class PlantDataProcessor:
         self.mqtt_host = self.mqtt_broker[0]
         self.mqtt_port = int(self.mqtt_broker[1]) if len(self.mqtt_broker) > 1 else 1883
         
+        # Batched consume-and-bulk-write mode
+        self.batch_enabled = os.getenv('BATCH_ENABLED', 'false').lower() == 'true'
+        self.batch_max_records = int(os.getenv('BATCH_MAX_RECORDS', '500'))
+        self.batch_max_linger_ms = int(os.getenv('BATCH_MAX_LINGER_MS', '250'))
+        self.alert_topic = os.getenv('KAFKA_ALERT_TOPIC', 'plant-alerts')
+        self.metrics = pipeline_metrics
+        # Alerts are emitted on state changes and reminders, not per reading (ALERT_DEDUP_ENABLED)
+        self.alert_tracker = AlertTracker.from_env(self.metrics)
+        
+        # Payload codec: auto (fastest installed), msgspec, orjson or json
+        self.codec = get_codec(os.getenv('PAYLOAD_CODEC', 'auto'))
+        # Records that fail to decode or process go to the dead-letter topic (DLQ_TOPIC, empty disables)
+        self.dlq = DeadLetterPublisher.from_env(
+            self.kafka_brokers, codec=self.codec, metrics=self.metrics, processor_id=os.getenv('HOSTNAME')
+        )
+        # Values are decoded per record so the content-type header can pick the wire format
+        self.wire = WireDecoder(self.codec, self.metrics, dead_letter=self.dlq)
+        
+        # Execution mode: 'sync' (per-message or batched loop) or 'async' (asyncio engine)
+        self.execution_mode = os.getenv('EXECUTION_MODE', 'sync').lower()
+        self.async_max_in_flight = int(os.getenv('ASYNC_MAX_IN_FLIGHT', '200'))
+        self.async_io_workers = int(os.getenv('ASYNC_IO_WORKERS', '16'))
+        
+        # Offset commits: 'auto' (timer) or 'batch' (after each acknowledged bulk write)
+        self.commit_mode = commit_mode_from_env(os.getenv('KAFKA_COMMIT_MODE'))
+        if self.commit_mode == COMMIT_MODE_BATCH and not self.batch_enabled and self.execution_mode != 'async':
+            logger.info("📦 KAFKA_COMMIT_MODE=batch requires batching - enabling batch mode")
+            self.batch_enabled = True
+        self.offsets = OffsetTracker()
+        self.lag_interval_ms = int(os.getenv('CONSUMER_LAG_INTERVAL_MS', '5000'))
+        self.lag_monitor = None
+        
+        # Backpressure (batch mode): bulk writes run on a sink thread; partitions are paused
+        # once this many records wait on MongoDB/MQTT and resumed when half have drained
+        self.backpressure_max_in_flight = int(os.getenv('BACKPRESSURE_MAX_IN_FLIGHT', '2000'))
+        self.backpressure_resume_ratio = float(os.getenv('BACKPRESSURE_RESUME_RATIO', '0.5'))
+        self.backpressure = None
+        self.sink = None
+        self.sink_results = queue.Queue()
+        self.sink_batches = deque()
+        # Bumped on every replay so batches dispatched before it are discarded
+        self.sink_generation = 0
+        # Partitions paused after a replay and when they resume (the poll loop keeps running)
+        self.replay_held = set()
+        self.replay_resume_at = None
+        
         # Plant care profiles for health analysis
         self.plant_profiles = {
             'monstera': {
@@ -117,21 +201,72 @@ class PlantDataProcessor:
             'sensor-data',  # Backward compatibility
             bootstrap_servers=self.kafka_brokers,
             group_id=self.consumer_group,
-            value_deserializer=lambda m: json.loads(m.decode('utf-8')),
             auto_offset_reset='latest',
-            enable_auto_commit=True
+            enable_auto_commit=self.commit_mode != COMMIT_MODE_BATCH
         )
         
         # Initialize Kafka producer for alerts
         self.producer = KafkaProducer(
             bootstrap_servers=self.kafka_brokers,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
+            value_serializer=self.codec.encode
         )
         
         # Initialize MongoDB client
-        self.mongo_client = MongoClient(self.mongo_url)
+        self.mongo_client = create_mongo_client(self.mongo_url, self.metrics)
         self.db = self.mongo_client.plant_monitoring
         
+        # Plain or time-series sensor_readings (SENSOR_STORAGE_MODE), bucketed by plantId
+        self.sensor_storage = SensorStorage.from_env(meta_field='plantId')
+        self.sensor_storage.ensure_collection(self.db, 'sensor_readings')
+        
+        # Per-plant minute/hour rollups, upserted in batches (ROLLUPS_ENABLED=false turns them off)
+        self.rollups = None
+        if os.getenv('ROLLUPS_ENABLED', 'true').lower() == 'true':
+            self.rollups = RollupWriter(
+                self.db, 'plant_id', self.metrics,
+                flush_interval=int(os.getenv('ROLLUP_FLUSH_INTERVAL_MS', '1000')) / 1000
+            )
+        
+        # Per-plant rolling statistics of recent readings, for trend rules (WINDOW_STATS_ENABLED=false turns them off)
+        self.window_stats = WindowStats.from_env(self.metrics)
+        # Stuck, spiking or implausible sensors become SENSOR_FAULT issues (ANOMALY_DETECTION_ENABLED)
+        self.anomalies = SensorAnomalyDetector.from_env(self.metrics)
+        
+        # Plant profiles are cached; edits arrive through a change stream (or polling on a standalone server)
+        self.plant_cache = PlantProfileCache(
+            self.db.plants,
+            'plant_id',
+            ttl=float(os.getenv('PLANT_CACHE_TTL_SECONDS', '300')),
+            max_size=int(os.getenv('PLANT_CACHE_MAX_SIZE', '10000')),
+            poll_interval=float(os.getenv('PLANT_CACHE_POLL_SECONDS', '30')),
+            metrics=self.metrics,
+            negative_ttl=float(os.getenv('PLANT_CACHE_NEGATIVE_TTL_SECONDS', '30'))
+        )
+        
+        # Unknown plants are registered with default care instructions (like the CA3 processor)
+        self.registrar = None
+        if os.getenv('PLANT_AUTO_REGISTER', 'false').lower() == 'true':
+            self.registrar = PlantRegistrar(self.db.plants, 'plant_id', self.build_plant_document, self.metrics)
+        
+        # Health rules per plant type (PLANT_RULES_FILE / plant_rules collection), hot-reloaded
+        self.rules = RuleEngine.from_env(
+            'plant-monitor', PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result, self.db, self.metrics
+        )
+        
+        # TTL indexes and downsampling of old readings (RETENTION_ENABLED=true)
+        self.retention = RetentionJob.from_env(
+            self.db,
+            {
+                'sensor_readings': 'timestamp' if self.sensor_storage.timeseries else 'processed_at',
+                'health_analysis': 'timestamp',
+                'alerts': 'timestamp'
+            },
+            plant_field='plantId',
+            key_field='plant_id',
+            timeseries=self.sensor_storage.timeseries,
+            metrics=self.metrics
+        )
+        
         # Initialize MQTT client for Home Assistant
         self.mqtt_client = mqtt.Client(client_id="plant-processor")
         self.mqtt_client.on_connect = self.on_mqtt_connect
@@ -147,11 +282,22 @@ class PlantDataProcessor:
         
         # Initialize database
         self.initialize_database()
+        # Indexes for every query this processor issues, and a COLLSCAN check of their plans (INDEX_CHECK)
+        PLANT_MONITOR.apply(self.db, self.metrics)
+        self.plant_cache.start()
+        self.rules.start()
+        if self.window_stats:
+            self.window_stats.start()
+        if self.retention:
+            self.retention.start()
         
         logger.info(f"🌱 Plant Processor initialized")
         logger.info(f"📡 Kafka brokers: {self.kafka_brokers}")
         logger.info(f"🗄️ MongoDB URL: {self.mongo_url}")
         logger.info(f"📨 MQTT Broker: {self.mqtt_host}:{self.mqtt_port}")
+        logger.info(f"🧬 Payload codec: {self.codec.name}")
+        if self.batch_enabled:
+            logger.info(f"📦 Batch mode: up to {self.batch_max_records} records, {self.batch_max_linger_ms}ms linger, {self.commit_mode} commits")
 
     def initialize_database(self):
         """Initialize MongoDB with plant configurations"""
@@ -246,144 +392,345 @@ class PlantDataProcessor:
         if sensor['icon']:
             config['icon'] = sensor['icon']
 
-        self.mqtt_client.publish(discovery_topic, json.dumps(config), retain=True)
+        self.mqtt_client.publish(discovery_topic, self.codec.encode(config), retain=True)
 
-    def process_sensor_data(self, data):
+    def process_sensor_data(self, data, record=None):
         """Process individual sensor data record"""
+        # Alerts decided for this reading and not yet published
+        alerts = []
         try:
             logger.info(f"📊 Processing data for {data.get('plantId')}: {data.get('sensors', {})}")
             
             # Add processing metadata
-            processed_data = {
-                **data,
-                'processed_at': datetime.utcnow(),
-                'processor_version': '2.0.0'
-            }
+            processed_data = self.build_sensor_document(data)
             
-            # Store raw sensor data
-            result = self.db.sensor_readings.insert_one(processed_data)
-            logger.info(f"💾 Stored sensor data: {result.inserted_id}")
+            # Reading, analysis and alerts go out together - one bulk write per collection
+            writes = WriteCoalescer(self.db, self.metrics)
+            writes.insert('sensor_readings', processed_data, 0)
             
             # Get plant configuration
-            plant = self.db.plants.find_one({'plant_id': data.get('plantId')})
+            plant = self.get_plant(data)
             
+            health_analysis = None
             if plant:
                 # Analyze plant health
-                health_analysis = self.analyze_health(data, plant['care_instructions'])
-                
-                # Store health analysis
-                self.db.health_analysis.insert_one({
+                health_analysis = self.analyze_health(data, plant['care_instructions'], self.update_window_stats(data))
+                writes.insert('health_analysis', {
                     'plant_id': data.get('plantId'),
                     'timestamp': datetime.utcnow(),
                     **health_analysis
-                })
-                
+                }, 0)
+                alerts = self.build_alerts(data.get('plantId'), health_analysis)
+                # The bulk write adds _id to the documents, so Kafka gets copies
+                writes.insert_many('alerts', [dict(alert) for alert in alerts], 0)
                 logger.info(f"🌡️ Health analysis for {data.get('plantId')}: Score={health_analysis['health_score']}, Status={health_analysis['status']}")
-                
+            else:
+                self.metrics.inc('unknown_plant_readings_total')
+            
+            rejected = []
+            writes.flush(on_error=lambda tag, error: rejected.append(error))
+            if rejected:
+                raise rejected[0]
+            logger.info(f"💾 Stored sensor data: {processed_data['_id']}")
+            
+            if self.rollups:
+                self.add_rollup(data, health_analysis)
+                self.rollups.maybe_flush()
+            
+            if health_analysis:
                 # Send alerts if necessary
-                if health_analysis['issues']:
-                    self.send_alerts(data.get('plantId'), health_analysis)
+                self.publish_alerts(alerts)
+                alerts = []
                 
                 # Update Home Assistant
-                self.update_home_assistant(data.get('plantId'), {
-                    'moisture': data.get('sensors', {}).get('soilMoisture', 0),
-                    'health': health_analysis['health_score'],
-                    'light': data.get('sensors', {}).get('lightLevel', 0),
-                    'temperature': data.get('sensors', {}).get('temperature', 0),
-                    'humidity': data.get('sensors', {}).get('humidity', 0),
-                    'status': health_analysis['status'],
-                    'battery': data.get('metadata', {}).get('batteryLevel', 100)
-                })
-            else:
-                logger.warning(f"⚠️ No plant configuration found for {data.get('plantId')}")
+                self.update_home_assistant(data.get('plantId'), self.build_ha_state(data, health_analysis))
+            
+            self.metrics.inc('messages_processed_total')
                 
         except Exception as e:
             logger.error(f"❌ Error processing sensor data: {e}")
+            # Alerts that were not both stored and published are decided again by the next reading
+            self.rollback_alerts(alerts)
+            if self.dlq and record is not None:
+                self.dlq.publish(record, e, STAGE_STORE if isinstance(e, PyMongoError) else STAGE_PROCESS)
 
-    def analyze_health(self, data, care_instructions):
-        """Analyze plant health based on sensor data and care instructions"""
+    def get_plant(self, data):
+        """Plant configuration for a reading, auto-registering unknown plants when enabled"""
+        plant_id = data.get('plantId')
+        plant = self.plant_cache.get(plant_id)
+        if plant is None and self.registrar and isinstance(plant_id, str):
+            plant = self.registrar.register(data)
+            if plant is not None:
+                self.plant_cache.put(plant_id, plant)
+        return plant
+
+    def build_plant_document(self, data):
+        """plants document for an auto-registered plant"""
+        plant_type = data.get('plantType') or 'unknown'
+        care_instructions = self.plant_profiles.get(plant_type)
+        if care_instructions is None:
+            defaults = default_care_instructions(plant_type)
+            care_instructions = {
+                'moisture_min': defaults['moistureMin'],
+                'moisture_max': defaults['moistureMax'],
+                'light_min': defaults['lightMin'],
+                'temp_min': defaults['temperatureMin'],
+                'temp_max': defaults['temperatureMax']
+            }
+        return {
+            'plant_id': data['plantId'],
+            'name': display_name(data['plantId'], plant_type),
+            'type': plant_type,
+            'location': data.get('location') or 'Unknown Location',
+            'care_instructions': dict(care_instructions),
+            'added_at': datetime.utcnow(),
+            'auto_registered': True
+        }
+
+    def build_sensor_document(self, data, processed_at=None):
+        """sensor_readings document for a reading"""
+        return self.sensor_storage.document({
+            **data,
+            'processed_at': processed_at or datetime.utcnow(),
+            'processor_version': '2.0.0'
+        })
+
+    def add_rollup(self, data, health_analysis=None):
+        """Fold a stored reading into its plant's minute/hour rollups"""
+        sensors = data.get('sensors') or {}
+        self.rollups.add(data.get('plantId'), data.get('timestamp'), {
+            'moisture': sensors.get('soilMoisture'),
+            'light': sensors.get('lightLevel'),
+            'temperature': sensors.get('temperature'),
+            'humidity': sensors.get('humidity'),
+            'health': health_analysis['health_score'] if health_analysis else None
+        })
+
+    def build_ha_state(self, data, health_analysis):
+        """Build the Home Assistant state payload for a reading"""
         sensors = data.get('sensors', {})
-        health_score = 100
-        issues = []
-        
-        # Moisture analysis
-        moisture = sensors.get('soilMoisture', 50)
-        if moisture < care_instructions['moisture_min']:
-            issues.append({
-                'type': 'WATER_NEEDED',
-                'severity': 'HIGH',
-                'message': f'Soil moisture too low: {moisture}% (needs {care_instructions["moisture_min"]}%+)'
-            })
-            health_score -= 30
-        elif moisture > care_instructions['moisture_max']:
-            issues.append({
-                'type': 'OVERWATERED',
-                'severity': 'MEDIUM',
-                'message': f'Soil moisture too high: {moisture}% (max {care_instructions["moisture_max"]}%)'
-            })
-            health_score -= 20
-        
-        # Light analysis
-        light = sensors.get('lightLevel', 0)
-        if light < care_instructions['light_min']:
-            issues.append({
-                'type': 'INSUFFICIENT_LIGHT',
-                'severity': 'MEDIUM',
-                'message': f'Light level too low: {light} lux (needs {care_instructions["light_min"]}+ lux)'
-            })
-            health_score -= 15
-            
-        # Temperature analysis
-        temp = sensors.get('temperature', 20)
-        if temp < care_instructions['temp_min'] or temp > care_instructions['temp_max']:
-            issues.append({
-                'type': 'TEMPERATURE_STRESS',
-                'severity': 'LOW',
-                'message': f'Temperature {temp}°C outside optimal range ({care_instructions["temp_min"]}-{care_instructions["temp_max"]}°C)'
-            })
-            health_score -= 10
-        
-        # Battery warning
-        battery = data.get('metadata', {}).get('batteryLevel', 100)
-        if battery < 20:
-            issues.append({
-                'type': 'LOW_BATTERY',
-                'severity': 'LOW',
-                'message': f'Sensor battery low: {battery}%'
-            })
-            health_score -= 5
-        
-        status = 'healthy' if health_score > 80 else 'needs_attention' if health_score > 60 else 'critical'
-        
         return {
-            'health_score': max(0, health_score),
-            'status': status,
-            'issues': issues,
-            'analyzed_at': datetime.utcnow()
+            'moisture': sensors.get('soilMoisture', 0),
+            'health': health_analysis['health_score'],
+            'light': sensors.get('lightLevel', 0),
+            'temperature': sensors.get('temperature', 0),
+            'humidity': sensors.get('humidity', 0),
+            'status': health_analysis['status'],
+            'battery': data.get('metadata', {}).get('batteryLevel', 100)
         }
 
-    def send_alerts(self, plant_id, health_analysis):
-        """Send alerts for plant health issues"""
+    def process_batch(self, readings, on_error=None):
+        """
+        Process a batch of readings with one bulk write per collection.
+        A reading that cannot be processed, or whose documents MongoDB
+        rejects, is skipped and reported to on_error(index, exception)
+        rather than failing the whole batch.
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        
+        # One plant lookup for the whole batch instead of one per reading
+        plant_ids = list({
+            data.get('plantId') for data in readings
+            if isinstance(data, dict) and isinstance(data.get('plantId'), str)
+        })
+        plants = self.plant_cache.get_many(plant_ids)
+        if self.registrar and len(plants) < len(plant_ids):
+            for data in readings:
+                plant_id = data.get('plantId') if isinstance(data, dict) else None
+                if isinstance(plant_id, str) and plant_id not in plants:
+                    plant = self.get_plant(data)
+                    if plant is not None:
+                        plants[plant_id] = plant
+        
+        writes = WriteCoalescer(self.db, self.metrics)
+        stored = 0
+        analyses = 0
+        kafka_alerts = []
+        ha_states = {}
+        rollup_inputs = []
+        for index, data in enumerate(readings):
+            try:
+                plant_id = data.get('plantId')
+                sensor_doc = self.build_sensor_document(data, now)
+                plant = plants.get(plant_id)
+                health_analysis = self.analyze_health(
+                    data, plant['care_instructions'], self.update_window_stats(data)
+                ) if plant else None
+            except Exception as e:
+                self.metrics.inc('invalid_readings_total')
+                if on_error:
+                    on_error(index, e)
+                else:
+                    logger.error(f"❌ Skipping unprocessable reading: {e}")
+                continue
+            
+            # Documents are tagged with the reading's index so rejections map back to it
+            writes.insert('sensor_readings', sensor_doc, index)
+            stored += 1
+            rollup_inputs.append((index, data, health_analysis))
+            if not plant:
+                self.metrics.inc('unknown_plant_readings_total')
+                continue
+            
+            writes.insert('health_analysis', {
+                'plant_id': plant_id,
+                'timestamp': now,
+                **health_analysis
+            }, index)
+            analyses += 1
+            alerts = self.build_alerts(plant_id, health_analysis, now)
+            writes.insert_many('alerts', [dict(alert) for alert in alerts], index)
+            kafka_alerts.extend((index, alert) for alert in alerts)
+            
+            # Home Assistant only needs the latest state per plant
+            ha_states[plant_id] = (index, self.build_ha_state(data, health_analysis))
+        
+        # Bulk writes - one round trip per collection; rejected readings are reported individually
+        queued = len(writes)
         try:
-            for issue in health_analysis['issues']:
-                # Store alert in MongoDB
-                self.db.alerts.insert_one({
-                    'plant_id': plant_id,
-                    'timestamp': datetime.utcnow(),
-                    **issue
-                })
-                
-                # Send to Kafka alerts topic
-                alert = {
-                    'plant_id': plant_id,
-                    'timestamp': datetime.utcnow().isoformat(),
-                    **issue
-                }
-                
-                self.producer.send(os.getenv('KAFKA_ALERT_TOPIC', 'plant-alerts'), alert)
-                logger.info(f"🚨 Alert sent for {plant_id}: {issue['message']}")
+            rejected = writes.flush(on_error=on_error)
+            
+            # Rollups only count stored readings, and are written before the batch is acknowledged
+            if self.rollups:
+                for index, data, health_analysis in rollup_inputs:
+                    if index not in rejected:
+                        self.add_rollup(data, health_analysis)
+                self.rollups.flush()
+            
+            sent = [alert for index, alert in kafka_alerts if index not in rejected]
+            self.publish_alerts(sent)
+        except Exception:
+            # The batch is replayed and its alerts decided again
+            self.rollback_alerts([alert for _, alert in kafka_alerts])
+            raise
+        # Alerts of rejected readings were never stored
+        self.rollback_alerts([alert for index, alert in kafka_alerts if index in rejected])
+        kafka_alerts = sent
+        for plant_id, (index, state) in ha_states.items():
+            if index not in rejected:
+                self.update_home_assistant(plant_id, state)
+        
+        flush_seconds = time.monotonic() - started
+        self.metrics.observe('batch_size', len(readings))
+        self.metrics.observe('batch_flush_seconds', flush_seconds)
+        self.metrics.inc('messages_processed_total', stored - len(rejected))
+        self.metrics.inc('alerts_generated_total', len(kafka_alerts))
+        logger.info(f"💾 Flushed batch of {len(readings)} readings ({analyses} analyses, {queued} documents, "
+                    f"{len(rejected)} rejected) in {flush_seconds * 1000:.1f}ms")
+
+    async def process_sensor_data_async(self, message, engine):
+        """Async variant of process_sensor_data used by the asyncio engine"""
+        data = message.value
+        plant_id = data.get('plantId')
+        processed_data = self.build_sensor_document(data)
+        
+        plant = await engine.run_blocking(self.get_plant, data)
+        writes = WriteCoalescer(self.db, self.metrics)
+        writes.insert('sensor_readings', processed_data, 0)
+        health_analysis = None
+        alerts = []
+        if plant:
+            health_analysis = self.analyze_health(
+                data, plant['care_instructions'], self.update_window_stats(data)
+            )
+            writes.insert('health_analysis', {
+                'plant_id': plant_id,
+                'timestamp': datetime.utcnow(),
+                **health_analysis
+            }, 0)
+            alerts = self.build_alerts(plant_id, health_analysis)
+            writes.insert_many('alerts', [dict(alert) for alert in alerts], 0)
+        else:
+            self.metrics.inc('unknown_plant_readings_total')
+        
+        try:
+            rejected = []
+            await engine.run_blocking(writes.flush, on_error=lambda tag, error: rejected.append(error))
+            if rejected:
+                raise rejected[0]
+        except Exception:
+            # Decided again when the reading is replayed (or by the plant's next reading)
+            self.rollback_alerts(alerts)
+            raise
+        
+        if self.rollups:
+            # With batch commits a stored reading can still be replayed - count it once committed
+            engine.after_commit(message, partial(self.add_rollup, data, health_analysis))
+            if self.rollups.due():
+                await engine.run_blocking(self.rollups.maybe_flush)
+        if not plant:
+            return
+        
+        stages = [
+            engine.run_blocking(self.update_home_assistant, plant_id, self.build_ha_state(data, health_analysis))
+        ]
+        if alerts:
+            stages.append(engine.run_blocking(self.publish_alerts, alerts))
+        try:
+            await asyncio.gather(*stages)
+        except Exception:
+            self.rollback_alerts(alerts)
+            raise
+
+    def route_key(self, message):
+        """Readings of one plant are processed in order"""
+        if message.key:
+            return message.key
+        # A value that did not decode to an object still reaches the handler, which dead-letters it
+        plant_id = message.value.get('plantId') if isinstance(message.value, dict) else None
+        return plant_id if plant_id is not None else message.partition
+
+    def update_window_stats(self, data):
+        """Fold a reading into its plant's window statistics; returns them for the analyzer (None if disabled)"""
+        if not self.window_stats:
+            return None
+        return self.window_stats.update(data.get('plantId'), data)
+
+    def analyze_health(self, data, care_instructions, stats=None):
+        """Analyze plant health based on sensor data and care instructions"""
+        health_analysis = self.rules.analyze(data, care_instructions, stats)
+        if self.anomalies:
+            # Sensor faults are issues like any other, so they are stored and alerted on the same path
+            health_analysis['issues'].extend(self.anomalies.check(data.get('plantId'), data))
+        return health_analysis
+
+    def build_alerts(self, plant_id, health_analysis, timestamp=None):
+        """
+        Alert documents for a health analysis's issues. With alert
+        deduplication this advances the plant's alert states, so call it
+        once per analysis: only raised, reminder and resolved alerts are
+        returned.
+        """
+        timestamp = timestamp or datetime.utcnow()
+        issues = health_analysis['issues']
+        if self.alert_tracker:
+            issues = self.alert_tracker.update(plant_id, issues)
+        return [{'plant_id': plant_id, 'timestamp': timestamp, **issue} for issue in issues]
+
+    def rollback_alerts(self, alerts):
+        """Undo the alert states of alerts (from build_alerts) that were not stored and published"""
+        if not self.alert_tracker:
+            return
+        # Latest first, so each state goes back to before its earliest undone alert
+        for alert in reversed(alerts):
+            self.alert_tracker.rollback(alert['plant_id'], [alert])
+
+    def publish_alerts(self, alerts):
+        """Send alerts to the Kafka alerts topic"""
+        for alert in alerts:
+            self.producer.send(self.alert_topic, alert)
+            logger.info(f"🚨 Alert sent for {alert['plant_id']}: {alert['message']}")
+
+    def send_alerts(self, alerts):
+        """Store and send alert documents (from build_alerts)"""
+        try:
+            # Store all of the reading's alerts in one round trip
+            self.db.alerts.insert_many([dict(alert) for alert in alerts], ordered=False)
+            self.publish_alerts(alerts)
         except Exception as e:
             logger.error(f"❌ Error sending alerts: {e}")
+            self.rollback_alerts(alerts)
 
     def update_home_assistant(self, plant_id, data):
         """Update Home Assistant via MQTT"""
@@ -391,10 +738,10 @@ class PlantDataProcessor:
             topic = f"homeassistant/sensor/{plant_id.replace('-', '_')}/state"
             payload = {
                 **data,
-                'last_updated': datetime.utcnow().isoformat()
+                'last_updated': datetime.utcnow()
             }
             
-            self.mqtt_client.publish(topic, json.dumps(payload))
+            self.mqtt_client.publish(topic, self.codec.encode(payload))
             logger.info(f"📡 Updated Home Assistant for {plant_id}")
         except Exception as e:
             logger.error(f"❌ Error updating Home Assistant: {e}")
@@ -402,10 +749,19 @@ class PlantDataProcessor:
     def run(self):
         """Main processing loop"""
         logger.info("🚀 Starting plant data processor...")
+        self.lag_monitor = ConsumerLagMonitor(self.consumer, self.metrics, self.lag_interval_ms)
         
         try:
-            for message in self.consumer:
-                self.process_sensor_data(message.value)
+            if self.execution_mode == 'async':
+                self.run_async()
+            elif self.batch_enabled:
+                self.run_batched()
+            else:
+                for message in self.consumer:
+                    self.lag_monitor.maybe_update()
+                    record = self.wire.decode_record(message)
+                    if record:
+                        self.process_sensor_data(record.value, record)
                 
         except KeyboardInterrupt:
             logger.info("🛑 Received interrupt signal")
@@ -414,12 +770,192 @@ class PlantDataProcessor:
         finally:
             self.cleanup()
 
+    def run_async(self):
+        """Process messages concurrently with the asyncio engine"""
+        logger.info(f"⚡ Async mode: up to {self.async_max_in_flight} messages in flight, {self.commit_mode} commits")
+        engine = AsyncProcessingEngine(
+            self.consumer,
+            self.process_sensor_data_async,
+            key_fn=self.route_key,
+            max_in_flight=self.async_max_in_flight,
+            io_workers=self.async_io_workers,
+            commit_mode=self.commit_mode,
+            metrics=self.metrics,
+            decoder=self.wire.decode_record,
+            lag_monitor=self.lag_monitor,
+            dead_letter=self.dlq
+        )
+        asyncio.run(engine.run())
+
+    def run_batched(self):
+        """Poll records in batches and hand them to the sink thread when full or the linger expires"""
+        self.backpressure = PartitionBackpressure(
+            self.consumer,
+            self.backpressure_max_in_flight,
+            resume_ratio=self.backpressure_resume_ratio,
+            metrics=self.metrics
+        )
+        # Unbounded queue - the backpressure bound is what limits it
+        self.sink = KeyedWorkerPool(self.write_batch, 1, queue_size=0, metrics=self.metrics, name='sink')
+        pending = []
+        deadline = None
+        
+        while True:
+            self.resume_replay()
+            if deadline is None:
+                timeout_ms = self.batch_max_linger_ms
+            else:
+                timeout_ms = max(0, int((deadline - time.monotonic()) * 1000))
+            if self.replay_resume_at is not None:
+                timeout_ms = min(timeout_ms, max(0, int((self.replay_resume_at - time.monotonic()) * 1000)))
+            
+            records = self.consumer.poll(
+                timeout_ms=self.backpressure.poll_timeout_ms(timeout_ms),
+                max_records=self.batch_max_records - len(pending)
+            )
+            self.lag_monitor.maybe_update()
+            for messages in records.values():
+                for message in messages:
+                    self.offsets.track(message)
+                    record = self.wire.decode_record(message)
+                    if record:
+                        self.backpressure.acquire(record)
+                        pending.append(record)
+            
+            if not self.complete_batches():
+                # A write failed and everything after it is being replayed
+                for record in pending:
+                    self.backpressure.release(record)
+                pending = []
+                deadline = None
+            self.backpressure.update()
+            
+            if not pending:
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.batch_max_linger_ms / 1000.0
+            
+            if len(pending) >= self.batch_max_records or time.monotonic() >= deadline:
+                self.flush_batch(pending)
+                pending = []
+                deadline = None
+
+    def flush_batch(self, records):
+        """Queue a batch for the sink thread along with the offsets it covers"""
+        batch = SinkBatch(self.sink_generation, records, self.offsets)
+        self.offsets = OffsetTracker()
+        self.sink_batches.append(batch)
+        self.sink.submit(0, batch)
+
+    def write_batch(self, batch):
+        """Sink thread: bulk write a batch and report whether MongoDB acknowledged it"""
+        try:
+            if batch.generation != self.sink_generation:
+                # Queued before a replay - these records will be delivered again
+                batch.stored = False
+                return
+            readings = [record.value for record in batch.records]
+            try:
+                self.process_batch(readings, on_error=partial(self.dead_letter_reading, batch.records))
+                batch.stored = True
+            except PyMongoError as e:
+                self.metrics.inc('batch_failures_total', stage='store')
+                logger.error(f"❌ MongoDB write failed for batch of {len(readings)} readings: {e}")
+                batch.stored = False
+                if self.dlq and self.commit_mode != COMMIT_MODE_BATCH:
+                    # Auto commits will not replay the batch - keep it for a re-drive instead
+                    for record in batch.records:
+                        self.dlq.publish(record, e, STAGE_STORE)
+            except Exception as e:
+                self.metrics.inc('batch_failures_total', stage='process')
+                logger.error(f"❌ Error processing batch of {len(readings)} readings: {e}")
+                batch.stored = False
+                if self.dlq and self.commit_mode != COMMIT_MODE_BATCH:
+                    for record in batch.records:
+                        self.dlq.publish(record, e, STAGE_PROCESS)
+        finally:
+            for record in batch.records:
+                self.backpressure.release(record)
+            self.sink_results.put(batch)
+
+    def dead_letter_reading(self, records, index, error):
+        """process_batch error callback: dead-letter the failing record"""
+        if self.dlq:
+            self.dlq.publish(records[index], error, STAGE_STORE if isinstance(error, PyMongoError) else STAGE_PROCESS)
+        else:
+            logger.error(f"❌ Skipping unprocessable reading: {error}")
+
+    def complete_batches(self):
+        """
+        Commit the offsets of batches the sink thread has finished, in order.
+        Returns False if a write failed and the consumer was rewound.
+        """
+        while True:
+            try:
+                batch = self.sink_results.get_nowait()
+            except queue.Empty:
+                return True
+            if batch.generation != self.sink_generation:
+                continue
+            # One sink thread, so batches finish in the order they were queued
+            self.sink_batches.popleft()
+            
+            if self.commit_mode != COMMIT_MODE_BATCH:
+                continue
+            if batch.stored:
+                if self.dlq:
+                    # Dead-lettered records must be durable before their offsets are committed
+                    self.dlq.flush()
+                with self.metrics.timer('offset_commit_seconds'):
+                    committed = batch.offsets.commit(self.consumer)
+                self.metrics.inc('offset_commits_total', status='success' if committed else 'failed')
+                continue
+            
+            # Nothing after the failed batch may be committed - replay all of it.
+            # Rewinding newest first leaves every partition at its earliest offset.
+            self.sink_generation += 1
+            self.offsets.rewind(self.consumer)
+            for later in reversed(self.sink_batches):
+                later.offsets.rewind(self.consumer)
+            batch.offsets.rewind(self.consumer)
+            self.sink_batches.clear()
+            self.hold_for_replay()
+            return False
+
+    def hold_for_replay(self):
+        """Keep the rewound partitions paused for a moment so a failing sink is not hammered"""
+        self.replay_held = set(self.consumer.assignment())
+        for tp in self.replay_held:
+            self.backpressure.hold(tp)
+        self.replay_resume_at = time.monotonic() + REPLAY_BACKOFF_SECONDS
+
+    def resume_replay(self):
+        """Resume the partitions held by hold_for_replay() once its deadline has passed"""
+        if self.replay_resume_at is None or time.monotonic() < self.replay_resume_at:
+            return
+        for tp in self.replay_held:
+            self.backpressure.unhold(tp)
+        self.replay_held = set()
+        self.replay_resume_at = None
+
     def cleanup(self):
         """Clean up resources"""
         logger.info("🧹 Cleaning up resources...")
         try:
+            if self.sink:
+                self.sink.stop()
+            if self.rollups:
+                self.rollups.flush()
+            if self.retention:
+                self.retention.stop()
+            self.rules.stop()
+            if self.window_stats:
+                self.window_stats.stop()
+            self.plant_cache.stop()
             self.consumer.close()
             self.producer.close()
+            if self.dlq:
+                self.dlq.close()
             self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
             self.mongo_client.close()
@@ -443,9 +979,25 @@ def metrics():
     return jsonify({
         'uptime': time.time(),
         'service': 'plant-data-processor',
-        'version': '2.0.0'
+        'version': '2.0.0',
+        'pipeline': pipeline_metrics.to_dict()
     })
 
+@app.route('/metrics/windows')
+@app.route('/metrics/windows/<plant_id>')
+def window_statistics(plant_id=None):
+    window_stats = processor.window_stats if processor else None
+    if not window_stats:
+        return jsonify({'error': 'window statistics are disabled'}), 404
+    summary = window_stats.summary(plant_id)
+    if summary is None:
+        return jsonify({'error': f'no statistics for {plant_id}'}), 404
+    return jsonify({'windows': list(window_stats.windows), 'plants' if plant_id is None else plant_id: summary})
+
+@app.route('/metrics/prometheus')
+def metrics_prometheus():
+    return pipeline_metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
 def signal_handler(signum, frame):
     logger.info("🛑 Received shutdown signal")
     processor.cleanup()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Plant Profile Cache
+In-memory cache of plant documents so a reading does not cost a plants
+lookup. Entries expire after a TTL and the least recently used ones are
+evicted beyond a size bound. Plant IDs with no document are remembered
+for a shorter negative TTL, so readings from an unregistered sensor do not
+each cost a lookup.
+
+A MongoDB change stream on the plants collection keeps cached entries
+current, so profile edits apply without a restart. Change streams need a
+replica set; on a standalone server (or without the permission) the cache
+falls back to re-reading its cached entries on an interval. Other errors,
+like the server being unreachable at startup, are retried with backoff.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Largest $in list sent when polling
+_POLL_CHUNK = 500
+# OperationFailure codes meaning change streams cannot be used:
+# not a replica set ($changeStream unsupported) and unauthorized
+_CHANGE_STREAM_UNSUPPORTED = (40573, 13)
+# Longest wait between attempts to open the change stream, in seconds
+_MAX_WATCH_BACKOFF = 30
+
+
+class PlantProfileCache:
+    """Plant documents by ID with TTL and LRU eviction"""
+
+    def __init__(self, collection, key_field, ttl=300, max_size=10000, poll_interval=30,
+                 metrics=None, name='plant_cache', negative_ttl=30):
+        self.collection = collection
+        self.key_field = key_field
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.poll_interval = poll_interval
+        self.metrics = metrics
+        self.name = name
+        self._lock = threading.Lock()
+        # plant ID -> (document or None, expires_at), least recently used first
+        self._entries = OrderedDict()
+        # MongoDB _id -> plant ID, to resolve change stream deletes
+        self._ids = {}
+        self._stopping = threading.Event()
+        self._thread = None
+        self.mode = None
+
+    def get(self, plant_id):
+        """Plant document for an ID, or None if there is no such plant"""
+        if self.ttl <= 0:
+            return self.collection.find_one({self.key_field: plant_id})
+        found, plant = self._lookup(plant_id)
+        if found:
+            return plant
+        plant = self.collection.find_one({self.key_field: plant_id})
+        if plant is not None:
+            self._store(plant_id, plant)
+        else:
+            self._store_missing(plant_id)
+        return plant
+
+    def get_many(self, plant_ids):
+        """{plant ID: document} for the IDs that exist, with one query for all misses"""
+        plants = {}
+        misses = []
+        for plant_id in plant_ids:
+            found, plant = self._lookup(plant_id) if self.ttl > 0 else (False, None)
+            if not found:
+                misses.append(plant_id)
+            elif plant is not None:
+                plants[plant_id] = plant
+        if misses:
+            for plant in self.collection.find({self.key_field: {'$in': misses}}):
+                plant_id = plant[self.key_field]
+                plants[plant_id] = plant
+                if self.ttl > 0:
+                    self._store(plant_id, plant)
+            if self.ttl > 0:
+                for plant_id in misses:
+                    if plant_id not in plants:
+                        self._store_missing(plant_id)
+        return plants
+
+    def put(self, plant_id, plant):
+        """Cache a document the caller just wrote, replacing any negative entry"""
+        if self.ttl > 0:
+            self._store(plant_id, plant)
+
+    def invalidate(self, plant_id, reason='invalidated'):
+        with self._lock:
+            entry = self._entries.pop(plant_id, None)
+            if entry is not None:
+                self._forget_id(entry[0])
+        if entry is not None:
+            self._count('evictions_total', reason=reason)
+        self._report_size()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ids.clear()
+        self._report_size()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, plant_id):
+        """(found, document) from the cache alone"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(plant_id)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(plant_id)
+                    hit = True
+                else:
+                    del self._entries[plant_id]
+                    self._forget_id(entry[0])
+                    hit = None
+            else:
+                hit = False
+        if hit:
+            self._count('hits_total' if entry[0] is not None else 'negative_hits_total')
+            return True, entry[0]
+        if hit is None:
+            self._count('evictions_total', reason='expired')
+        self._count('misses_total')
+        return False, None
+
+    def _store(self, plant_id, plant, ttl=None):
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(plant_id, None)
+            if old is not None:
+                self._forget_id(old[0])
+            self._entries[plant_id] = (plant, time.monotonic() + (self.ttl if ttl is None else ttl))
+            if plant is not None and '_id' in plant:
+                self._ids[plant['_id']] = plant_id
+            while len(self._entries) > self.max_size:
+                _, (evicted_plant, _) = self._entries.popitem(last=False)
+                self._forget_id(evicted_plant)
+                evicted += 1
+        if evicted:
+            self._count('evictions_total', evicted, reason='size')
+        self._report_size()
+
+    def _store_missing(self, plant_id):
+        if self.negative_ttl <= 0 or self.ttl <= 0:
+            return
+        self._store(plant_id, None, min(self.negative_ttl, self.ttl))
+        logger.warning(f"No plant configuration found for {plant_id} - "
+                       f"not looking it up again for {min(self.negative_ttl, self.ttl)}s")
+
+    def _forget_id(self, plant):
+        if plant is not None and '_id' in plant:
+            self._ids.pop(plant['_id'], None)
+
+    def _refresh(self, plant_id, plant, source):
+        """
+        Apply a changed document to a cached plant, keeping its expiry and LRU
+        position. A plant that was cached as missing gets the full TTL.
+        """
+        with self._lock:
+            entry = self._entries.get(plant_id)
+            if entry is None:
+                return
+            self._forget_id(entry[0])
+            expires_at = entry[1] if entry[0] is not None else time.monotonic() + self.ttl
+            self._entries[plant_id] = (plant, expires_at)
+            if '_id' in plant:
+                self._ids[plant['_id']] = plant_id
+        self._count('refreshes_total', source=source)
+
+    # Keeping entries current
+
+    def start(self):
+        """Follow changes to the plants collection from a background thread"""
+        if self.ttl <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._follow_changes, name=f'{self.name}-watch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _follow_changes(self):
+        backoff = 1
+        while not self._stopping.is_set():
+            try:
+                with self.collection.watch(full_document='updateLookup', max_await_time_ms=1000) as stream:
+                    backoff = 1
+                    if self.mode != 'change_stream':
+                        self._set_mode('change_stream')
+                        logger.info(f"Plant cache following the {self.collection.name} change stream")
+                    while not self._stopping.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self._apply_change(change)
+            except OperationFailure as e:
+                if e.code not in _CHANGE_STREAM_UNSUPPORTED:
+                    backoff = self._watch_failed(e, backoff)
+                    continue
+                # Standalone server (or no permission) - change streams are not available
+                logger.warning(f"Plant cache change stream unavailable ({e}); "
+                               f"polling every {self.poll_interval}s instead")
+                self._set_mode('poll')
+                self._poll_changes()
+                return
+            except PyMongoError as e:
+                # Connection errors (ServerSelectionTimeoutError, AutoReconnect, ...) - retry the watch
+                backoff = self._watch_failed(e, backoff)
+
+    def _watch_failed(self, error, backoff):
+        """Wait before reopening the change stream; returns the next backoff"""
+        if self.mode == 'change_stream':
+            # pymongo already retried resumable errors - events may have been missed, so start over
+            logger.warning(f"Plant cache change stream interrupted: {error}")
+            self.clear()
+        else:
+            logger.warning(f"Plant cache change stream not open yet ({error}); retrying in {backoff}s")
+        self._stopping.wait(backoff)
+        return min(backoff * 2, _MAX_WATCH_BACKOFF)
+
+    def _apply_change(self, change):
+        operation = change.get('operationType')
+        if operation in ('insert', 'update', 'replace'):
+            plant = change.get('fullDocument')
+            if plant is not None:
+                self._refresh(plant.get(self.key_field), plant, 'change_stream')
+                return
+        if operation in ('update', 'replace', 'delete'):
+            with self._lock:
+                plant_id = self._ids.get(change.get('documentKey', {}).get('_id'))
+            if plant_id is not None:
+                self.invalidate(plant_id)
+        elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            self.clear()
+
+    def _poll_changes(self):
+        """Fallback: re-read every cached plant on an interval"""
+        while not self._stopping.wait(self.poll_interval):
+            with self._lock:
+                cached = list(self._entries)
+                missing = {plant_id for plant_id, (plant, _) in self._entries.items() if plant is None}
+            try:
+                for start in range(0, len(cached), _POLL_CHUNK):
+                    chunk = cached[start:start + _POLL_CHUNK]
+                    current = {
+                        plant[self.key_field]: plant
+                        for plant in self.collection.find({self.key_field: {'$in': chunk}})
+                    }
+                    for plant_id in chunk:
+                        if plant_id in current:
+                            self._refresh(plant_id, current[plant_id], 'poll')
+                        elif plant_id not in missing:
+                            self.invalidate(plant_id)
+            except PyMongoError as e:
+                logger.warning(f"Plant cache refresh failed: {e}")
+
+    def _set_mode(self, mode):
+        self.mode = mode
+        if self.metrics:
+            self.metrics.set_gauge(f'{self.name}_change_stream', 1 if mode == 'change_stream' else 0)
+
+    def _count(self, name, value=1, **labels):
+        if self.metrics:
+            self.metrics.inc(f'{self.name}_{name}', value, **labels)
+
+    def _report_size(self):
+        if self.metrics:
+            self.metrics.set_gauge(f'{self.name}_size', len(self._entries))
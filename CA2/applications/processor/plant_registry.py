@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Plant Auto-Registration
+Registers a plant with default care instructions for its plantType the
+first time an unknown sensor reports, like the CA3 processor's
+autoRegisterPlant(). Registration is an upsert with $setOnInsert against a
+unique index on the plant ID, so when several replicas see a new plant at
+the same time exactly one document is created and the others read it back.
+"""
+
+import logging
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Same defaults as the CA3 processor (app.js), plus the fern and succulent
+# plants of the CA3 load test (sensor-config-load-test.json)
+DEFAULT_CARE_INSTRUCTIONS = {
+    'monstera': {
+        'moistureMin': 40, 'moistureMax': 60, 'lightMin': 800,
+        'temperatureMin': 18, 'temperatureMax': 24, 'humidityMin': 50, 'humidityMax': 70,
+        'wateringFrequency': '7 days',
+        'notes': 'Keep soil moderately moist, indirect bright light'
+    },
+    'sansevieria': {
+        'moistureMin': 20, 'moistureMax': 40, 'lightMin': 200,
+        'temperatureMin': 15, 'temperatureMax': 27, 'humidityMin': 30, 'humidityMax': 50,
+        'wateringFrequency': '14 days',
+        'notes': 'Drought tolerant, low light tolerant'
+    },
+    'pothos': {
+        'moistureMin': 30, 'moistureMax': 50, 'lightMin': 400,
+        'temperatureMin': 17, 'temperatureMax': 30, 'humidityMin': 40, 'humidityMax': 60,
+        'wateringFrequency': '5-7 days',
+        'notes': 'Easy care, tolerates low light'
+    },
+    'fern': {
+        'moistureMin': 50, 'moistureMax': 80, 'lightMin': 150,
+        'temperatureMin': 16, 'temperatureMax': 24, 'humidityMin': 55, 'humidityMax': 90,
+        'wateringFrequency': '3-4 days',
+        'notes': 'Keep soil consistently moist, high humidity, indirect light'
+    },
+    'succulent': {
+        'moistureMin': 10, 'moistureMax': 35, 'lightMin': 500,
+        'temperatureMin': 18, 'temperatureMax': 32, 'humidityMin': 10, 'humidityMax': 60,
+        'wateringFrequency': '14-21 days',
+        'notes': 'Let the soil dry out between waterings, bright light'
+    },
+    'unknown': {
+        'moistureMin': 30, 'moistureMax': 60, 'lightMin': 500,
+        'temperatureMin': 15, 'temperatureMax': 25, 'humidityMin': 40, 'humidityMax': 70,
+        'wateringFrequency': '7 days',
+        'notes': 'Generic plant care defaults - configure for specific needs'
+    }
+}
+
+
+def default_care_instructions(plant_type):
+    return dict(DEFAULT_CARE_INSTRUCTIONS.get(plant_type) or DEFAULT_CARE_INSTRUCTIONS['unknown'])
+
+
+def display_name(plant_id, plant_type):
+    return f"{plant_type[:1].upper()}{plant_type[1:]} ({plant_id})"
+
+
+class PlantRegistrar:
+    """
+    Create plant documents for unknown plants exactly once.
+    build_document(reading) returns the document to insert; the plant ID
+    is read from it at key_field.
+    """
+
+    def __init__(self, collection, key_field, build_document, metrics=None):
+        self.collection = collection
+        self.key_field = key_field
+        self.build_document = build_document
+        self.metrics = metrics
+
+    def ensure_index(self):
+        """The unique index is what makes concurrent registrations safe"""
+        try:
+            self.collection.create_index(self.key_field, unique=True)
+        except OperationFailure as e:
+            # Usually existing duplicates - registration still works, just without the guarantee
+            logger.warning(f"Could not create unique index on plants.{self.key_field}: {e}")
+
+    def register(self, reading):
+        """Plant document for the reading's plant, inserting the default one if it does not exist"""
+        plant = self.build_document(reading)
+        plant_id = plant[self.key_field]
+        try:
+            result = self.collection.update_one(
+                {self.key_field: plant_id},
+                {'$setOnInsert': plant},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another replica's upsert inserted it first
+            result = None
+        if result is not None and result.upserted_id is not None:
+            plant['_id'] = result.upserted_id
+            if self.metrics:
+                self.metrics.inc('plants_auto_registered_total')
+            logger.info(f"Auto-registered plant {plant_id} with default care instructions")
+            return plant
+        return self.collection.find_one({self.key_field: plant_id})
+
+
+def care_plant_document(reading):
+    """plants document in the camelCase schema shared with the CA3 processor"""
+    plant_type = reading.get('plantType') or 'unknown'
+    now = datetime.utcnow()
+    return {
+        'plantId': reading['plantId'],
+        'name': display_name(reading['plantId'], plant_type),
+        'location': reading.get('location') or 'Unknown Location',
+        'plantType': plant_type,
+        'careInstructions': default_care_instructions(plant_type),
+        'addedDate': now,
+        'autoRegistered': True,
+        'firstSeenTimestamp': reading.get('timestamp'),
+        'lastWatered': now
+    }
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Processor Metrics
+Lightweight in-process metrics registry shared by the Python processors.
+Renders JSON for the health endpoints and Prometheus text for scraping.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and summaries keyed by name and labels"""
+
+    def __init__(self, prefix='plant_processor'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        # Summaries are stored as [count, sum, max]
+        self._summaries = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to an absolute value"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def remove_gauge(self, name, **labels):
+        """Drop a gauge series (e.g. for a revoked partition)"""
+        with self._lock:
+            self._gauges.pop(self._key(name, labels), None)
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a summary"""
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value > summary[2]:
+                    summary[2] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall-clock duration of a block in seconds"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def snapshot(self):
+        """Copy of the current values, safe to pickle or merge"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'summaries': {k: list(v) for k, v in self._summaries.items()}
+            }
+
+    @staticmethod
+    def merge(snapshots):
+        """Aggregate snapshots from several processes into one"""
+        merged = {'counters': {}, 'gauges': {}, 'summaries': {}}
+        for snap in snapshots:
+            for kind in ('counters', 'gauges'):
+                for key, value in snap[kind].items():
+                    merged[kind][key] = merged[kind].get(key, 0) + value
+            for key, (count, total, peak) in snap['summaries'].items():
+                current = merged['summaries'].get(key)
+                if current is None:
+                    merged['summaries'][key] = [count, total, peak]
+                else:
+                    current[0] += count
+                    current[1] += total
+                    current[2] = max(current[2], peak)
+        return merged
+
+    @staticmethod
+    def _label_str(labels):
+        return ','.join(f'{k}="{v}"' for k, v in labels)
+
+    def to_dict(self, snapshot=None):
+        """Nested JSON-friendly view of a snapshot"""
+        snap = snapshot if snapshot is not None else self.snapshot()
+        result = {}
+        for kind in ('counters', 'gauges'):
+            for (name, labels), value in snap[kind].items():
+                if labels:
+                    result.setdefault(name, {})[self._label_str(labels)] = value
+                else:
+                    result[name] = value
+        for (name, labels), (count, total, peak) in snap['summaries'].items():
+            entry = {
+                'count': count,
+                'sum': round(total, 6),
+                'avg': round(total / count, 6) if count else 0,
+                'max': round(peak, 6)
+            }
+            if labels:
+                result.setdefault(name, {})[self._label_str(labels)] = entry
+            else:
+                result[name] = entry
+        return result
+
+    def render_prometheus(self, snapshot=None):
+        """Prometheus text exposition format"""
+        snap = snapshot if snapshot is not None else self.snapshot()
+        lines = []
+        typed = set()
+
+        def emit(metric, kind, labels, value):
+            full = f'{self.prefix}_{metric}'
+            if full not in typed:
+                lines.append(f'# TYPE {full} {kind}')
+                typed.add(full)
+            label_part = f'{{{self._label_str(labels)}}}' if labels else ''
+            lines.append(f'{full}{label_part} {value}')
+
+        for (name, labels), value in sorted(snap['counters'].items()):
+            emit(name, 'counter', labels, value)
+        for (name, labels), value in sorted(snap['gauges'].items()):
+            emit(name, 'gauge', labels, value)
+        for (name, labels), (count, total, peak) in sorted(snap['summaries'].items()):
+            emit(f'{name}_count', 'counter', labels, count)
+            emit(f'{name}_sum', 'counter', labels, total)
+            emit(f'{name}_max', 'gauge', labels, peak)
+        return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(source, port, host='0.0.0.0'):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a background thread.
+    `source` is anything with snapshot() - a registry or an aggregator.
+    """
+    renderer = MetricsRegistry(prefix=getattr(source, 'prefix', 'plant_processor'))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = renderer.render_prometheus(source.snapshot()).encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body = json.dumps(renderer.to_dict(source.snapshot())).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
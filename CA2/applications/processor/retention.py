@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Retention and Downsampling
+Keeps sensor_readings, health_analysis and alerts from growing without
+bound:
+
+- TTL indexes expire documents after a per-collection number of days
+  (collMod expireAfterSeconds for a time-series sensor_readings).
+- Before raw readings expire, a background job compacts them into hourly
+  buckets in sensor_rollups_hour (the rollups.py format), so charts keep
+  their history. Hours the rollup writer already covered are left alone,
+  which also makes re-running a window harmless.
+
+The downsampler works through one window at a time in time order and
+records how far it got in retention_checkpoints, so a restart resumes
+there. A lease in the same document keeps replicas from duplicating the
+work. It sleeps between windows so that it runs at most duty_cycle of the
+time, keeping its reads away from the foreground inserts.
+
+  RETENTION_ENABLED         true to manage TTL indexes and downsample (default false)
+  RETENTION_DAYS            e.g. sensor_readings=30,health_analysis=90,alerts=180 (0 keeps forever)
+  DOWNSAMPLE_AFTER_DAYS     raw readings older than this are compacted (default 7)
+  DOWNSAMPLE_WINDOW_HOURS   hours aggregated per step (default 1)
+  DOWNSAMPLE_DUTY_CYCLE     fraction of wall time the job may spend working (default 0.1)
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from rollups import RollupWriter, rollup_collection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = {
+    'sensor_readings': 30,
+    'health_analysis': 90,
+    'alerts': 180
+}
+
+# Raw reading fields behind each rollup metric (health scores are not in the raw readings)
+SENSOR_FIELDS = {
+    'moisture': 'sensors.soilMoisture',
+    'light': 'sensors.lightLevel',
+    'temperature': 'sensors.temperature',
+    'humidity': 'sensors.humidity'
+}
+
+_INDEX_OPTIONS_CONFLICT = (85, 86)
+_LEASE = timedelta(minutes=5)
+
+
+def retention_days_from_env(defaults=None):
+    """{collection: days} from RETENTION_DAYS, over the defaults"""
+    days = dict(DEFAULT_RETENTION_DAYS if defaults is None else defaults)
+    for item in os.getenv('RETENTION_DAYS', '').split(','):
+        if '=' in item:
+            collection, value = item.split('=', 1)
+            days[collection.strip()] = float(value)
+    return days
+
+
+def _truncate_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class RetentionJob:
+    """TTL index management plus the throttled downsampler thread"""
+
+    def __init__(self, db, ttl_fields, retention_days, plant_field, key_field,
+                 sensor_collection='sensor_readings', timeseries=False, downsample_after_days=7,
+                 window_hours=1, duty_cycle=0.1, idle_interval=600, metrics=None, owner=None):
+        self.db = db
+        self.ttl_fields = ttl_fields
+        self.retention_days = retention_days
+        self.plant_field = plant_field
+        self.key_field = key_field
+        self.sensor_collection = sensor_collection
+        self.timeseries = timeseries
+        # The field windows are selected and bucketed on - a BSON date
+        self.time_field = ttl_fields[sensor_collection]
+        self.downsample_after = timedelta(days=downsample_after_days)
+        self.window = timedelta(hours=max(1, int(window_hours)))
+        self.duty_cycle = min(max(duty_cycle, 0.01), 1.0)
+        self.idle_interval = idle_interval
+        self.metrics = metrics
+        self.owner = owner or os.getenv('HOSTNAME', 'processor')
+        self.job_id = f'downsample:{sensor_collection}'
+        self.checkpoints = db.retention_checkpoints
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, db, ttl_fields, plant_field, key_field, timeseries=False, metrics=None, owner=None):
+        """A job configured from the RETENTION_* / DOWNSAMPLE_* variables, or None if disabled"""
+        if os.getenv('RETENTION_ENABLED', 'false').lower() != 'true':
+            return None
+        return cls(
+            db, ttl_fields, retention_days_from_env(), plant_field, key_field,
+            timeseries=timeseries,
+            downsample_after_days=float(os.getenv('DOWNSAMPLE_AFTER_DAYS', '7')),
+            window_hours=int(os.getenv('DOWNSAMPLE_WINDOW_HOURS', '1')),
+            duty_cycle=float(os.getenv('DOWNSAMPLE_DUTY_CYCLE', '0.1')),
+            metrics=metrics,
+            owner=owner
+        )
+
+    # TTL indexes
+
+    def apply_ttl(self):
+        """Create or update the TTL index (or option) of every configured collection"""
+        for collection, days in self.retention_days.items():
+            if days <= 0 or collection not in self.ttl_fields:
+                continue
+            seconds = int(days * 86400)
+            if collection == self.sensor_collection and self.timeseries:
+                self.db.command('collMod', collection, expireAfterSeconds=seconds)
+                logger.info(f"Retention: {collection} (time-series) expires after {days:g} days")
+                continue
+            field = self.ttl_fields[collection]
+            try:
+                self.db[collection].create_index([(field, 1)], expireAfterSeconds=seconds)
+            except OperationFailure as e:
+                if e.code not in _INDEX_OPTIONS_CONFLICT:
+                    raise
+                # An index on the field already exists with other options - change its TTL in place
+                self.db.command('collMod', collection,
+                                index={'keyPattern': {field: 1}, 'expireAfterSeconds': seconds})
+            logger.info(f"Retention: {collection} expires {days:g} days after {field}")
+
+        sensor_days = self.retention_days.get(self.sensor_collection, 0)
+        if 0 < sensor_days <= self.downsample_after.days:
+            logger.warning(f"Retention: {self.sensor_collection} expires after {sensor_days:g} days, "
+                           f"before downsampling at {self.downsample_after.days} days - history will be lost")
+
+    # Downsampling
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        try:
+            self.apply_ttl()
+            RollupWriter(self.db, self.key_field).ensure_indexes()
+        except PyMongoError as e:
+            logger.error(f"Retention: could not set up indexes: {e}")
+        while not self._stopping.is_set():
+            try:
+                worked = self.downsample_step()
+            except PyMongoError as e:
+                logger.error(f"Retention: downsampling failed: {e}")
+                if self.metrics:
+                    self.metrics.inc('downsample_failures_total')
+                worked = False
+            if not worked:
+                self._stopping.wait(self.idle_interval)
+
+    def _acquire(self):
+        """The checkpoint document if this process holds (or just took) the lease, else None"""
+        now = datetime.utcnow()
+        try:
+            return self.checkpoints.find_one_and_update(
+                {'_id': self.job_id, '$or': [
+                    {'owner': self.owner}, {'owner': None}, {'lease_until': {'$lt': now}}
+                ]},
+                {'$set': {'owner': self.owner, 'lease_until': now + _LEASE}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another replica holds the lease
+            return None
+
+    def _oldest(self):
+        # A date range only matches dates, skipping any string timestamps
+        oldest = self.db[self.sensor_collection].find_one(
+            {self.time_field: {'$gte': datetime(1970, 1, 1)}}, {self.time_field: 1}, sort=[(self.time_field, 1)]
+        )
+        return _truncate_hour(oldest[self.time_field]) if oldest else None
+
+    def downsample_step(self):
+        """Compact the next window if it is old enough; returns False when there is nothing to do"""
+        state = self._acquire()
+        if state is None:
+            return False
+        start = state.get('through') or self._oldest()
+        horizon = _truncate_hour(datetime.utcnow() - self.downsample_after)
+        if start is None or start >= horizon:
+            return False
+        end = min(start + self.window, horizon)
+
+        started = time.monotonic()
+        self.downsample(start, end)
+        elapsed = time.monotonic() - started
+
+        self.checkpoints.update_one(
+            {'_id': self.job_id, 'owner': self.owner},
+            {'$set': {'through': end, 'updated_at': datetime.utcnow()}, '$inc': {'windows': 1}}
+        )
+        if self.metrics:
+            self.metrics.inc('downsample_windows_total')
+            self.metrics.observe('downsample_window_seconds', elapsed)
+            self.metrics.set_gauge('downsample_backlog_seconds', (horizon - end).total_seconds())
+        logger.info(f"Retention: downsampled {self.sensor_collection} {start:%Y-%m-%d %H:%M} - "
+                    f"{end:%H:%M} in {elapsed:.2f}s")
+
+        # Throttle: stay idle long enough that the work is at most duty_cycle of the time
+        self._stopping.wait(elapsed * (1 - self.duty_cycle) / self.duty_cycle)
+        return True
+
+    def downsample(self, start, end):
+        """Aggregate raw readings in [start, end) into hourly rollups the rollup writer has not produced"""
+        time_field = f'${self.time_field}'
+        group = {
+            '_id': {
+                'plant': f'${self.plant_field}',
+                'start': {'$dateTrunc': {'date': time_field, 'unit': 'hour'}}
+            },
+            'count': {'$sum': 1},
+            'last_reading': {'$max': time_field}
+        }
+        project = {
+            '_id': 0,
+            self.key_field: '$_id.plant',
+            'start': '$_id.start',
+            'end': {'$dateAdd': {'startDate': '$_id.start', 'unit': 'hour', 'amount': 1}},
+            'count': 1,
+            'last_reading': 1,
+            'downsampled': {'$literal': True}
+        }
+        for metric, path in SENSOR_FIELDS.items():
+            value = f'${path}'
+            group[f'{metric}_count'] = {'$sum': {'$cond': [{'$isNumber': value}, 1, 0]}}
+            group[f'{metric}_sum'] = {'$sum': value}
+            group[f'{metric}_min'] = {'$min': value}
+            group[f'{metric}_max'] = {'$max': value}
+            project[metric] = {
+                'count': f'${metric}_count',
+                'sum': f'${metric}_sum',
+                'min': f'${metric}_min',
+                'max': f'${metric}_max'
+            }
+        self.db[self.sensor_collection].aggregate([
+            {'$match': {self.time_field: {'$gte': start, '$lt': end}}},
+            {'$group': group},
+            {'$match': {'_id.plant': {'$type': 'string'}}},
+            {'$project': project},
+            {'$merge': {
+                'into': rollup_collection('hour'),
+                'on': [self.key_field, 'start'],
+                'whenMatched': 'keepExisting',
+                'whenNotMatched': 'insert'
+            }}
+        ], allowDiskUse=True)
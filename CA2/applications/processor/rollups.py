@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Sensor Rollups
+Per-plant minute and hour aggregates maintained as readings flow through,
+so charts read one document per plant per minute/hour instead of
+aggregating raw sensor_readings.
+
+  sensor_rollups_minute / sensor_rollups_hour
+  {<plant key>, start, end, count, last_reading,
+   moisture: {count, sum, min, max}, light: {...}, temperature: {...},
+   humidity: {...}, health: {...}}
+
+Readings are folded in memory and written as $inc/$min/$max upserts, one
+unordered bulk_write per collection per flush - a batch of thousands of
+readings from a handful of plants costs a few updates. The mean is
+sum / count (rollup_series() computes it).
+
+Rollups are at-least-once like the readings: a replayed batch is counted
+again, and readings folded in since the last flush are lost on a crash.
+A failed timed flush keeps its unwritten buckets for the next one.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError, WriteConcernError
+
+from sensor_storage import parse_timestamp
+from write_coalescer import WriteCoalescer
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1)
+}
+METRICS = ('moisture', 'light', 'temperature', 'humidity', 'health')
+
+
+def bucket_start(timestamp, resolution):
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_collection(resolution):
+    return f'sensor_rollups_{resolution}'
+
+
+class RollupWriter:
+    """Folds readings into minute/hour buckets and upserts them in batches"""
+
+    def __init__(self, db, key_field, metrics=None, flush_interval=1.0):
+        self.db = db
+        self.key_field = key_field
+        self.metrics = metrics
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # (resolution, plant ID, bucket start) -> {'count', 'last', metric: [count, sum, min, max]}
+        self._buckets = {}
+        self._last_flush = time.monotonic()
+
+    def ensure_indexes(self):
+        for resolution in RESOLUTIONS:
+            self.db[rollup_collection(resolution)].create_index(
+                [(self.key_field, ASCENDING), ('start', ASCENDING)], unique=True
+            )
+
+    def add(self, plant_id, timestamp, values):
+        """
+        Fold one reading in. values maps METRICS names to numbers; missing
+        or non-numeric values are left out of that metric.
+        """
+        if not isinstance(plant_id, str):
+            return
+        timestamp = parse_timestamp(timestamp) or parse_timestamp(time.time())
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                key = (resolution, plant_id, bucket_start(timestamp, resolution))
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = {'count': 0, 'last': timestamp}
+                bucket['count'] += 1
+                if timestamp > bucket['last']:
+                    bucket['last'] = timestamp
+                for metric, value in values.items():
+                    if not isinstance(value, (int, float)) or isinstance(value, bool) or value != value:
+                        continue
+                    stats = bucket.get(metric)
+                    if stats is None:
+                        bucket[metric] = [1, value, value, value]
+                    else:
+                        stats[0] += 1
+                        stats[1] += value
+                        if value < stats[2]:
+                            stats[2] = value
+                        if value > stats[3]:
+                            stats[3] = value
+
+    def due(self):
+        return bool(self._buckets) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def maybe_flush(self):
+        """Timed flush for the per-record paths; a failed write is logged rather than failing the record"""
+        if not self.due():
+            return
+        try:
+            # Nothing replays these readings, so buckets the write did not store are retried next time
+            self.flush(requeue=True)
+        except PyMongoError as e:
+            if self.metrics:
+                self.metrics.inc('rollup_write_failures_total')
+            logger.error(f"Rollup write failed: {e}")
+
+    def flush(self, requeue=False):
+        """
+        Upsert every bucket folded since the last flush; returns the number
+        of rollup updates. With requeue, the buckets of a collection whose
+        write failed (other than on write concern, when it was applied) are
+        folded back in for the next flush; otherwise the caller replays
+        their readings.
+        """
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+            self._last_flush = time.monotonic()
+        if not buckets:
+            return 0
+
+        unwritten = dict(buckets)
+        for resolution in RESOLUTIONS:
+            group = [(key, bucket) for key, bucket in buckets.items() if key[0] == resolution]
+            if not group:
+                continue
+            try:
+                self._write(resolution, group)
+            except PyMongoError as e:
+                if _write_concern_failed(e):
+                    for key, _ in group:
+                        del unwritten[key]
+                if requeue:
+                    self._requeue(unwritten)
+                raise
+            for key, _ in group:
+                del unwritten[key]
+        if self.metrics:
+            self.metrics.inc('rollup_updates_total', len(buckets))
+        return len(buckets)
+
+    def _write(self, resolution, group):
+        writes = WriteCoalescer(self.db, self.metrics)
+        for (_, plant_id, start), bucket in group:
+            inc = {'count': bucket['count']}
+            low = {}
+            high = {'last_reading': bucket['last']}
+            for metric in METRICS:
+                stats = bucket.get(metric)
+                if stats is None:
+                    continue
+                inc[f'{metric}.count'] = stats[0]
+                inc[f'{metric}.sum'] = stats[1]
+                low[f'{metric}.min'] = stats[2]
+                high[f'{metric}.max'] = stats[3]
+            update = {
+                '$inc': inc,
+                '$max': high,
+                '$setOnInsert': {'end': start + RESOLUTIONS[resolution]}
+            }
+            if low:
+                update['$min'] = low
+            writes.add(
+                rollup_collection(resolution),
+                UpdateOne({self.key_field: plant_id, 'start': start}, update, upsert=True)
+            )
+        writes.flush()
+
+    def _requeue(self, buckets):
+        """Fold unwritten buckets back into the ones gathered since the flush"""
+        with self._lock:
+            for key, bucket in buckets.items():
+                current = self._buckets.get(key)
+                if current is None:
+                    self._buckets[key] = bucket
+                    continue
+                current['count'] += bucket['count']
+                if bucket['last'] > current['last']:
+                    current['last'] = bucket['last']
+                for metric in METRICS:
+                    stats = bucket.get(metric)
+                    if stats is None:
+                        continue
+                    merged = current.get(metric)
+                    if merged is None:
+                        current[metric] = stats
+                    else:
+                        merged[0] += stats[0]
+                        merged[1] += stats[1]
+                        merged[2] = min(merged[2], stats[2])
+                        merged[3] = max(merged[3], stats[3])
+
+
+def _write_concern_failed(error):
+    """The write was applied but not acknowledged by enough members - retrying would count it twice"""
+    if isinstance(error, WriteConcernError):
+        return True
+    return isinstance(error, BulkWriteError) and bool(error.details.get('writeConcernErrors'))
+
+
+def rollup_series(db, key_field, plant_id, start, end, resolution='minute'):
+    """Chart points for a plant: [{'start', 'count', metric: {'mean', 'min', 'max'}}] between start and end"""
+    points = []
+    for doc in db[rollup_collection(resolution)].find(
+            {key_field: plant_id, 'start': {'$gte': start, '$lt': end}}).sort('start', ASCENDING):
+        point = {'start': doc['start'], 'count': doc.get('count', 0)}
+        for metric in METRICS:
+            stats = doc.get(metric)
+            if stats and stats.get('count'):
+                point[metric] = {
+                    'mean': stats['sum'] / stats['count'],
+                    'min': stats.get('min'),
+                    'max': stats.get('max')
+                }
+        points.append(point)
+    return points
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Plant Rule Engine
+Health rules (thresholds, penalties, severities, messages) as data, per
+plant type, compiled into one generated Python function per type. A
+reading costs one dict lookup by plantType plus its own type's
+comparisons, however many types and rules are loaded.
+
+Rule sets come from, in increasing precedence:
+
+  built-in     the processor's original rules (PLANT_MONITOR_RULES / PLANT_CARE_RULES)
+  file         PLANT_RULES_FILE, JSON (default plant-rules.json next to this module:
+               the pothos, fern and succulent plants of the CA3 load test; empty disables)
+  collection   PLANT_RULES_COLLECTION (default plant_rules), one document per plant type
+
+  {"default": {"rules": [...]},
+   "types": {"fern": {"rules": [...], "remove": ["LOW_BATTERY"], "care": {"humidity_min": 60}}}}
+
+  collection: {"plantType": "fern", "rules": [...], "remove": [...], "care": {...},
+               "processor": "plant-monitor"}   (processor optional - omitted applies to both)
+
+A type's rules are merged onto the default rules by issue type: a rule
+with the same "type" replaces the default one, new ones are appended,
+"remove" drops default ones. "care" gives thresholds for plants whose
+care instructions lack a field.
+
+  {"type": "WATER_NEEDED", "severity": "HIGH", "metric": "moisture",
+   "op": "<", "threshold": "moisture_min", "penalty": 30, "group": "moisture",
+   "message": "Soil moisture too low: {value}% (needs {threshold}%+)"}
+
+  metric     moisture, light, temperature, humidity or battery, or a window
+             statistic of the plant's recent readings: <metric>_<stat> with stat
+             ewma, mean, variance, stddev, min, max or rate (per hour) over the
+             longest window (see window_stats.py), e.g. moisture_rate
+  op         <, <=, >, >= or outside (threshold is then [low, high])
+  threshold  a number, or the name of a care-instructions field
+  group      consecutive rules of a group are exclusive (if/elif)
+  message    str.format() with value, threshold, low, high
+
+Each rule set is also compiled into column form for batch(), which scores
+a whole batch of readings with NumPy (see health_analysis.py).
+
+Both sources are re-checked every PLANT_RULES_RELOAD_SECONDS (default 30)
+and recompiled when they change; the new table is swapped in whole. A
+rule set that fails to load or compile is logged and the previous one
+stays in use.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import string
+import threading
+from datetime import datetime
+
+import bson
+from pymongo.errors import PyMongoError
+
+from health_analysis import BatchRules, HealthBatch, health_status
+from window_stats import SENSOR_FIELDS, STATS
+
+logger = logging.getLogger(__name__)
+
+OPS = ('<', '<=', '>', '>=', 'outside')
+_FIELD = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+# Rule sets for the plant types the built-in rules do not cover
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plant-rules.json')
+# Names a rule message can use
+MESSAGE_FIELDS = ('value', 'threshold', 'low', 'high')
+
+
+def window_metrics(names=tuple(SENSOR_FIELDS)):
+    """Window statistics as rule metrics (moisture_rate, ...) - None until the plant has the data"""
+    return {
+        f'{name}_{stat}': (f"stats.value({name!r}, {stat!r}) if stats is not None else None", True)
+        for name in names for stat in ('ewma',) + STATS
+    }
+
+
+# metric -> (expression over `reading` and the plant's window `stats`, may be None)
+MONITOR_METRICS = {
+    'moisture': ("reading.get('sensors', {}).get('soilMoisture', 50)", False),
+    'light': ("reading.get('sensors', {}).get('lightLevel', 0)", False),
+    'temperature': ("reading.get('sensors', {}).get('temperature', 20)", False),
+    'humidity': ("reading.get('sensors', {}).get('humidity')", True),
+    'battery': ("reading.get('metadata', {}).get('batteryLevel', 100)", False),
+    **window_metrics()
+}
+CARE_METRICS = {
+    'moisture': ("reading['sensors']['soilMoisture']", False),
+    'light': ("reading['sensors']['lightLevel']", False),
+    'temperature': ("reading['sensors'].get('temperature')", True),
+    'humidity': ("reading['sensors'].get('humidity')", True),
+    'battery': ("(reading.get('metadata') or {}).get('batteryLevel')", True),
+    **window_metrics()
+}
+
+# plant-monitor-processor.py's original rules (snake_case care instructions)
+PLANT_MONITOR_RULES = [
+    {'type': 'WATER_NEEDED', 'severity': 'HIGH', 'metric': 'moisture', 'op': '<',
+     'threshold': 'moisture_min', 'penalty': 30, 'group': 'moisture',
+     'message': 'Soil moisture too low: {value}% (needs {threshold}%+)'},
+    {'type': 'OVERWATERED', 'severity': 'MEDIUM', 'metric': 'moisture', 'op': '>',
+     'threshold': 'moisture_max', 'penalty': 20, 'group': 'moisture',
+     'message': 'Soil moisture too high: {value}% (max {threshold}%)'},
+    {'type': 'INSUFFICIENT_LIGHT', 'severity': 'MEDIUM', 'metric': 'light', 'op': '<',
+     'threshold': 'light_min', 'penalty': 15,
+     'message': 'Light level too low: {value} lux (needs {threshold}+ lux)'},
+    {'type': 'TEMPERATURE_STRESS', 'severity': 'LOW', 'metric': 'temperature', 'op': 'outside',
+     'threshold': ['temp_min', 'temp_max'], 'penalty': 10,
+     'message': 'Temperature {value}°C outside optimal range ({low}-{high}°C)'},
+    {'type': 'LOW_BATTERY', 'severity': 'LOW', 'metric': 'battery', 'op': '<',
+     'threshold': 20, 'penalty': 5,
+     'message': 'Sensor battery low: {value}%'}
+]
+
+# plant-care-processor.py's original (CA0) rules
+PLANT_CARE_RULES = [
+    {'type': 'WATER_NEEDED', 'severity': 'HIGH', 'metric': 'moisture', 'op': '<',
+     'threshold': 'moistureMin', 'penalty': 30, 'message': 'Soil moisture too low'},
+    {'type': 'OVERWATERED', 'severity': 'MEDIUM', 'metric': 'moisture', 'op': '>',
+     'threshold': 'moistureMax', 'penalty': 20, 'message': 'Soil moisture too high'},
+    {'type': 'INSUFFICIENT_LIGHT', 'severity': 'MEDIUM', 'metric': 'light', 'op': '<',
+     'threshold': 200, 'penalty': 15, 'message': 'Light level too low'}
+]
+
+
+def monitor_result(score, issues):
+    return {
+        'health_score': max(0, score),
+        'status': health_status(score),
+        'issues': issues,
+        'analyzed_at': datetime.utcnow()
+    }
+
+
+def care_result(score, issues):
+    return {'healthScore': score, 'status': health_status(score), 'alerts': issues}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_finite(value):
+    """A number whose repr() is valid Python - JSON Infinity and NaN are not"""
+    return _is_number(value) and math.isfinite(value)
+
+
+def _threshold_code(spec, care_defaults):
+    """Python expression for one threshold"""
+    if _is_finite(spec):
+        return repr(spec)
+    if isinstance(spec, str) and _FIELD.match(spec):
+        if spec in care_defaults:
+            if not _is_finite(care_defaults[spec]):
+                raise ValueError(f"Care default {spec} must be a finite number, got {care_defaults[spec]!r}")
+            return f'care.get({spec!r}, {care_defaults[spec]!r})'
+        return f'care[{spec!r}]'
+    raise ValueError(f"Invalid threshold {spec!r}")
+
+
+def _check_message(message):
+    """Reject a message that would fail to format at evaluation time"""
+    try:
+        fields = [field for _, field, _, _ in string.Formatter().parse(message) if field is not None]
+    except ValueError as e:
+        raise ValueError(f"malformed message {message!r}: {e}")
+    for field in fields:
+        if re.split(r'[.\[]', field, 1)[0] not in MESSAGE_FIELDS:
+            raise ValueError(f"message {message!r} uses {{{field}}}; expected {', '.join(MESSAGE_FIELDS)}")
+
+
+def compile_rules(rules, metric_exprs, care_defaults=None, name='default'):
+    """One evaluate(reading, care, stats=None) -> (score, issues) function for a list of rules"""
+    care_defaults = care_defaults or {}
+    namespace = {}
+    lines = ['def evaluate(reading, care, stats=None):', '    score = 100', '    issues = []']
+    computed = set()
+    previous_group = None
+    closed_groups = set()
+    for i, rule in enumerate(rules):
+        if not isinstance(rule.get('type'), str):
+            raise ValueError(f"Rule {i} of {name} has no type")
+        metric = rule.get('metric')
+        if metric not in metric_exprs:
+            raise ValueError(f"Rule {rule['type']} of {name}: unknown metric {metric!r}")
+        op = rule.get('op')
+        if op not in OPS:
+            raise ValueError(f"Rule {rule['type']} of {name}: unknown op {op!r}")
+        penalty = rule.get('penalty', 0)
+        if not _is_finite(penalty):
+            raise ValueError(f"Rule {rule['type']} of {name}: penalty must be a finite number")
+        specs = rule.get('threshold')
+        if op == 'outside':
+            if not isinstance(specs, (list, tuple)) or len(specs) != 2:
+                raise ValueError(f"Rule {rule['type']} of {name}: outside needs [low, high]")
+        else:
+            specs = [specs]
+        message = str(rule.get('message', rule['type']))
+        try:
+            thresholds = [_threshold_code(spec, care_defaults) for spec in specs]
+            _check_message(message)
+        except ValueError as e:
+            raise ValueError(f"Rule {rule['type']} of {name}: {e}")
+
+        variable = f'm_{metric}'
+        expression, optional = metric_exprs[metric]
+        if metric not in computed:
+            lines.append(f'    {variable} = {expression}')
+            computed.add(metric)
+        # Thresholds are bound with := so the message can show them without looking them up again
+        if op == 'outside':
+            condition = (f'((low_{i} := {thresholds[0]}), (high_{i} := {thresholds[1]})) and '
+                         f'({variable} < low_{i} or {variable} > high_{i})')
+            message_args = f'threshold=(low_{i}, high_{i}), low=low_{i}, high=high_{i}'
+        else:
+            condition = f'{variable} {op} (threshold_{i} := {thresholds[0]})'
+            message_args = f'threshold=threshold_{i}, low=threshold_{i}, high=threshold_{i}'
+        if optional:
+            condition = f'{variable} is not None and ({condition})'
+
+        group = rule.get('group')
+        if group is not None and group == previous_group:
+            keyword = 'elif'
+        else:
+            if group is not None and group in closed_groups:
+                raise ValueError(f"Rules of group {group!r} in {name} must be consecutive")
+            if previous_group is not None:
+                closed_groups.add(previous_group)
+            keyword = 'if'
+        previous_group = group
+
+        namespace[f'type_{i}'] = rule['type']
+        namespace[f'severity_{i}'] = str(rule.get('severity', 'MEDIUM'))
+        namespace[f'message_{i}'] = message
+        lines.append(f'    {keyword} {condition}:')
+        lines.append(f"        issues.append({{'type': type_{i}, 'severity': severity_{i}, "
+                     f"'message': message_{i}.format(value={variable}, {message_args})}})")
+        if penalty:
+            lines.append(f'        score -= {penalty!r}')
+    lines.append('    return score, issues')
+    exec(compile('\n'.join(lines), f'<plant rules: {name}>', 'exec'), namespace)
+    return namespace['evaluate']
+
+
+def merge_rule_set(default_rules, entry):
+    """A type's rules: the default rules with the entry's replacements, additions and removals"""
+    removed = set(entry.get('remove') or ())
+    rules = [rule for rule in default_rules if rule.get('type') not in removed]
+    positions = {rule.get('type'): i for i, rule in enumerate(rules)}
+    for rule in entry.get('rules') or ():
+        if rule.get('type') in positions:
+            rules[positions[rule['type']]] = rule
+        else:
+            positions[rule.get('type')] = len(rules)
+            rules.append(rule)
+    return rules
+
+
+class RuleEngine:
+    """Compiled per-plant-type health rules, reloaded when their sources change"""
+
+    def __init__(self, processor, builtin_rules, metric_exprs, result, rules_file=None,
+                 collection=None, reload_interval=30, metrics=None):
+        self.processor = processor
+        self.builtin_rules = builtin_rules
+        self.metric_exprs = metric_exprs
+        self.result = result
+        self.rules_file = rules_file
+        self.collection = collection
+        self.reload_interval = reload_interval
+        self.metrics = metrics
+        self._fingerprint = None
+        self._stopping = threading.Event()
+        self._thread = None
+        # (plant type -> evaluate, default evaluate, (plant type -> BatchRules, default BatchRules)),
+        # replaced as a whole on reload
+        evaluate = compile_rules(builtin_rules, metric_exprs, name='built-in')
+        self._table = ({}, evaluate, ({}, BatchRules(builtin_rules, metric_exprs, {}, evaluate, 'built-in')))
+
+    @classmethod
+    def from_env(cls, processor, builtin_rules, metric_exprs, result, db=None, metrics=None):
+        collection_name = os.getenv('PLANT_RULES_COLLECTION', 'plant_rules').strip()
+        return cls(
+            processor, builtin_rules, metric_exprs, result,
+            rules_file=os.getenv('PLANT_RULES_FILE', DEFAULT_RULES_FILE).strip() or None,
+            collection=db[collection_name] if db is not None and collection_name else None,
+            reload_interval=float(os.getenv('PLANT_RULES_RELOAD_SECONDS', '30')),
+            metrics=metrics
+        )
+
+    def analyze(self, reading, care_instructions, stats=None):
+        """Health analysis of a reading by its plantType's rules; stats is the plant's PlantStats, if tracked"""
+        by_type, default, _ = self._table
+        evaluate = by_type.get(reading.get('plantType'), default)
+        score, issues = evaluate(reading, care_instructions, stats)
+        return self.result(score, issues)
+
+    def batch(self, size=None):
+        """
+        A HealthBatch scoring readings with the current rules: add(reading,
+        care_instructions, stats) each, analyze(), then analysis(row) gives
+        what analyze() would have. size, if known, lets small batches skip NumPy.
+        """
+        return HealthBatch(self._table[2], self.result, size)
+
+    def analyze_batch(self, readings, cares, stats=None):
+        """analyze() over a batch; stats[i], if given, is the PlantStats of readings[i]"""
+        batch = self.batch(len(readings))
+        for i, reading in enumerate(readings):
+            batch.add(reading, cares[i], stats[i] if stats is not None else None)
+        return batch.analyze()
+
+    def plant_types(self):
+        return sorted(self._table[0])
+
+    # Loading
+
+    def _sources(self):
+        """(file rule set, collection documents, fingerprint of both)"""
+        digest = hashlib.sha1()
+        file_rules = None
+        if self.rules_file:
+            with open(self.rules_file, 'rb') as f:
+                content = f.read()
+            digest.update(content)
+            file_rules = json.loads(content)
+        documents = []
+        if self.collection is not None:
+            query = {'$or': [{'processor': {'$exists': False}}, {'processor': self.processor}]}
+            for document in self.collection.find(query).sort('plantType', 1):
+                document.pop('_id', None)
+                digest.update(bson.encode(document))
+                documents.append(document)
+        return file_rules, documents, digest.hexdigest()
+
+    def _build(self, file_rules, documents):
+        default_entry = {}
+        entries = {}
+        if file_rules:
+            default_entry = dict(file_rules.get('default') or {})
+            entries.update(copy.deepcopy(file_rules.get('types') or {}))
+        for document in documents:
+            plant_type = document.get('plantType')
+            if plant_type in ('default', '*'):
+                default_entry = document
+            elif isinstance(plant_type, str):
+                entries[plant_type] = document
+
+        default_rules = merge_rule_set(self.builtin_rules, default_entry)
+        default_care = default_entry.get('care') or {}
+        default = compile_rules(default_rules, self.metric_exprs, default_care, 'default')
+        batch_default = BatchRules(default_rules, self.metric_exprs, default_care, default, 'default')
+        by_type = {}
+        batch_by_type = {}
+        for plant_type, entry in entries.items():
+            care = {**default_care, **(entry.get('care') or {})}
+            rules = merge_rule_set(default_rules, entry)
+            by_type[plant_type] = compile_rules(rules, self.metric_exprs, care, plant_type)
+            batch_by_type[plant_type] = BatchRules(rules, self.metric_exprs, care, by_type[plant_type], plant_type)
+        return by_type, default, (batch_by_type, batch_default)
+
+    def reload(self, force=False):
+        """Recompile if the sources changed; returns True if a new table was swapped in"""
+        try:
+            file_rules, documents, fingerprint = self._sources()
+            if not force and fingerprint == self._fingerprint:
+                return False
+            table = self._build(file_rules, documents)
+        except (OSError, ValueError, TypeError, KeyError, SyntaxError, PyMongoError) as e:
+            logger.error(f"Plant rules not reloaded, keeping the current ones: {e}")
+            if self.metrics:
+                self.metrics.inc('plant_rules_reloads_total', status='failed')
+            return False
+        self._table = table
+        self._fingerprint = fingerprint
+        if self.metrics:
+            self.metrics.inc('plant_rules_reloads_total', status='ok')
+            self.metrics.set_gauge('plant_rule_types', len(table[0]))
+        logger.info(f"Plant rules compiled for {len(table[0])} plant types plus the default")
+        return True
+
+    def start(self):
+        """Load the rule sets, then watch them from a background thread"""
+        self.reload(force=True)
+        if self.reload_interval > 0 and self._thread is None and (self.rules_file or self.collection is not None):
+            self._thread = threading.Thread(target=self._watch, name='plant-rules', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _watch(self):
+        while not self._stopping.wait(self.reload_interval):
+            self.reload()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Sensor Load Generator
+Produces sensor.js-style readings to Kafka in any supported wire format so
+load tests can compare JSON with the compact encodings.
+
+Usage:
+  python sensor-load-generator.py --format struct --rate 500 --duration 60 \
+      --config ../../plant-monitor-swarm-IaC/sensor-config.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from kafka import KafkaProducer
+
+from codec import get_codec
+from wire_format import CONTENT_TYPE_JSON, CONTENT_TYPE_MSGPACK, CONTENT_TYPE_STRUCT, encode_reading
+
+FORMATS = {
+    'json': CONTENT_TYPE_JSON,
+    'msgpack': CONTENT_TYPE_MSGPACK,
+    'struct': CONTENT_TYPE_STRUCT
+}
+
+# Same baselines as sensor.js, plus the extra load-test plant types
+PLANT_PROFILES = {
+    'monstera': {'moistureBase': 50, 'lightBase': 600, 'tempBase': 22, 'humidityBase': 50},
+    'sansevieria': {'moistureBase': 30, 'lightBase': 300, 'tempBase': 20, 'humidityBase': 40},
+    'pothos': {'moistureBase': 45, 'lightBase': 500, 'tempBase': 21, 'humidityBase': 55},
+    'fern': {'moistureBase': 60, 'lightBase': 250, 'tempBase': 20, 'humidityBase': 70},
+    'succulent': {'moistureBase': 20, 'lightBase': 700, 'tempBase': 24, 'humidityBase': 30}
+}
+
+
+def load_sensors(path, count):
+    if path:
+        with open(path) as f:
+            return json.load(f)['sensors']
+    types = list(PLANT_PROFILES)
+    return [{
+        'plantId': f'plant-{i + 1:03d}',
+        'plantType': types[i % len(types)],
+        'location': 'Load Test'
+    } for i in range(count)]
+
+
+def generate_reading(sensor, rng, now=None):
+    """One reading, generated the way sensor.js does it"""
+    now = now or datetime.now(timezone.utc)
+    profile = PLANT_PROFILES.get(sensor['plantType'], PLANT_PROFILES['monstera'])
+    hour = now.hour
+    return {
+        'timestamp': now.strftime('%Y-%m-%dT%H:%M:%S.') + f'{now.microsecond // 1000:03d}Z',
+        'plantId': sensor['plantId'],
+        'location': sensor.get('location'),
+        'plantType': sensor['plantType'],
+        'sensors': {
+            'soilMoisture': max(0, min(100, profile['moistureBase'] + math.sin(hour / 24 * 2 * math.pi) * 5
+                                       + (rng.random() - 0.5) * 10)),
+            'lightLevel': max(0, math.sin((hour - 6) / 12 * math.pi) * profile['lightBase']) + rng.random() * 100,
+            'temperature': profile['tempBase'] + math.sin((hour - 6) / 12 * math.pi) * 3 + (rng.random() - 0.5) * 2,
+            'humidity': max(0, min(100, profile['humidityBase'] + (rng.random() - 0.5) * 10))
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Produce synthetic plant sensor readings to Kafka')
+    parser.add_argument('--brokers', default=os.getenv('KAFKA_BROKERS', 'kafka-service:9092'))
+    parser.add_argument('--topic', default=os.getenv('KAFKA_TOPIC', 'plant-sensors'))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='json')
+    parser.add_argument('--rate', type=float, default=100, help='readings per second (0 = unthrottled)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run')
+    parser.add_argument('--plants', type=int, default=5, help='number of synthetic plants without --config')
+    parser.add_argument('--config', help='sensor-config JSON file with a "sensors" list')
+    args = parser.parse_args()
+
+    sensors = load_sensors(args.config, args.plants)
+    content_type = FORMATS[args.format]
+    codec = get_codec('auto')
+    rng = random.Random()
+    producer = KafkaProducer(
+        bootstrap_servers=args.brokers.split(','),
+        key_serializer=lambda k: k.encode('utf-8'),
+        linger_ms=20,
+        acks=1
+    )
+
+    sent = 0
+    total_bytes = 0
+    started = time.monotonic()
+    deadline = started + args.duration
+    try:
+        while time.monotonic() < deadline:
+            sensor = sensors[sent % len(sensors)]
+            value, headers = encode_reading(generate_reading(sensor, rng), content_type, codec)
+            producer.send(args.topic, value=value, key=sensor['plantId'], headers=headers)
+            sent += 1
+            total_bytes += len(value)
+            if args.rate > 0:
+                ahead = started + sent / args.rate - time.monotonic()
+                if ahead > 0:
+                    time.sleep(ahead)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        producer.flush()
+        producer.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Sent {sent} {args.format} readings in {elapsed:.1f}s "
+          f"({sent / elapsed:.0f}/s, {total_bytes / max(sent, 1):.1f} bytes/reading)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Sensor Reading Storage Layout
+sensor_readings is either a plain collection (one document per reading,
+the default) or, with SENSOR_STORAGE_MODE=timeseries, a MongoDB time-series
+collection: readings are bucketed per plant (metaField) by the sensor
+timestamp (timeField), which stores them compressed and answers per-plant
+time-range queries from the bucket index.
+
+A time-series timeField must be a BSON date, so in that mode the reading's
+ISO timestamp string is stored as a date. An existing plain collection
+cannot be converted in place - sensor-timeseries-migrate.py copies it.
+
+  SENSOR_STORAGE_MODE            standard | timeseries (default standard)
+  SENSOR_TIMESERIES_GRANULARITY  seconds | minutes | hours (default seconds)
+"""
+
+import logging
+import os
+from datetime import datetime, timezone
+
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+STORAGE_STANDARD = 'standard'
+STORAGE_TIMESERIES = 'timeseries'
+
+
+def parse_timestamp(value):
+    """Sensor timestamp (ISO string or epoch seconds/milliseconds) as a naive UTC datetime, or None"""
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # sensor.js uses milliseconds; anything past 2286 in seconds is milliseconds
+        seconds = value / 1000 if value > 1e10 else value
+        return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            return None
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+    return None
+
+
+class SensorStorage:
+    """Creates sensor_readings in the configured layout and shapes documents for it"""
+
+    def __init__(self, mode=STORAGE_STANDARD, meta_field='plantId', time_field='timestamp',
+                 granularity='seconds'):
+        if mode not in (STORAGE_STANDARD, STORAGE_TIMESERIES):
+            raise ValueError(f"Unknown sensor storage mode {mode!r}")
+        self.mode = mode
+        self.meta_field = meta_field
+        self.time_field = time_field
+        self.granularity = granularity
+
+    @classmethod
+    def from_env(cls, meta_field='plantId', time_field='timestamp'):
+        return cls(
+            os.getenv('SENSOR_STORAGE_MODE', STORAGE_STANDARD).strip().lower() or STORAGE_STANDARD,
+            meta_field=meta_field,
+            time_field=time_field,
+            granularity=os.getenv('SENSOR_TIMESERIES_GRANULARITY', 'seconds')
+        )
+
+    @property
+    def timeseries(self):
+        return self.mode == STORAGE_TIMESERIES
+
+    def timeseries_options(self):
+        return {'timeField': self.time_field, 'metaField': self.meta_field, 'granularity': self.granularity}
+
+    def ensure_collection(self, db, name):
+        """
+        The collection to write readings to. In time-series mode it is created
+        if missing; if a plain collection already has the name, readings keep
+        going there (in the standard layout) until it has been migrated.
+        """
+        collection = db[name]
+        if not self.timeseries:
+            return collection
+        try:
+            db.create_collection(name, timeseries=self.timeseries_options())
+            logger.info(f"Created time-series collection {name} "
+                        f"(meta {self.meta_field}, time {self.time_field}, {self.granularity})")
+        except (CollectionInvalid, OperationFailure):
+            # Already exists - check it is a time-series collection
+            info = next(db.list_collections(filter={'name': name}), None) or {}
+            if info.get('type') != 'timeseries':
+                logger.error(f"{name} is a plain collection - run sensor-timeseries-migrate.py to convert it; "
+                             f"writing the standard layout until then")
+                self.mode = STORAGE_STANDARD
+        return collection
+
+    def document(self, reading):
+        """Reading document for the collection layout (time field as a date in time-series mode)"""
+        if self.timeseries:
+            timestamp = parse_timestamp(reading.get(self.time_field))
+            reading[self.time_field] = timestamp or datetime.utcnow()
+        return reading
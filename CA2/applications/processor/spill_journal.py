@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Spill Journal
+Write-behind buffer for MongoDB outages. When a write fails because the
+server cannot be reached, the documents are appended to a local journal
+and the processor keeps consuming; later writes go straight to the
+journal instead of each waiting out server selection. A background thread
+pings MongoDB and, once it answers, replays the journal in bulk (oldest
+first) before writes go to MongoDB directly again.
+
+The journal is a directory of append-only segment files, preallocated and
+memory-mapped:
+
+  header   b'PSJ1', 4 bytes padding, replayed offset (uint64)
+  record   payload length (uint32), crc32 (uint32), BSON {c: collection, d: document}
+
+Every append is msync'ed before it returns, so offsets committed after a
+spill are covered by the file. Segments are allocated on disk when they are
+created, so a full disk fails the spill (the write is reported as failed
+and its records are not committed) rather than a later write through the
+map. Replay advances the header offset after each bulk insert; a segment is
+deleted once fully replayed. Documents are given their _id before they are
+spilled, so a replay that repeats a write MongoDB already took is skipped
+as a duplicate key - or, for time-series collections, which have no unique
+_id index, by looking the batch's _ids up first.
+
+  SPILL_DIR                       journal root, one subdirectory per processor ID (empty disables)
+  SPILL_SEGMENT_MB                segment file size (default 64)
+  SPILL_PROBE_INTERVAL_SECONDS    how often MongoDB is pinged while spilling (default 2)
+  SPILL_REPLAY_BATCH              documents per replayed insert_many (default 1000)
+
+SPILL_DIR must be on a volume that outlives the pod, with a stable
+HOSTNAME (e.g. a StatefulSet), for a journal left by a crash to be
+replayed after the restart.
+"""
+
+import fcntl
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import bson
+import pymongo
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PSJ1'
+HEADER = struct.Struct('<4s4xQ')
+RECORD = struct.Struct('<II')
+DUPLICATE_KEY = 11000
+
+
+def _preallocate(file, size):
+    """Reserve size bytes of disk for file - a sparse file would fail with SIGBUS once the disk is full"""
+    if hasattr(os, 'posix_fallocate'):
+        os.posix_fallocate(file.fileno(), 0, size)
+        return
+    zeros = bytes(1024 * 1024)
+    for offset in range(0, size, len(zeros)):
+        file.write(zeros[:min(len(zeros), size - offset)])
+    file.flush()
+    os.fsync(file.fileno())
+
+
+class SpillSegment:
+    """One preallocated, memory-mapped segment file"""
+
+    def __init__(self, path, size=None):
+        self.path = path
+        exists = os.path.exists(path)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            try:
+                _preallocate(self._file, size)
+            except OSError:
+                self._file.close()
+                os.remove(path)
+                raise
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+        if exists:
+            magic, self.replayed = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a spill segment")
+        else:
+            self.replayed = HEADER.size
+            HEADER.pack_into(self._map, 0, MAGIC, self.replayed)
+        self.end, self.records = self._scan()
+
+    def _scan(self):
+        """Find the end of the intact records - a torn final record is ignored (and overwritten)"""
+        position = self.replayed
+        records = 0
+        while position + RECORD.size <= self.size:
+            length, crc = RECORD.unpack_from(self._map, position)
+            start = position + RECORD.size
+            if length == 0 or start + length > self.size or zlib.crc32(self._map[start:start + length]) != crc:
+                break
+            position = start + length
+            records += 1
+        return position, records
+
+    def fits(self, length):
+        return self.end + RECORD.size + length <= self.size
+
+    def truncate(self, end, records):
+        """Drop the records appended after end"""
+        if end + RECORD.size <= self.size:
+            RECORD.pack_into(self._map, end, 0, 0)
+        self.end = end
+        self.records = records
+
+    def append(self, payload):
+        start = self.end + RECORD.size
+        self._map[start:start + len(payload)] = payload
+        # Length last: until it is written the record reads as the end of the segment
+        RECORD.pack_into(self._map, self.end, len(payload), zlib.crc32(payload))
+        self.end = start + len(payload)
+        self.records += 1
+
+    def read(self, position, limit):
+        """Up to limit payloads from position; returns (payloads, next position)"""
+        payloads = []
+        while position < self.end and len(payloads) < limit:
+            length, _ = RECORD.unpack_from(self._map, position)
+            start = position + RECORD.size
+            payloads.append(bytes(self._map[start:start + length]))
+            position = start + length
+        return payloads, position
+
+    def mark_replayed(self, position, count):
+        self.replayed = position
+        self.records -= count
+        HEADER.pack_into(self._map, 0, MAGIC, position)
+        self._map.flush()
+
+    def sync(self):
+        self._map.flush()
+
+    def close(self, remove=False):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+        if remove:
+            os.remove(self.path)
+
+
+class SpillJournal:
+    """The segments of one processor's journal directory, oldest first"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        # One process per journal: a second processor with the same ID would interleave segments
+        self._lock_file = open(os.path.join(directory, 'LOCK'), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"Spill journal {directory} is in use by another process")
+        self._lock = threading.Lock()
+        self.segments = []
+        self._sequence = 0
+        for path in sorted(glob.glob(os.path.join(directory, 'segment-*.spill'))):
+            self._sequence = int(os.path.basename(path)[8:-6]) + 1
+            segment = SpillSegment(path)
+            if segment.records:
+                self.segments.append(segment)
+            else:
+                segment.close(remove=True)
+
+    def __len__(self):
+        return sum(segment.records for segment in self.segments)
+
+    def backlog_bytes(self):
+        return sum(segment.end - segment.replayed for segment in self.segments)
+
+    def _roll(self, length):
+        path = os.path.join(self.directory, f'segment-{self._sequence:012d}.spill')
+        self._sequence += 1
+        segment = SpillSegment(path, max(self.segment_bytes, HEADER.size + RECORD.size + length))
+        self.segments.append(segment)
+        return segment
+
+    def append(self, collection, documents):
+        """Append documents for collection and sync them to disk; OSError (disk full) appends none of them"""
+        payloads = [bson.encode({'c': collection, 'd': document}) for document in documents]
+        with self._lock:
+            segments = len(self.segments)
+            last = self.segments[-1] if self.segments else None
+            mark = (last.end, last.records) if last else None
+            touched = []
+            try:
+                for payload in payloads:
+                    segment = self.segments[-1] if self.segments else None
+                    if segment is None or not segment.fits(len(payload)):
+                        segment = self._roll(len(payload))
+                    segment.append(payload)
+                    if not touched or touched[-1] is not segment:
+                        touched.append(segment)
+            except OSError:
+                # All or nothing, so the caller can treat the write as failed
+                for segment in self.segments[segments:]:
+                    segment.close(remove=True)
+                del self.segments[segments:]
+                if last is not None:
+                    last.truncate(*mark)
+                    last.sync()
+                raise
+            for segment in touched:
+                segment.sync()
+
+    def read_batch(self, limit):
+        """(segment, payloads, position after them) from the oldest segment"""
+        with self._lock:
+            if not self.segments:
+                return None, [], 0
+            segment = self.segments[0]
+            payloads, position = segment.read(segment.replayed, limit)
+            return segment, payloads, position
+
+    def mark_replayed(self, segment, position, count):
+        with self._lock:
+            segment.mark_replayed(position, count)
+            if segment.replayed >= segment.end:
+                self.segments.remove(segment)
+                segment.close(remove=True)
+
+    def close(self):
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+        self._lock_file.close()
+
+
+class WriteBehind:
+    """insert_many() that spills to the journal while MongoDB is unreachable"""
+
+    def __init__(self, db, journal, metrics=None, probe_interval=2.0, replay_batch=1000, timeseries=()):
+        self.db = db
+        self.journal = journal
+        self.metrics = metrics
+        self.probe_interval = probe_interval
+        self.replay_batch = replay_batch
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        # Time-series collections have no unique _id index, so replays into them are deduplicated by lookup
+        self.timeseries = set(timeseries)
+        # A journal left by the previous run is replayed before anything is written directly
+        self.spilling = len(journal) > 0
+        if self.spilling:
+            logger.warning(f"Spill journal {journal.directory} holds {len(journal)} documents - replaying them first")
+        self._publish()
+
+    @classmethod
+    def from_env(cls, db, processor_id, metrics=None, timeseries=()):
+        """A write-behind buffer under SPILL_DIR/<processor_id>, or None if SPILL_DIR is not set"""
+        root = os.getenv('SPILL_DIR', '').strip()
+        if not root:
+            return None
+        journal = SpillJournal(
+            os.path.join(root, processor_id),
+            segment_bytes=int(float(os.getenv('SPILL_SEGMENT_MB', '64')) * 1024 * 1024)
+        )
+        return cls(
+            db, journal, metrics,
+            probe_interval=float(os.getenv('SPILL_PROBE_INTERVAL_SECONDS', '2')),
+            replay_batch=int(os.getenv('SPILL_REPLAY_BATCH', '1000')),
+            timeseries=timeseries
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='spill-replay', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.journal.close()
+
+    def insert_many(self, collection, documents):
+        """
+        Store documents; True if MongoDB took them, False if they were spilled.
+        Per-document rejections (BulkWriteError) and other errors are raised
+        as from insert_many - only an unreachable server spills.
+        """
+        with self._lock:
+            spilling = self.spilling
+            if spilling:
+                self._spill(collection, documents)
+        if spilling:
+            return False
+        try:
+            self.db[collection].insert_many(documents, ordered=False)
+            return True
+        except ConnectionFailure as e:
+            logger.warning(f"MongoDB unreachable ({e}) - spilling writes to {self.journal.directory}")
+        with self._lock:
+            self.spilling = True
+            # Part of the batch may have landed - replay skips those
+            self._spill(collection, documents)
+        return False
+
+    def _spill(self, collection, documents):
+        """Journal documents; ConnectionFailure if they cannot be (the write failed like any other)"""
+        for document in documents:
+            if '_id' not in document:
+                document['_id'] = ObjectId()
+        try:
+            self.journal.append(collection, documents)
+        except OSError as e:
+            if self.metrics:
+                self.metrics.inc('spill_failures_total', collection=collection)
+            logger.error(f"Cannot spill {len(documents)} {collection} documents: {e}")
+            raise ConnectionFailure(f"MongoDB unreachable and the spill journal is unavailable: {e}")
+        if self.metrics:
+            self.metrics.inc('spill_documents_total', len(documents), collection=collection)
+        self._publish()
+
+    def _publish(self):
+        if self.metrics:
+            self.metrics.set_gauge('spill_backlog_documents', len(self.journal))
+            self.metrics.set_gauge('spill_backlog_bytes', self.journal.backlog_bytes())
+            self.metrics.set_gauge('mongo_spilling', 1 if self.spilling else 0)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if not self.spilling:
+                self._stopping.wait(self.probe_interval)
+                continue
+            try:
+                drained = self.replay()
+            except PyMongoError as e:
+                logger.error(f"Spill replay failed: {e}")
+                drained = False
+            if not drained:
+                self._stopping.wait(self.probe_interval)
+
+    def replay(self):
+        """
+        Replay the journal into MongoDB. Returns True once it is empty and
+        writes go direct again, False if MongoDB is still unreachable or
+        more was spilled meanwhile.
+        """
+        try:
+            with pymongo.timeout(self.probe_interval):
+                self.db.client.admin.command('ping')
+        except PyMongoError:
+            return False
+
+        started = time.monotonic()
+        replayed = 0
+        try:
+            while not self._stopping.is_set():
+                segment, payloads, position = self.journal.read_batch(self.replay_batch)
+                if not payloads:
+                    break
+                self._write(payloads)
+                self.journal.mark_replayed(segment, position, len(payloads))
+                replayed += len(payloads)
+                if self.metrics:
+                    self.metrics.inc('spill_replayed_documents_total', len(payloads))
+                self._publish()
+        except ConnectionFailure as e:
+            logger.warning(f"MongoDB lost again during replay: {e}")
+        finally:
+            if replayed:
+                elapsed = time.monotonic() - started
+                rate = replayed / elapsed if elapsed > 0 else replayed
+                if self.metrics:
+                    self.metrics.observe('spill_replay_seconds', elapsed)
+                    self.metrics.set_gauge('spill_replay_documents_per_second', round(rate, 1))
+                logger.info(f"Replayed {replayed} spilled documents in {elapsed:.2f}s ({rate:.0f}/s)")
+
+        with self._lock:
+            if len(self.journal) == 0:
+                self.spilling = False
+                self._publish()
+                logger.info("Spill journal drained - writing to MongoDB directly")
+                return True
+        return False
+
+    def _write(self, payloads):
+        batches = {}
+        for payload in payloads:
+            record = bson.decode(payload)
+            batches.setdefault(record['c'], []).append(record['d'])
+        for collection, documents in batches.items():
+            if collection in self.timeseries:
+                # No unique _id index - drop what an earlier, partial write already stored
+                ids = [document['_id'] for document in documents]
+                stored = {document['_id'] for document in self.db[collection].find({'_id': {'$in': ids}}, {'_id': 1})}
+                documents = [document for document in documents if document['_id'] not in stored]
+                if not documents:
+                    continue
+            try:
+                self.db[collection].insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                if e.details.get('writeConcernErrors'):
+                    raise
+                rejected = [error for error in e.details.get('writeErrors', []) if error.get('code') != DUPLICATE_KEY]
+                if rejected:
+                    if self.metrics:
+                        self.metrics.inc('spill_replay_rejected_total', len(rejected), collection=collection)
+                    logger.error(f"MongoDB rejected {len(rejected)} replayed {collection} documents, "
+                                 f"e.g. {rejected[0].get('errmsg')}")
+
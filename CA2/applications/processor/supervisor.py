@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Multi-Process Supervisor
+Forks N consumer processes inside one container, restarts any that exit,
+and aggregates their metrics behind a single endpoint.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from processor_metrics import MetricsRegistry, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+
+class ChildMetricsAggregator:
+    """Combines the latest metrics snapshot pushed by every child process"""
+
+    def __init__(self, prefix='plant_processor'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._retired_pids = set()
+        # Counters from children that have exited, so totals never go backwards
+        self._retired = {'counters': {}, 'gauges': {}, 'summaries': {}}
+        self.supervisor_metrics = MetricsRegistry(prefix)
+
+    def update(self, pid, snapshot):
+        with self._lock:
+            if pid not in self._retired_pids:
+                self._latest[pid] = snapshot
+
+    def retire(self, pid):
+        """Fold a dead child's counters into the running totals and drop its gauges"""
+        with self._lock:
+            self._retired_pids.add(pid)
+            snapshot = self._latest.pop(pid, None)
+            if snapshot:
+                self._retired = MetricsRegistry.merge([
+                    self._retired,
+                    {'counters': snapshot['counters'], 'gauges': {}, 'summaries': snapshot['summaries']}
+                ])
+
+    def snapshot(self):
+        with self._lock:
+            snapshots = [self._retired] + list(self._latest.values())
+        return MetricsRegistry.merge(snapshots + [self.supervisor_metrics.snapshot()])
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _child_main(child_target, index, metrics_queue, push_interval, listen_socket=None):
+    """Entry point of a forked child: run the consumer and push metrics to the parent"""
+    if listen_socket is not None:
+        # Inherited from the parent's metrics server - only the parent may accept on it
+        listen_socket.close()
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    registry = MetricsRegistry()
+
+    def push_metrics():
+        while True:
+            time.sleep(push_interval)
+            try:
+                metrics_queue.put((os.getpid(), registry.snapshot()))
+            except Exception:
+                return
+
+    threading.Thread(target=push_metrics, daemon=True).start()
+    child_target(index, registry)
+    # Final push so the last counts are not lost when the child exits
+    metrics_queue.put((os.getpid(), registry.snapshot()))
+
+
+class Supervisor:
+    """Keeps N child consumers running and serves their aggregated metrics"""
+
+    def __init__(self, child_target, processes, metrics_port, push_interval=2.0, max_backoff=30, healthy_after=60):
+        self.child_target = child_target
+        self.processes = processes
+        self.metrics_port = metrics_port
+        self.push_interval = push_interval
+        self.max_backoff = max_backoff
+        # A child that stays up this long has its restart backoff reset
+        self.healthy_after = healthy_after
+        self.context = multiprocessing.get_context('fork')
+        self.metrics_queue = self.context.Queue()
+        self.aggregator = ChildMetricsAggregator()
+        self.children = {}
+        self.restarts = {}
+        self.next_start = {}
+        self.started_at = {}
+        self.metrics_server = None
+        self.stopping = False
+
+    def spawn(self, index):
+        process = self.context.Process(
+            target=_child_main,
+            args=(self.child_target, index, self.metrics_queue, self.push_interval,
+                  self.metrics_server.socket if self.metrics_server else None),
+            name=f'processor-{index}'
+        )
+        process.start()
+        self.children[index] = process
+        self.started_at[index] = time.monotonic()
+        self.aggregator.supervisor_metrics.set_gauge('child_up', 1, child=index)
+        logger.info(f"Started consumer process {index} (pid {process.pid})")
+
+    def drain_metrics(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                pid, snapshot = self.metrics_queue.get(timeout=remaining)
+            except queue.Empty:
+                return
+            self.aggregator.update(pid, snapshot)
+
+    def check_children(self):
+        now = time.monotonic()
+        for index, process in list(self.children.items()):
+            if process is not None and not process.is_alive():
+                process.join()
+                self.drain_metrics(0.1)
+                self.aggregator.retire(process.pid)
+                self.aggregator.supervisor_metrics.set_gauge('child_up', 0, child=index)
+                self.aggregator.supervisor_metrics.inc('child_restarts_total', child=index)
+                restarts = self.restarts.get(index, 0)
+                backoff = min(self.max_backoff, 2 ** restarts)
+                self.restarts[index] = restarts + 1
+                self.next_start[index] = now + backoff
+                self.children[index] = None
+                logger.warning(f"Consumer process {index} exited with code {process.exitcode}; restarting in {backoff}s")
+            elif process is None and now >= self.next_start.get(index, 0):
+                self.spawn(index)
+            elif process is not None and now - self.started_at[index] >= self.healthy_after:
+                self.restarts[index] = 0
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.metrics_server = start_metrics_server(self.aggregator, self.metrics_port)
+        logger.info(f"Supervisor serving aggregated metrics on port {self.metrics_port}")
+
+        for index in range(self.processes):
+            self.spawn(index)
+
+        while not self.stopping:
+            self.drain_metrics(1.0)
+            self.check_children()
+
+        logger.info("Stopping consumer processes...")
+        for process in self.children.values():
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.children.values():
+            if process is not None:
+                process.join(30)
+        logger.info("Supervisor stopped")
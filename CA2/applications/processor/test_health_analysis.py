@@ -0,0 +1,154 @@
+"""Batch health analysis must give exactly what RuleEngine.analyze() gives, reading by reading"""
+
+import random
+
+import pytest
+
+from rule_engine import (
+    CARE_METRICS, DEFAULT_RULES_FILE, MONITOR_METRICS, PLANT_CARE_RULES, PLANT_MONITOR_RULES,
+    RuleEngine, care_result, monitor_result
+)
+from window_stats import WindowStats
+
+MONITOR_CARE = [
+    {'moisture_min': 40, 'moisture_max': 60, 'light_min': 800, 'temp_min': 18, 'temp_max': 26},
+    {'moisture_min': 20.5, 'moisture_max': 40, 'light_min': 200, 'temp_min': 15, 'temp_max': 25},
+    # Missing fields: the plant type's care defaults apply, or the reading raises KeyError
+    {'moisture_min': 30, 'light_min': 400},
+    {'moisture_min': '40', 'moisture_max': 60, 'light_min': 800, 'temp_min': 18, 'temp_max': 26},
+]
+CARE_CARE = [
+    {'moistureMin': 40, 'moistureMax': 60, 'lightMin': 800},
+    {'moistureMin': 20, 'moistureMax': 40.5},
+    {'moistureMin': 30},
+]
+PLANT_TYPES = [None, 'monstera', 'pothos', 'fern', 'succulent', 'cactus']
+
+# Window metrics, >=/<= ops, float penalties and an exclusive group on an optional metric
+EXTRA_RULES = PLANT_MONITOR_RULES + [
+    {'type': 'DRYING_FAST', 'severity': 'LOW', 'metric': 'moisture_rate', 'op': '<=', 'threshold': -1.5,
+     'penalty': 2.5, 'message': 'Drying at {value:.2f}%/h'},
+    {'type': 'HUMID', 'metric': 'humidity', 'op': '>=', 'threshold': 'humidity_max', 'penalty': 0.5,
+     'group': 'humidity', 'message': 'Humidity {value}% (max {threshold}%)'},
+    {'type': 'HUMIDITY_RANGE', 'metric': 'humidity', 'op': 'outside', 'threshold': [30, 'humidity_max'],
+     'penalty': 1, 'group': 'humidity', 'message': 'Humidity {value}% outside {low}-{high}'},
+]
+
+
+def engine(rules, metric_exprs, result, rules_file=DEFAULT_RULES_FILE):
+    rule_engine = RuleEngine('test', rules, metric_exprs, result, rules_file=rules_file)
+    rule_engine.reload(force=True)
+    return rule_engine
+
+
+def sensor_value(rng):
+    roll = rng.random()
+    if roll < 0.02:
+        return None
+    if roll < 0.03:
+        return '35'
+    if roll < 0.04:
+        return 2 ** 60
+    if roll < 0.05:
+        return True
+    if roll < 0.06:
+        return float('nan')
+    return rng.choice([rng.randint(0, 100), round(rng.uniform(0, 1000), 2)])
+
+
+def make_readings(count, seed):
+    rng = random.Random(seed)
+    readings = []
+    for i in range(count):
+        sensors = {name: sensor_value(rng) for name in ('soilMoisture', 'lightLevel', 'temperature', 'humidity')
+                   if rng.random() > 0.05}
+        reading = {
+            'plantId': f'plant-{i % 7:03d}',
+            'timestamp': f'2025-10-01T00:{i // 60 % 60:02d}:{i % 60:02d}.000Z',
+            'sensors': sensors
+        }
+        plant_type = rng.choice(PLANT_TYPES)
+        if plant_type:
+            reading['plantType'] = plant_type
+        if rng.random() < 0.3:
+            reading['metadata'] = {'batteryLevel': sensor_value(rng)}
+        readings.append(reading)
+    return readings
+
+
+def outcome(fn, *args):
+    try:
+        result = dict(fn(*args))
+    except Exception as e:
+        return ('raised', type(e))
+    result.pop('analyzed_at', None)
+    return result
+
+
+def assert_parity(rule_engine, readings, cares, with_stats=False):
+    """Scalar and batch analyses over the same stream, each reading seeing its own window statistics"""
+    scalar_stats = WindowStats(windows=(3, 10))
+    batch_stats = WindowStats(windows=(3, 10))
+    expected = []
+    batch = rule_engine.batch(len(readings))
+    for reading, care in zip(readings, cares):
+        stats = scalar_stats.update(reading['plantId'], reading) if with_stats else None
+        expected.append(outcome(rule_engine.analyze, reading, care, stats))
+        batch.add(reading, care, batch_stats.update(reading['plantId'], reading) if with_stats else None)
+    batch.analyze()
+    for i, reading in enumerate(readings):
+        assert outcome(batch.analysis, i) == expected[i], reading
+    return batch
+
+
+@pytest.mark.parametrize('size', [1, 10, 31, 32, 500])
+def test_monitor_batch_matches_scalar(size):
+    rule_engine = engine(PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result)
+    readings = make_readings(size, seed=size)
+    rng = random.Random(size)
+    assert_parity(rule_engine, readings, [rng.choice(MONITOR_CARE) for _ in readings])
+
+
+def test_care_batch_matches_scalar():
+    rule_engine = engine(PLANT_CARE_RULES, CARE_METRICS, care_result)
+    readings = make_readings(500, seed=7)
+    rng = random.Random(7)
+    assert_parity(rule_engine, readings, [rng.choice(CARE_CARE) for _ in readings])
+
+
+def test_window_metrics_groups_and_float_penalties_match_scalar():
+    rule_engine = engine(EXTRA_RULES, MONITOR_METRICS, monitor_result, rules_file=None)
+    readings = make_readings(600, seed=11)
+    rng = random.Random(11)
+    cares = [dict(rng.choice(MONITOR_CARE[:2]), humidity_max=rng.choice([60, 70.5])) for _ in readings]
+    batch = assert_parity(rule_engine, readings, cares, with_stats=True)
+    assert batch.vectorized.any()
+
+
+def test_batch_scores_and_masks():
+    rule_engine = engine(PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result, rules_file=None)
+    care = MONITOR_CARE[0]
+    readings = [
+        {'plantId': 'p', 'sensors': {'soilMoisture': 50, 'lightLevel': 900, 'temperature': 22}},
+        {'plantId': 'p', 'sensors': {'soilMoisture': 10, 'lightLevel': 100, 'temperature': 30},
+         'metadata': {'batteryLevel': 5}},
+        {'plantId': 'p', 'sensors': {'soilMoisture': 70, 'lightLevel': 900, 'temperature': 22}},
+    ] * 20
+    batch = rule_engine.analyze_batch(readings, [care] * len(readings))
+    assert batch.vectorized.all()
+    assert batch.scores[:3].tolist() == [100, 100 - 30 - 15 - 10 - 5, 80]
+    assert batch.statuses[:3].tolist() == [0, 2, 1]
+    # Bit j is rule j: WATER_NEEDED, OVERWATERED, INSUFFICIENT_LIGHT, TEMPERATURE_STRESS, LOW_BATTERY
+    assert batch.masks[:3].tolist() == [0, 0b11101, 0b00010]
+    assert batch.analysis(1)['health_score'] == 40
+
+
+def test_unrepresentable_reading_raises_like_scalar():
+    rule_engine = engine(PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result, rules_file=None)
+    readings = [{'plantId': 'p', 'sensors': {'soilMoisture': 50}}] * 40 + [{'plantId': 'p', 'sensors': None}]
+    batch = rule_engine.analyze_batch(readings, [MONITOR_CARE[0]] * len(readings))
+    assert not batch.vectorized[-1]
+    with pytest.raises(AttributeError):
+        batch.analysis(len(readings) - 1)
+    with pytest.raises(AttributeError):
+        rule_engine.analyze(readings[-1], MONITOR_CARE[0])
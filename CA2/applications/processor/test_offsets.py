@@ -0,0 +1,79 @@
+"""OffsetTracker commits and rewinds"""
+
+from collections import namedtuple
+
+from kafka.errors import CommitFailedError, KafkaTimeoutError
+from kafka.structs import TopicPartition
+
+from offsets import COMMIT_MODE_AUTO, COMMIT_MODE_BATCH, OffsetTracker, commit_mode_from_env
+
+Message = namedtuple('Message', 'topic partition offset')
+TP0 = TopicPartition('plant-sensors', 0)
+TP1 = TopicPartition('plant-sensors', 1)
+
+
+class FakeConsumer:
+    def __init__(self, commit_error=None, revoked=()):
+        self.commit_error = commit_error
+        self.revoked = set(revoked)
+        self.commits = []
+        self.seeks = []
+
+    def commit(self, offsets=None):
+        if self.commit_error:
+            raise self.commit_error
+        self.commits.append({tp: meta.offset for tp, meta in offsets.items()})
+
+    def seek(self, tp, offset):
+        if tp in self.revoked:
+            raise AssertionError('Unassigned partition')
+        self.seeks.append((tp, offset))
+
+
+def tracked(*offsets):
+    tracker = OffsetTracker()
+    for partition, offset in offsets:
+        tracker.track(Message('plant-sensors', partition, offset))
+    return tracker
+
+
+def test_commit_is_the_offset_after_the_last_record():
+    tracker = tracked((0, 5), (0, 6), (1, 40), (0, 7))
+    consumer = FakeConsumer()
+    assert tracker.commit(consumer)
+    assert consumer.commits == [{TP0: 8, TP1: 41}]
+    assert len(tracker) == 0
+
+
+def test_commit_with_nothing_tracked_does_not_call_the_consumer():
+    consumer = FakeConsumer()
+    assert OffsetTracker().commit(consumer)
+    assert consumer.commits == []
+
+
+def test_failed_commit_reports_false_and_forgets_the_offsets():
+    for error in (CommitFailedError('rebalanced'), KafkaTimeoutError('broker gone')):
+        tracker = tracked((0, 1))
+        assert not tracker.commit(FakeConsumer(commit_error=error))
+        assert tracker.pending() == {}
+
+
+def test_rewind_seeks_to_the_first_uncommitted_offset():
+    tracker = tracked((0, 5), (1, 40), (0, 9))
+    consumer = FakeConsumer()
+    tracker.rewind(consumer)
+    assert sorted(consumer.seeks) == [(TP0, 5), (TP1, 40)]
+    assert len(tracker) == 0
+
+
+def test_rewind_skips_revoked_partitions():
+    tracker = tracked((0, 5), (1, 40))
+    consumer = FakeConsumer(revoked=[TP0])
+    tracker.rewind(consumer)
+    assert consumer.seeks == [(TP1, 40)]
+
+
+def test_commit_mode_from_env():
+    assert commit_mode_from_env(None) == COMMIT_MODE_AUTO
+    assert commit_mode_from_env('BATCH') == COMMIT_MODE_BATCH
+    assert commit_mode_from_env('sometimes') == COMMIT_MODE_AUTO
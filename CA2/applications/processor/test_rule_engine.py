@@ -0,0 +1,110 @@
+"""RuleEngine rule-set merging, compile-time validation and reloads"""
+
+import json
+
+import pytest
+
+from rule_engine import (
+    MONITOR_METRICS, PLANT_MONITOR_RULES, RuleEngine, compile_rules, merge_rule_set, monitor_result
+)
+
+CARE = {'moisture_min': 40, 'moisture_max': 60, 'light_min': 800, 'temp_min': 18, 'temp_max': 26}
+HEALTHY = {'plantId': 'p', 'sensors': {'soilMoisture': 50, 'lightLevel': 900, 'temperature': 22, 'humidity': 30}}
+
+
+def rule(**fields):
+    return {'type': 'CUSTOM', 'metric': 'moisture', 'op': '<', 'threshold': 10, 'penalty': 5, **fields}
+
+
+def test_merge_replaces_appends_and_removes_by_type():
+    default = [rule(type='A'), rule(type='B'), rule(type='C')]
+    merged = merge_rule_set(default, {
+        'remove': ['B'],
+        'rules': [rule(type='C', penalty=50), rule(type='D')]
+    })
+    assert [r['type'] for r in merged] == ['A', 'C', 'D']
+    assert merged[1]['penalty'] == 50
+    # The defaults are left as they were
+    assert [r['type'] for r in default] == ['A', 'B', 'C']
+
+
+def test_merge_without_entry_keeps_defaults():
+    assert merge_rule_set(PLANT_MONITOR_RULES, {}) == PLANT_MONITOR_RULES
+
+
+@pytest.mark.parametrize('bad, error', [
+    ({'type': None}, 'has no type'),
+    ({'metric': 'pressure'}, 'unknown metric'),
+    ({'op': '=='}, 'unknown op'),
+    ({'penalty': float('inf')}, 'penalty must be a finite number'),
+    ({'penalty': True}, 'penalty must be a finite number'),
+    ({'op': 'outside', 'threshold': 10}, 'outside needs'),
+    ({'threshold': 'not a field!'}, 'Invalid threshold'),
+    ({'threshold': float('nan')}, 'Invalid threshold'),
+    ({'message': 'too low: {reading}'}, 'uses {reading}'),
+    ({'message': 'unbalanced {value'}, 'malformed message'),
+])
+def test_compile_rejects_invalid_rules(bad, error):
+    with pytest.raises(ValueError, match=error):
+        compile_rules([rule(**bad)], MONITOR_METRICS, name='test')
+
+
+def test_compile_rejects_non_consecutive_groups():
+    rules = [rule(type='A', group='g'), rule(type='B'), rule(type='C', group='g')]
+    with pytest.raises(ValueError, match='must be consecutive'):
+        compile_rules(rules, MONITOR_METRICS)
+
+
+def test_compile_rejects_non_numeric_care_default():
+    with pytest.raises(ValueError, match='Care default moisture_min'):
+        compile_rules([rule(threshold='moisture_min')], MONITOR_METRICS, {'moisture_min': 'forty'})
+
+
+def test_group_rules_are_exclusive_and_care_defaults_fill_gaps():
+    evaluate = compile_rules([
+        rule(type='LOW', threshold='moisture_min', group='moisture'),
+        rule(type='VERY_LOW', threshold=20, group='moisture'),
+    ], MONITOR_METRICS, {'moisture_min': 30})
+    score, issues = evaluate({'sensors': {'soilMoisture': 10}}, {})
+    assert (score, [issue['type'] for issue in issues]) == (95, ['LOW'])
+    score, issues = evaluate({'sensors': {'soilMoisture': 10}}, {'moisture_min': 5})
+    assert (score, [issue['type'] for issue in issues]) == (95, ['VERY_LOW'])
+
+
+def test_plant_types_use_their_merged_rules(tmp_path):
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps({
+        'types': {'fern': {'care': {'humidity_min': 60}, 'remove': ['LOW_BATTERY'], 'rules': [
+            rule(type='LOW_HUMIDITY', metric='humidity', threshold='humidity_min', message='{value}<{threshold}')
+        ]}}
+    }))
+    rule_engine = RuleEngine('test', PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result, rules_file=str(rules_file))
+    assert rule_engine.reload(force=True)
+    assert rule_engine.plant_types() == ['fern']
+
+    fern = rule_engine.analyze({**HEALTHY, 'plantType': 'fern', 'metadata': {'batteryLevel': 5}}, CARE)
+    assert [issue['message'] for issue in fern['issues']] == ['30<60']
+    other = rule_engine.analyze({**HEALTHY, 'plantType': 'monstera', 'metadata': {'batteryLevel': 5}}, CARE)
+    assert [issue['type'] for issue in other['issues']] == ['LOW_BATTERY']
+
+
+def test_invalid_reload_keeps_current_rules(tmp_path):
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps({'types': {'fern': {'rules': [rule(type='DRY', threshold=90)]}}}))
+    rule_engine = RuleEngine('test', PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result, rules_file=str(rules_file))
+    assert rule_engine.reload(force=True)
+
+    rules_file.write_text(json.dumps({'types': {'fern': {'rules': [rule(type='DRY', op='~')]}}}))
+    assert not rule_engine.reload()
+    rules_file.write_text('{not json')
+    assert not rule_engine.reload()
+    result = rule_engine.analyze({**HEALTHY, 'plantType': 'fern'}, CARE)
+    assert [issue['type'] for issue in result['issues']] == ['DRY']
+
+
+def test_unchanged_sources_are_not_recompiled(tmp_path):
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps({'types': {}}))
+    rule_engine = RuleEngine('test', PLANT_MONITOR_RULES, MONITOR_METRICS, monitor_result, rules_file=str(rules_file))
+    assert rule_engine.reload()
+    assert not rule_engine.reload()
@@ -0,0 +1,105 @@
+"""SpillJournal append, replay and recovery"""
+
+import os
+
+import bson
+import pytest
+
+import spill_journal
+from spill_journal import RECORD, SpillJournal
+
+
+def documents(count, start=0):
+    return [{'_id': i, 'plantId': f'plant-{i % 3}', 'moisture': 40 + i} for i in range(start, start + count)]
+
+
+def replay_all(journal, limit=7):
+    """Replay the journal oldest first in batches of limit; returns (collection, document) pairs"""
+    replayed = []
+    while True:
+        segment, payloads, position = journal.read_batch(limit)
+        if not payloads:
+            return replayed
+        replayed.extend((record['c'], record['d']) for record in map(bson.decode, payloads))
+        journal.mark_replayed(segment, position, len(payloads))
+
+
+def test_append_then_replay_in_order_across_segments(tmp_path):
+    journal = SpillJournal(str(tmp_path), segment_bytes=1024)
+    journal.append('sensor_readings', documents(20))
+    journal.append('alerts', documents(5, start=100))
+    assert len(journal) == 25
+    assert len(journal.segments) > 1
+
+    replayed = replay_all(journal)
+    assert replayed == [('sensor_readings', d) for d in documents(20)] + [('alerts', d) for d in documents(5, 100)]
+    # Fully replayed segments are deleted
+    assert len(journal) == 0 and journal.segments == []
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.spill')]
+    journal.close()
+
+
+def test_reopened_journal_resumes_after_the_replayed_records(tmp_path):
+    journal = SpillJournal(str(tmp_path), segment_bytes=4096)
+    journal.append('sensor_readings', documents(10))
+    segment, payloads, position = journal.read_batch(4)
+    journal.mark_replayed(segment, position, len(payloads))
+    journal.close()
+
+    reopened = SpillJournal(str(tmp_path), segment_bytes=4096)
+    assert len(reopened) == 6
+    assert [d['_id'] for _, d in replay_all(reopened)] == list(range(4, 10))
+    reopened.close()
+
+
+def test_torn_final_record_is_dropped_on_reopen(tmp_path):
+    journal = SpillJournal(str(tmp_path), segment_bytes=4096)
+    journal.append('sensor_readings', documents(3))
+    segment = journal.segments[-1]
+    # Corrupt the last record's payload, as a crash mid-write would leave it
+    last_start = segment.end - 1
+    segment._map[last_start] = segment._map[last_start] ^ 0xFF
+    journal.close()
+
+    reopened = SpillJournal(str(tmp_path), segment_bytes=4096)
+    assert len(reopened) == 2
+    reopened.append('sensor_readings', documents(1, start=50))
+    assert [d['_id'] for _, d in replay_all(reopened)] == [0, 1, 50]
+    reopened.close()
+
+
+def test_failed_preallocation_appends_nothing(tmp_path, monkeypatch):
+    journal = SpillJournal(str(tmp_path), segment_bytes=1024)
+    journal.append('sensor_readings', documents(2))
+    before = (len(journal), len(journal.segments), journal.segments[-1].end)
+
+    def disk_full(file, size):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(spill_journal, '_preallocate', disk_full)
+    with pytest.raises(OSError):
+        journal.append('sensor_readings', documents(30, start=10))
+    assert (len(journal), len(journal.segments), journal.segments[-1].end) == before
+    journal.close()
+
+    monkeypatch.undo()
+    reopened = SpillJournal(str(tmp_path), segment_bytes=1024)
+    assert [d['_id'] for _, d in replay_all(reopened)] == [0, 1]
+    reopened.close()
+
+
+def test_oversized_document_gets_its_own_segment(tmp_path):
+    journal = SpillJournal(str(tmp_path), segment_bytes=256)
+    big = {'_id': 1, 'blob': 'x' * 1000}
+    journal.append('sensor_readings', [big])
+    assert journal.segments[-1].size >= RECORD.size + len(bson.encode({'c': 'sensor_readings', 'd': big}))
+    assert replay_all(journal) == [('sensor_readings', big)]
+    journal.close()
+
+
+def test_second_process_cannot_open_the_same_journal(tmp_path):
+    journal = SpillJournal(str(tmp_path))
+    # flock is per open file description, so a second open in this process conflicts too
+    with pytest.raises(RuntimeError, match='in use'):
+        SpillJournal(str(tmp_path))
+    journal.close()
@@ -0,0 +1,106 @@
+"""Wire format round-trips and decode failures"""
+
+from collections import namedtuple
+
+import pytest
+
+from codec import SensorReading, get_codec
+from wire_format import (
+    CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON, CONTENT_TYPE_MSGPACK, CONTENT_TYPE_STRUCT,
+    WireDecoder, content_type_of, encode_reading
+)
+
+Record = namedtuple('Record', 'topic partition offset value headers')
+
+READING = {
+    'timestamp': '2025-10-01T12:34:56.789Z',
+    'plantId': 'plant-007',
+    'location': 'Living Room',
+    'plantType': 'monstera',
+    'sensors': {'soilMoisture': 45.2, 'lightLevel': 812.3, 'temperature': 21.75, 'humidity': 55.0},
+    'metadata': {'batteryLevel': 87}
+}
+
+
+class Metrics:
+    def __init__(self):
+        self.counts = {}
+
+    def inc(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+
+@pytest.fixture
+def decoder():
+    return WireDecoder(get_codec('auto'), Metrics())
+
+
+def test_content_type_defaults_to_json():
+    assert content_type_of(None) == CONTENT_TYPE_JSON
+    assert content_type_of([('traceparent', b'00-abc')]) == CONTENT_TYPE_JSON
+    assert content_type_of([('Content-Type', CONTENT_TYPE_STRUCT.encode())]) == CONTENT_TYPE_STRUCT
+
+
+def test_json_round_trip(decoder):
+    value, headers = encode_reading(READING)
+    assert headers == [(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON.encode())]
+    assert decoder.decode(value, headers) == READING
+    # Records from before the header existed are JSON too
+    assert decoder.decode(value) == READING
+
+
+def test_struct_round_trip(decoder):
+    value, headers = encode_reading(READING, CONTENT_TYPE_STRUCT)
+    assert content_type_of(headers) == CONTENT_TYPE_STRUCT
+    assert len(value) < len(encode_reading(READING)[0]) / 3
+    # float32 storage, rounded back to the values that were sent
+    assert decoder.decode(value, headers) == READING
+    assert decoder.decode_reading(value, headers) == SensorReading.from_document(READING)
+
+
+def test_struct_absent_values_decode_as_none(decoder):
+    doc = {'plantId': 'plant-001', 'sensors': {'soilMoisture': 30}}
+    value, headers = encode_reading(doc, CONTENT_TYPE_STRUCT)
+    decoded = decoder.decode(value, headers)
+    assert decoded['sensors'] == {'soilMoisture': 30, 'lightLevel': None, 'temperature': None, 'humidity': None}
+    assert decoded['timestamp'] is None and decoded['plantType'] is None
+    assert 'metadata' not in decoded
+
+
+@pytest.mark.parametrize('battery', [255, 300, -1, 50.5, True, 'full'])
+def test_struct_falls_back_to_json_when_battery_does_not_fit(decoder, battery):
+    doc = dict(READING, metadata={'batteryLevel': battery})
+    value, headers = encode_reading(doc, CONTENT_TYPE_STRUCT)
+    assert content_type_of(headers) == CONTENT_TYPE_JSON
+    assert decoder.decode(value, headers) == doc
+
+
+def test_msgpack_round_trip(decoder):
+    pytest.importorskip('msgpack')
+    value, headers = encode_reading(READING, CONTENT_TYPE_MSGPACK)
+    assert decoder.decode(value, headers) == READING
+    assert decoder.decode_reading(value, headers) == SensorReading.from_document(READING)
+
+
+def test_unsupported_content_type(decoder):
+    with pytest.raises(ValueError, match='Unsupported content type'):
+        encode_reading(READING, 'text/csv')
+    with pytest.raises(ValueError, match='Unsupported content type'):
+        decoder.decode(b'a,b', [(CONTENT_TYPE_HEADER, b'text/csv')])
+
+
+def test_undecodable_records_are_dropped_and_counted(decoder):
+    good, headers = encode_reading(READING, CONTENT_TYPE_STRUCT)
+    records = {'tp': [
+        Record('plant-sensors', 0, 1, b'{not json', None),
+        Record('plant-sensors', 0, 2, b'\x00' * 40, headers),
+        Record('plant-sensors', 0, 3, good, headers),
+    ]}
+    decoded = decoder.decode_records(records)
+    assert [r.offset for r in decoded['tp']] == [3]
+    assert decoded['tp'][0].value == READING
+    assert decoder.metrics.counts == {
+        ('decode_errors_total', (('content_type', CONTENT_TYPE_JSON),)): 1,
+        ('decode_errors_total', (('content_type', CONTENT_TYPE_STRUCT),)): 1,
+    }
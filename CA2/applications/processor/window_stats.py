@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Window Statistics
+Per-plant streaming statistics over the last N readings of each sensor,
+kept in memory as readings flow through so trend questions (is moisture
+falling, how bright was the last hour) need no sensor_readings query.
+
+For every tracked metric of a plant:
+
+  ewma      exponentially weighted mean, time-aware (half-life in seconds)
+  per window of the last N readings:
+  mean      rolling mean
+  variance  rolling sample variance (stddev is its square root)
+  min, max  rolling extremes
+  rate      change per hour between the oldest and newest reading of the window
+
+Every update is O(1): the windows share one ring buffer of values and
+reading times, mean/variance are updated incrementally (recomputed from
+the ring once per window length to shed float drift), and min/max come
+from monotonic queues of sequence numbers.
+
+Memory is allocated up front and fixed per plant:
+
+  per metric  16 * max(windows) bytes of ring  +  32 * sum(windows) bytes of min/max queues
+              + about 700 bytes of objects
+  default     4 metrics, windows 10,120: about 27 KB per plant
+
+At most WINDOW_STATS_MAX_PLANTS plants are tracked (least recently updated
+evicted first), so the default bound is about 54 MB. window_stats_bytes
+reports the current total.
+
+  WINDOW_STATS_ENABLED                 true (default) | false
+  WINDOW_STATS_WINDOWS                 readings per window (default 10,120 - 5 min and 1 h at 30 s)
+  WINDOW_STATS_EWMA_HALFLIFE_SECONDS   default 600
+  WINDOW_STATS_METRICS                 default moisture,light,temperature,humidity
+  WINDOW_STATS_MAX_PLANTS              default 2000
+  WINDOW_STATS_EXPORT                  per-plant gauges (default false)
+  WINDOW_STATS_PUBLISH_SECONDS         gauge refresh interval (default 15)
+
+The gauges are refreshed from a background thread (start()/stop()), never
+on the reading path. window_stats_plants and window_stats_bytes are always
+exported; the per-plant gauges are one series per plant, metric, window and
+statistic (about 60 per plant, 120k at the default bound), so they are off
+unless WINDOW_STATS_EXPORT=true - /metrics/windows serves the same numbers
+on demand.
+
+Like the rollups, statistics count every reading analyzed, so a replayed
+batch is counted again.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+from sensor_storage import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# metric -> (reading section, field)
+SENSOR_FIELDS = {
+    'moisture': ('sensors', 'soilMoisture'),
+    'light': ('sensors', 'lightLevel'),
+    'temperature': ('sensors', 'temperature'),
+    'humidity': ('sensors', 'humidity'),
+    'battery': ('metadata', 'batteryLevel')
+}
+DEFAULT_METRICS = ('moisture', 'light', 'temperature', 'humidity')
+STATS = ('mean', 'variance', 'stddev', 'min', 'max', 'rate')
+
+# Approximate size of the Python objects of one metric (slots objects, arrays, list)
+_OBJECT_BYTES = 700
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def reading_time(reading):
+    """Reading timestamp in epoch seconds, or the arrival time if it has none"""
+    timestamp = parse_timestamp(reading.get('timestamp'))
+    return (timestamp - _EPOCH).total_seconds() if timestamp else time.time()
+
+
+class _Extreme:
+    """Sliding-window min (lower=True) or max: a monotonic queue of (sequence number, value) in fixed arrays"""
+
+    __slots__ = ('seqs', 'values', 'size', 'head', 'length', 'lower')
+
+    def __init__(self, size, lower):
+        self.seqs = array('q', bytes(8 * size))
+        self.values = array('d', bytes(8 * size))
+        self.size = size
+        self.head = 0
+        self.length = 0
+        self.lower = lower
+
+    def push(self, seq, value):
+        seqs = self.seqs
+        values = self.values
+        size = self.size
+        head = self.head
+        length = self.length
+        # Sequence numbers go up by one per push, so at most one leaves the window
+        if length and seqs[head] <= seq - size:
+            head = head + 1 if head + 1 < size else 0
+            length -= 1
+        # Drop the values the new one dominates
+        tail = head + length - 1
+        if tail >= size:
+            tail -= size
+        if self.lower:
+            while length and values[tail] >= value:
+                length -= 1
+                tail = tail - 1 if tail else size - 1
+        else:
+            while length and values[tail] <= value:
+                length -= 1
+                tail = tail - 1 if tail else size - 1
+        tail = head + length
+        if tail >= size:
+            tail -= size
+        seqs[tail] = seq
+        values[tail] = value
+        self.head = head
+        self.length = length + 1
+
+    def current(self):
+        return self.values[self.head] if self.length else None
+
+
+class _Window:
+    """Running mean/variance and extremes of the last `size` values"""
+
+    __slots__ = ('size', 'count', 'mean', 'm2', 'low', 'high')
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.low = _Extreme(size, True)
+        self.high = _Extreme(size, False)
+
+
+class MetricWindow:
+    """One metric of one plant: EWMA plus the windows over a shared ring buffer"""
+
+    __slots__ = ('capacity', 'values', 'times', 'seq', 'windows', 'ewma', 'last_time', 'halflife')
+
+    def __init__(self, windows, halflife):
+        self.capacity = max(windows)
+        self.values = array('d', bytes(8 * self.capacity))
+        self.times = array('d', bytes(8 * self.capacity))
+        # Readings added so far; the next one goes to values[seq % capacity]
+        self.seq = 0
+        self.windows = [_Window(size) for size in windows]
+        self.ewma = None
+        self.last_time = None
+        self.halflife = halflife
+
+    def add(self, value, timestamp):
+        seq = self.seq
+        capacity = self.capacity
+        values = self.values
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            # Readings arriving out of order are taken as simultaneous with the latest
+            if timestamp < self.last_time:
+                timestamp = self.last_time
+            elapsed = timestamp - self.last_time
+            alpha = 1.0 - 0.5 ** (elapsed / self.halflife) if self.halflife > 0 else 1.0
+            self.ewma += alpha * (value - self.ewma)
+
+        for window in self.windows:
+            if window.count == window.size:
+                # Full: replace the value leaving the window (read before the ring slot is reused)
+                old = values[(seq - window.size) % capacity]
+                mean = window.mean
+                window.mean = mean + (value - old) / window.size
+                window.m2 += (value - old) * (value - window.mean + old - mean)
+            else:
+                window.count += 1
+                delta = value - window.mean
+                window.mean += delta / window.count
+                window.m2 += delta * (value - window.mean)
+
+        values[seq % capacity] = value
+        self.times[seq % capacity] = timestamp
+        for window in self.windows:
+            window.low.push(seq, value)
+            window.high.push(seq, value)
+            if window.count == window.size and (seq + 1) % window.size == 0:
+                self._resync(window, seq)
+        self.seq = seq + 1
+        self.last_time = timestamp
+
+    def _resync(self, window, seq):
+        """Recompute mean and m2 from the ring - O(size), once every size readings"""
+        capacity = self.capacity
+        window_values = [self.values[(seq - i) % capacity] for i in range(window.size)]
+        mean = math.fsum(window_values) / window.size
+        window.mean = mean
+        window.m2 = math.fsum((value - mean) ** 2 for value in window_values)
+
+    def window(self, size=None):
+        """The window of `size` readings, or the longest"""
+        if size is None:
+            return self.windows[-1]
+        for window in self.windows:
+            if window.size == size:
+                return window
+        return None
+
+    def stat(self, name, size=None):
+        """One statistic (ewma or one of STATS) of a window; None until there is data for it"""
+        if name == 'ewma':
+            return self.ewma
+        window = self.window(size)
+        if window is None or not window.count:
+            return None
+        if name == 'mean':
+            return window.mean
+        if name in ('variance', 'stddev'):
+            variance = max(window.m2, 0.0) / (window.count - 1) if window.count > 1 else 0.0
+            return variance if name == 'variance' else math.sqrt(variance)
+        if name == 'min':
+            return window.low.current()
+        if name == 'max':
+            return window.high.current()
+        if name == 'rate':
+            if window.count < 2:
+                return None
+            newest = (self.seq - 1) % self.capacity
+            oldest = (self.seq - window.count) % self.capacity
+            elapsed = self.times[newest] - self.times[oldest]
+            if elapsed <= 0:
+                return None
+            return (self.values[newest] - self.values[oldest]) / elapsed * 3600
+        raise ValueError(f"Unknown window statistic {name!r}")
+
+    def summary(self):
+        return {
+            'readings': self.seq,
+            'ewma': self.ewma,
+            'windows': {
+                str(window.size): {name: self.stat(name, window.size) for name in STATS}
+                for window in self.windows
+            }
+        }
+
+
+class PlantStats:
+    """Window statistics of one plant, by metric"""
+
+    __slots__ = ('metrics',)
+
+    def __init__(self, tracked, windows, halflife):
+        self.metrics = {name: MetricWindow(windows, halflife) for name in tracked}
+
+    def add(self, reading, timestamp):
+        for name, window in self.metrics.items():
+            section, field = SENSOR_FIELDS[name]
+            value = (reading.get(section) or {}).get(field)
+            if value.__class__ is not float and (not isinstance(value, int) or isinstance(value, bool)):
+                continue
+            if value != value or value in (math.inf, -math.inf):
+                continue
+            window.add(value, timestamp)
+
+    def value(self, metric, stat='mean', window=None):
+        """A statistic of a metric (longest window by default); None if untracked or no data yet"""
+        tracked = self.metrics.get(metric)
+        return tracked.stat(stat, window) if tracked is not None else None
+
+    def summary(self):
+        return {name: window.summary() for name, window in self.metrics.items()}
+
+
+class WindowStats:
+    """PlantStats for the most recently updated plants, bounded by max_plants"""
+
+    def __init__(self, windows=(10, 120), halflife=600, tracked=DEFAULT_METRICS, max_plants=2000,
+                 metrics=None, export=False, publish_interval=15):
+        windows = tuple(sorted(set(int(size) for size in windows)))
+        if not windows or windows[0] < 1:
+            raise ValueError(f"Window sizes must be positive, got {windows}")
+        unknown = [name for name in tracked if name not in SENSOR_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown window statistics metrics {unknown}; expected {sorted(SENSOR_FIELDS)}")
+        if max_plants < 1:
+            raise ValueError(f"WINDOW_STATS_MAX_PLANTS must be positive, got {max_plants}")
+        self.windows = windows
+        self.halflife = halflife
+        self.tracked = tuple(tracked)
+        self.max_plants = max_plants
+        self.metrics = metrics
+        self.export = export
+        self.publish_interval = publish_interval
+        self._lock = threading.Lock()
+        # plant ID -> PlantStats, least recently updated first
+        self._plants = OrderedDict()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, metrics=None):
+        """None when WINDOW_STATS_ENABLED=false"""
+        if os.getenv('WINDOW_STATS_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            windows=[int(size) for size in os.getenv('WINDOW_STATS_WINDOWS', '10,120').split(',') if size.strip()],
+            halflife=float(os.getenv('WINDOW_STATS_EWMA_HALFLIFE_SECONDS', '600')),
+            tracked=[name.strip() for name in
+                     os.getenv('WINDOW_STATS_METRICS', ','.join(DEFAULT_METRICS)).split(',') if name.strip()],
+            max_plants=int(os.getenv('WINDOW_STATS_MAX_PLANTS', '2000')),
+            metrics=metrics,
+            export=os.getenv('WINDOW_STATS_EXPORT', 'false').lower() == 'true',
+            publish_interval=float(os.getenv('WINDOW_STATS_PUBLISH_SECONDS', '15'))
+        )
+
+    def bytes_per_plant(self):
+        """Memory of one plant's statistics (see the module docstring)"""
+        return len(self.tracked) * (16 * max(self.windows) + 32 * sum(self.windows) + _OBJECT_BYTES)
+
+    def update(self, plant_id, reading):
+        """Fold a reading into its plant's statistics; returns the PlantStats (None without a plant ID)"""
+        if not isinstance(plant_id, str):
+            return None
+        timestamp = reading_time(reading)
+        evicted = None
+        with self._lock:
+            plant = self._plants.get(plant_id)
+            if plant is None:
+                plant = self._plants[plant_id] = PlantStats(self.tracked, self.windows, self.halflife)
+                if len(self._plants) > self.max_plants:
+                    evicted, _ = self._plants.popitem(last=False)
+            else:
+                self._plants.move_to_end(plant_id)
+            plant.add(reading, timestamp)
+        if evicted is not None and self.metrics:
+            self.metrics.inc('window_stats_evictions_total')
+            if self.export:
+                self._remove_gauges(evicted)
+        return plant
+
+    def get(self, plant_id):
+        """A plant's statistics, or None if it is not tracked"""
+        return self._plants.get(plant_id)
+
+    def summary(self, plant_id=None):
+        """JSON-friendly statistics of one plant (None if untracked) or of every tracked plant"""
+        with self._lock:
+            if plant_id is not None:
+                plant = self._plants.get(plant_id)
+                return plant.summary() if plant is not None else None
+            return {key: plant.summary() for key, plant in self._plants.items()}
+
+    def start(self):
+        """Refresh the gauges every publish_interval from a background thread"""
+        if self.metrics is None or self.publish_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._publish_loop, name='window-stats', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _publish_loop(self):
+        while not self._stopping.wait(self.publish_interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Window statistics gauges not published: {e}")
+
+    def publish(self):
+        """Set the store gauges and, with export, one gauge per plant, metric, window and statistic"""
+        with self._lock:
+            plant_ids = list(self._plants) if self.export else []
+        self.metrics.set_gauge('window_stats_plants', len(self._plants))
+        self.metrics.set_gauge('window_stats_bytes', len(self._plants) * self.bytes_per_plant())
+        for plant_id in plant_ids:
+            # One plant at a time, so readings are not held up for the whole export
+            summary = self.summary(plant_id)
+            if summary is None:
+                continue
+            for metric, values in summary.items():
+                self._set_gauge('plant_sensor_ewma', values['ewma'], plant=plant_id, metric=metric)
+                for size, stats in values['windows'].items():
+                    for name, value in stats.items():
+                        self._set_gauge('plant_sensor_window', value,
+                                        plant=plant_id, metric=metric, window=size, stat=name)
+
+    def _set_gauge(self, name, value, **labels):
+        if value is None:
+            self.metrics.remove_gauge(name, **labels)
+        else:
+            self.metrics.set_gauge(name, value, **labels)
+
+    def _remove_gauges(self, plant_id):
+        for metric in self.tracked:
+            self.metrics.remove_gauge('plant_sensor_ewma', plant=plant_id, metric=metric)
+            for size in self.windows:
+                for name in STATS:
+                    self.metrics.remove_gauge('plant_sensor_window',
+                                              plant=plant_id, metric=metric, window=str(size), stat=name)
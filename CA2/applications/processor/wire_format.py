@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Sensor Wire Formats
+Readings on plant-sensors can be sent in a compact binary encoding instead of
+the verbose sensor.js JSON. The producer names the format in a Kafka
+'content-type' header; records without the header are treated as JSON, so
+existing sensors keep working unchanged.
+
+  application/json                  sensor.js JSON (default)
+  application/msgpack               the same document, MessagePack encoded
+  application/vnd.plant-reading.v1  fixed struct layout, see below
+
+Struct layout (little endian):
+  B magic 0x50, B version 1, q timestamp (epoch ms),
+  f soilMoisture, f lightLevel, f temperature, f humidity (float32, NaN = absent),
+  B batteryLevel (0-254 whole percent, 255 = absent),
+  then plantId, plantType, location as B length + UTF-8 bytes.
+Readings are stored as float32 (about 7 significant digits) and rounded on
+decode to 2 decimals (light 1), which is well beyond the sensor precision,
+so 45.2 decodes as 45.2 rather than 45.20000076293945. A reading whose
+battery level does not fit the byte is sent as JSON instead.
+"""
+
+import json
+import logging
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+
+from codec import SensorReading
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_HEADER = 'content-type'
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_MSGPACK = 'application/msgpack'
+CONTENT_TYPE_STRUCT = 'application/vnd.plant-reading.v1'
+
+_MAGIC = 0x50
+_VERSION = 1
+_FIXED = struct.Struct('<BBqffffB')
+_NO_BATTERY = 255
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAN = float('nan')
+
+
+def _timestamp_to_ms(timestamp):
+    if not timestamp:
+        return 0
+    parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int((parsed - _EPOCH) / timedelta(milliseconds=1))
+
+
+_last_second = (None, None)
+
+
+def _ms_to_timestamp(ms):
+    """Same ISO format as sensor.js (Date.toISOString)"""
+    if not ms:
+        return None
+    seconds, millis = divmod(ms, 1000)
+    # Consecutive readings mostly share the second, so reuse its formatted prefix
+    global _last_second
+    cached_second, prefix = _last_second
+    if seconds != cached_second:
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        _last_second = (seconds, prefix)
+    return f"{prefix}.{millis:03d}Z"
+
+
+def _float_or_nan(value):
+    return _NAN if value is None else value
+
+
+def _battery_byte(level):
+    """Battery level as its struct byte; ValueError if it does not fit"""
+    if level is None:
+        return _NO_BATTERY
+    if isinstance(level, bool) or not isinstance(level, (int, float)) \
+            or not 0 <= level < _NO_BATTERY or level != int(level):
+        raise ValueError(f'Battery level {level!r} is not a whole percent in 0-{_NO_BATTERY - 1}')
+    return int(level)
+
+
+def _pack_str(value):
+    data = (value or '').encode('utf-8')[:255]
+    return bytes((len(data),)) + data
+
+
+def encode_struct(reading):
+    """Encode a SensorReading in the fixed struct layout; ValueError if it does not fit"""
+    battery = _battery_byte(reading.battery_level)
+    return b''.join((
+        _FIXED.pack(
+            _MAGIC, _VERSION,
+            _timestamp_to_ms(reading.timestamp),
+            _float_or_nan(reading.soil_moisture),
+            _float_or_nan(reading.light_level),
+            _float_or_nan(reading.temperature),
+            _float_or_nan(reading.humidity),
+            battery
+        ),
+        _pack_str(reading.plant_id),
+        _pack_str(reading.plant_type),
+        _pack_str(reading.location)
+    ))
+
+
+def decode_struct(raw):
+    """Decode the fixed struct layout into a SensorReading"""
+    magic, version, ms, moisture, light, temperature, humidity, battery = _FIXED.unpack_from(raw)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f'Not a plant-reading v{_VERSION} payload (magic={magic:#x}, version={version})')
+    raw = bytes(raw)
+    start = _FIXED.size + 1
+    end = start + raw[start - 1]
+    plant_id = raw[start:end].decode('utf-8') or None
+    start = end + 1
+    end = start + raw[start - 1]
+    plant_type = raw[start:end].decode('utf-8') or None
+    start = end + 1
+    location = raw[start:start + raw[start - 1]].decode('utf-8') or None
+    # NaN is the only value not equal to itself; rounding drops the float32 noise
+    return SensorReading(
+        plant_id,
+        _ms_to_timestamp(ms),
+        plant_type,
+        location,
+        round(moisture, 2) if moisture == moisture else None,
+        round(light, 1) if light == light else None,
+        round(temperature, 2) if temperature == temperature else None,
+        round(humidity, 2) if humidity == humidity else None,
+        None if battery == _NO_BATTERY else battery
+    )
+
+
+def content_type_of(headers):
+    for key, value in headers or ():
+        if key.lower() == CONTENT_TYPE_HEADER:
+            return value.decode('utf-8') if isinstance(value, bytes) else value
+    return CONTENT_TYPE_JSON
+
+
+def encode_reading(doc, content_type=CONTENT_TYPE_JSON, codec=None):
+    """
+    Encode a sensor.js-shaped document for producing to plant-sensors.
+    Returns (value, headers) ready for KafkaProducer.send().
+    """
+    if content_type == CONTENT_TYPE_STRUCT:
+        try:
+            value = encode_struct(SensorReading.from_document(doc))
+        except (ValueError, OverflowError, struct.error) as e:
+            # The JSON header keeps the record decodable - only its size is lost
+            logger.debug(f'Sending reading of {doc.get("plantId")} as JSON: {e}')
+            return encode_reading(doc, CONTENT_TYPE_JSON, codec)
+    elif content_type == CONTENT_TYPE_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError('msgpack is not installed')
+        value = msgpack.packb(doc, use_bin_type=True)
+    elif content_type == CONTENT_TYPE_JSON:
+        value = codec.encode(doc) if codec else json.dumps(doc).encode('utf-8')
+    else:
+        raise ValueError(f'Unsupported content type: {content_type}')
+    return value, [(CONTENT_TYPE_HEADER, content_type.encode('utf-8'))]
+
+
+class WireDecoder:
+    """Decode raw Kafka records according to their content-type header"""
+
+    def __init__(self, codec, metrics=None, dead_letter=None):
+        self.codec = codec
+        self.metrics = metrics
+        # Optional DeadLetterPublisher for records that cannot be decoded
+        self.dead_letter = dead_letter
+
+    def decode(self, value, headers=None):
+        """Decode a payload into the sensor.js document (dict)"""
+        content_type = content_type_of(headers)
+        if content_type == CONTENT_TYPE_JSON:
+            return self.codec.decode(value)
+        if content_type == CONTENT_TYPE_STRUCT:
+            return decode_struct(value).to_document()
+        if content_type == CONTENT_TYPE_MSGPACK:
+            if msgpack is None:
+                raise RuntimeError('msgpack is not installed')
+            return msgpack.unpackb(value, raw=False)
+        raise ValueError(f'Unsupported content type: {content_type}')
+
+    def decode_reading(self, value, headers=None):
+        """Decode a payload straight into a SensorReading"""
+        content_type = content_type_of(headers)
+        if content_type == CONTENT_TYPE_STRUCT:
+            return decode_struct(value)
+        if content_type == CONTENT_TYPE_JSON:
+            return self.codec.decode_reading(value)
+        return SensorReading.from_document(self.decode(value, headers))
+
+    def decode_record(self, record):
+        """Copy of a ConsumerRecord with its value decoded, or None if it cannot be decoded"""
+        try:
+            return record._replace(value=self.decode(record.value, record.headers))
+        except Exception as e:
+            if self.metrics:
+                self.metrics.inc('decode_errors_total', content_type=content_type_of(record.headers))
+            logger.error(f"Undecodable record at {record.topic}[{record.partition}]@{record.offset}: {e}")
+            if self.dead_letter:
+                self.dead_letter.publish(record, e, 'decode')
+            return None
+
+    def decode_records(self, records):
+        """Decode a poll() result, dropping records that cannot be decoded"""
+        decoded = {}
+        for tp, messages in records.items():
+            values = [r for r in map(self.decode_record, messages) if r is not None]
+            if values:
+                decoded[tp] = values
+        return decoded
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Keyed Worker Pool
+Fixed set of worker threads with one bounded queue each. Records that share
+a routing key (plant ID or Kafka partition) always land on the same worker,
+so per-key ordering is preserved while I/O for different keys overlaps.
+"""
+
+import logging
+import queue
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class KeyedWorkerPool:
+    """Route items to worker threads by a stable hash of their key"""
+
+    def __init__(self, handler, workers, queue_size=1000, metrics=None, name='worker'):
+        self.handler = handler
+        self.metrics = metrics
+        self.name = name
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = []
+        for lane in range(workers):
+            thread = threading.Thread(target=self._run, args=(lane,), name=f'{name}-{lane}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+            self._report_depth(lane)
+        logger.info(f"Started {workers} {name} threads (queue size {queue_size})")
+
+    def __len__(self):
+        return len(self.queues)
+
+    def lane_for(self, key):
+        """Stable lane index for a key (crc32, not the per-process salted hash())"""
+        if isinstance(key, int):
+            return key % len(self.queues)
+        return zlib.crc32(str(key).encode('utf-8')) % len(self.queues)
+
+    def submit(self, key, item):
+        """Queue an item on its key's worker, blocking while that worker's queue is full"""
+        lane = self.lane_for(key)
+        self.queues[lane].put(item)
+        self._report_depth(lane)
+        return lane
+
+    def depths(self):
+        return [q.qsize() for q in self.queues]
+
+    def join(self):
+        """Block until every queued item has been handled"""
+        for q in self.queues:
+            q.join()
+
+    def stop(self, timeout=10):
+        """Drain the queues and stop the worker threads"""
+        for q in self.queues:
+            q.put(_STOP)
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _report_depth(self, lane):
+        if self.metrics:
+            self.metrics.set_gauge(f'{self.name}_queue_depth', self.queues[lane].qsize(), worker=lane)
+
+    def _run(self, lane):
+        q = self.queues[lane]
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(item)
+            except Exception as e:
+                logger.error(f"Unhandled error in {self.name} {lane}: {e}")
+            finally:
+                q.task_done()
+                self._report_depth(lane)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Write Coalescer
+Gathers the documents a batch of readings produces (sensor readings, health
+analyses, alerts, rollup upserts) and writes each collection with a single
+unordered bulk_write, instead of one write per document.
+
+A document MongoDB rejects (validation, duplicate key, ...) is reported on
+its own through on_error, tagged with whatever the caller queued it with;
+the rest of the batch is still written. Collections are written in the
+order they were first queued, and documents whose tag already failed in an
+earlier collection are dropped, so a health analysis is never stored for a
+reading that was rejected.
+"""
+
+import logging
+
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, WriteError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCoalescer:
+    """Per-collection write queues flushed with one bulk_write each"""
+
+    def __init__(self, db, metrics=None):
+        self.db = db
+        self.metrics = metrics
+        # collection name -> ([write operation], [tag]), in first-queued order
+        self._pending = {}
+
+    def add(self, collection, operation, tag=None):
+        """Queue any bulk_write operation (InsertOne, UpdateOne, ...)"""
+        ops, tags = self._pending.setdefault(collection, ([], []))
+        ops.append(operation)
+        tags.append(tag)
+
+    def insert(self, collection, document, tag=None):
+        self.add(collection, InsertOne(document), tag)
+
+    def insert_many(self, collection, documents, tag=None):
+        for document in documents:
+            self.insert(collection, document, tag)
+
+    def __len__(self):
+        return sum(len(ops) for ops, _ in self._pending.values())
+
+    def flush(self, on_error=None):
+        """
+        Write everything queued. Returns the set of tags with a rejected
+        document; on_error(tag, WriteError) is called for each rejection.
+        Errors other than per-document rejections (connection loss, write
+        concern) are raised - the batch as a whole was not stored.
+        """
+        pending, self._pending = self._pending, {}
+        failed = set()
+        for collection, (ops, tags) in pending.items():
+            if failed:
+                kept = [i for i, tag in enumerate(tags) if tag is None or tag not in failed]
+                if len(kept) < len(ops):
+                    ops = [ops[i] for i in kept]
+                    tags = [tags[i] for i in kept]
+            if not ops:
+                continue
+            try:
+                result = self.db[collection].bulk_write(ops, ordered=False)
+                written = result.inserted_count + result.upserted_count + result.modified_count
+            except BulkWriteError as e:
+                details = e.details
+                if details.get('writeConcernErrors'):
+                    raise
+                written = details.get('nInserted', 0) + details.get('nUpserted', 0) + details.get('nModified', 0)
+                for error in details.get('writeErrors', []):
+                    tag = tags[error['index']]
+                    failure = WriteError(error.get('errmsg'), error.get('code'), error)
+                    if tag is not None:
+                        failed.add(tag)
+                    if self.metrics:
+                        self.metrics.inc('mongo_write_errors_total', collection=collection,
+                                         code=str(error.get('code')))
+                    if on_error:
+                        on_error(tag, failure)
+                    else:
+                        logger.error(f"Rejected {collection} document: {failure}")
+            finally:
+                if self.metrics:
+                    self.metrics.inc('mongo_bulk_writes_total', collection=collection)
+            if self.metrics:
+                self.metrics.inc('mongo_documents_written_total', written, collection=collection)
+        return failed
@@ -26,8 +26,9 @@ get_metrics() {
     local manager_ip=$(docker node inspect self --format '{{.Status.Addr}}')
     local prom_url="http://${manager_ip}:9090"
     
-    # Kafka consumer lag
-    local lag=$(curl -s "${prom_url}/api/v1/query?query=kafka_consumergroup_lag" | \
+    # Kafka consumer lag (reported by the processors, kafka-exporter as fallback)
+    local lag=$(curl -s -G "${prom_url}/api/v1/query" \
+        --data-urlencode 'query=sum(plant_processor_consumer_lag_total{job="plant-processor-python"}) or sum(kafka_consumergroup_lag)' | \
         jq -r '.data.result[0].value[1] // "0"')
     
     # Processing throughput (messages/sec)